@@ -1,7 +1,8 @@
 from fastapi import APIRouter
 
-from api.routes import indexer
+from api.routes import indexer, webhooks
 # from api.routes import predictor
 
 router = APIRouter()
 router.include_router(indexer.router, tags=["indexer"], prefix="/v1")
+router.include_router(webhooks.router, tags=["webhooks"], prefix="/v1")
@@ -1,16 +1,36 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from dependencies import get_db, get_cryptography_key
+from datetime import datetime
+from typing import Any, Literal
 
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse
+from database import Database, Index, Repos
+from dependencies import get_db, get_cryptography_key, get_database, get_job_manager, get_page_params
+from dependencies import get_stream_mode
 
-from models.indexer import IndexerResponseModel, RepositoryModel
-from models.indexer import CreateNewRepoModel, RepoCredentialsModel, NewRepoCredentialsModel
+from core.paginator import PageModel, PageParams, set_page_headers
+from core.read_cache import cached_response
+from core.responses import NDJSONResponse, ORJSONResponse
 
-from services.indexer import create_new_repo, list_repositories, update_repo
-from services.indexer import create_new_credentials, get_all_credentials
-from services.indexer import get_index_values, rescan_index_values
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import Repos
+from models.indexer import IndexerResponseModel, RepositoryModel
+from models.indexer import CreateNewRepoModel, RepoCredentialsModel, NewRepoCredentialsModel
+from models.indexer import RescanJobModel, RescanJobSubmittedModel
+from models.indexer import CacheStatsModel, IndexEntryModel, RepoFilterModel, CredentialsFilterModel, IndexFilterModel
+from models.indexer import IndexServiceModel, IndexPortModel, IndexVolumeModel, IndexNetworkModel
+from models.indexer import IndexSearchResultModel, BulkRepoResponseModel, BulkDeleteResponseModel
+
+from services.indexer import create_new_repo, list_repositories, stream_repositories, update_repo
+from services.indexer import get_repo_orm_by_id, count_repositories, remove_repo
+from services.indexer import create_new_credentials, get_all_credentials, stream_credentials
+from services.indexer import get_index_values, get_index_compose, stream_index_values
+from services.bulk import delete_repositories, import_repositories, parse_rows, update_repositories
+from services.compose_index import find_services, find_ports, find_volumes, find_networks
+from services.jobs import RescanJobManager
+from services.search import search_index
+
+from utilities.github_utils import get_response_cache
+from utilities.rate_limit import RateLimitBucketModel, rate_limiter
 
 router = APIRouter()
 
@@ -19,7 +39,7 @@ router = APIRouter()
     "/repos",
     name="indexer:add-repo",
 )
-async def add_repo(new_repo: CreateNewRepoModel, db: Session = Depends(get_db)) -> IndexerResponseModel:
+async def add_repo(new_repo: CreateNewRepoModel, db: AsyncSession = Depends(get_db)) -> IndexerResponseModel:
     """
     Add a new repository to be indexed.
     """
@@ -32,16 +52,71 @@ async def add_repo(new_repo: CreateNewRepoModel, db: Session = Depends(get_db))
     return IndexerResponseModel(status=status.HTTP_200_OK, message="RepositoryModel added successfully")
 
 
+@router.post(
+    "/repos/bulk",
+    name="indexer:add-repos",
+)
+async def add_repos(request: Request, response: Response, atomic: bool = False,
+                    db: AsyncSession = Depends(get_db)) -> BulkRepoResponseModel:
+    """
+    Add many repositories in one transaction, from a JSON array, NDJSON or CSV (header line first)
+    of the fields of POST /repos, sent with the matching Content-Type.
+
+    Every row gets a result at its position: created with its id, conflict when its name, url and branch
+    are taken, or invalid. With atomic, nothing is added unless every row is, and the answer is 409.
+    """
+    result: BulkRepoResponseModel = await import_repositories(
+        parse_rows(await request.body(), request.headers.get("content-type", "")), db, atomic)
+    response.status_code = result.status
+    return result
+
+
+@router.put(
+    "/repos/bulk",
+    name="indexer:edit-repos",
+)
+async def edit_repos(request: Request, response: Response, atomic: bool = False,
+                     db: AsyncSession = Depends(get_db)) -> BulkRepoResponseModel:
+    """
+    Edit many repositories in one transaction, rows like POST /repos/bulk with the id of the repository.
+
+    Rows report updated, not_found, conflict or invalid, atomic works as for POST /repos/bulk.
+    """
+    result: BulkRepoResponseModel = await update_repositories(
+        parse_rows(await request.body(), request.headers.get("content-type", "")), db, atomic)
+    response.status_code = result.status
+    return result
+
+
+@router.delete(
+    "/repos",
+    name="indexer:delete-repos",
+)
+async def delete_repos(ids: list[str] | None = Query(None, alias="id"), name: str | None = None, url: str | None = None,
+                       branch: str | None = None, credentials_name: str | None = None,
+                       updated_since: datetime | None = None,
+                       db: AsyncSession = Depends(get_db)) -> BulkDeleteResponseModel:
+    """
+    Delete the repositories with the given ids (id repeated) and/or matching the filters of GET /repos,
+    in one transaction. At least one id or filter is required.
+    """
+    filters = RepoFilterModel(name=name, url=url, branch=branch,
+                              credentials_name=credentials_name, updated_since=updated_since)
+    deleted = await delete_repositories(db, ids, filters)
+    return BulkDeleteResponseModel(status=status.HTTP_200_OK, message=f"{deleted} repositories deleted",
+                                   deleted=deleted)
+
+
 @router.put(
     "/repos/{repo_id}",
     name="indexer:edit-repo",
 )
-async def edit_repo(repo_id: str, repo: CreateNewRepoModel, db: Session = Depends(get_db)) -> IndexerResponseModel:
+async def edit_repo(repo_id: str, repo: CreateNewRepoModel, db: AsyncSession = Depends(get_db)) -> IndexerResponseModel:
     """
     Edit an existing repository to be indexed.
 
     """
-    existing_repo = db.query(Repos).filter(Repos.id == repo_id).first()
+    existing_repo = await get_repo_orm_by_id(repo_id, db)
     if not existing_repo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="RepositoryModel not found")
@@ -63,19 +138,18 @@ async def edit_repo(repo_id: str, repo: CreateNewRepoModel, db: Session = Depend
     "/repos/{repo_id}",
     name="indexer:delete-repo",
 )
-async def delete_repo(repo_id: str, db: Session = Depends(get_db)) -> IndexerResponseModel:
+async def delete_repo(repo_id: str, db: AsyncSession = Depends(get_db)) -> IndexerResponseModel:
     """
     Delete a repository from the index.
     """
     # fetch ORM instance directly for deletion
-    existing_repo = db.query(Repos).filter(Repos.id == repo_id).first()
+    existing_repo = await get_repo_orm_by_id(repo_id, db)
     if not existing_repo:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="RepositoryModel not found")
 
     try:
-        db.delete(existing_repo)
-        db.commit()
+        await remove_repo(existing_repo, db)
     except HTTPException as exc:
         raise HTTPException(status_code=exc.status_code, detail=exc.detail)
 
@@ -85,20 +159,46 @@ async def delete_repo(repo_id: str, db: Session = Depends(get_db)) -> IndexerRes
 @router.get(
     "/repos",
     name="indexer:list-repos",
+    response_model=list[RepositoryModel],
 )
-async def list_repos(db: Session = Depends(get_db)) -> list[RepositoryModel]:
+async def list_repos(request: Request, name: str | None = None, url: str | None = None, branch: str | None = None,
+                     credentials_name: str | None = None, updated_since: datetime | None = None,
+                     sort: Literal["name", "url", "updated_at", "id"] = "name",
+                     page: PageParams = Depends(get_page_params), stream: bool = Depends(get_stream_mode),
+                     database: Database = Depends(get_database),
+                     db: AsyncSession = Depends(get_db)) -> Response:
     """
-    List all indexed repositories.
+    List indexed repositories, filtered and sorted in the database.
+
+    With limit, the cursor of the next page is returned in the X-Next-Cursor header,
+    and count=true adds the number of matching rows in X-Total-Count.
+    With stream=true or Accept: application/x-ndjson the rows are streamed as NDJSON while they are read,
+    without X-Next-Cursor and X-Total-Count.
+    Other reads carry an ETag, answered with 304 when sent back in If-None-Match while no repository
+    changed, and are served from the read cache until then.
     """
-    repos: list[RepositoryModel] = await list_repositories(db)
-    return repos
+    filters = RepoFilterModel(name=name, url=url, branch=branch,
+                              credentials_name=credentials_name, updated_since=updated_since)
+    if stream:
+        streamed: Response = NDJSONResponse(stream_repositories(database, filters, sort, page))
+        return streamed
+
+    async def render() -> Response:
+        repos: PageModel[dict[str, Any]] = await list_repositories(db, filters, sort, page)
+        # rows are rendered straight to JSON, response_model only documents the shape
+        response: Response = ORJSONResponse(repos.items)
+        set_page_headers(response, repos)
+        return response
+
+    cached: Response = await cached_response(request, (Repos.__tablename__,), render, db)
+    return cached
 
 
 @router.post(
     "/credentials",
     name="indexer:add-credentials",
 )
-async def add_credentials(credentials: NewRepoCredentialsModel, db: Session = Depends(get_db), auth_key: bytes = Depends(get_cryptography_key)) -> IndexerResponseModel:
+async def add_credentials(credentials: NewRepoCredentialsModel, db: AsyncSession = Depends(get_db), auth_key: bytes = Depends(get_cryptography_key)) -> IndexerResponseModel:
     """
     Add new credentials for accessing private repositories.
     """
@@ -125,50 +225,232 @@ async def add_credentials(credentials: NewRepoCredentialsModel, db: Session = De
 @router.get(
     "/credentials",
     name="indexer:get-credentials",
+    response_model=list[RepoCredentialsModel],
 )
-async def get_credentials(db: Session = Depends(get_db)) -> list[RepoCredentialsModel]:
+async def get_credentials(response: Response, name: str | None = None, sort: Literal["name", "id"] = "name",
+                          page: PageParams = Depends(get_page_params), stream: bool = Depends(get_stream_mode),
+                          database: Database = Depends(get_database),
+                          db: AsyncSession = Depends(get_db)) -> list[RepoCredentialsModel] | Response:
     """
-    List all stored credentials.
+    List stored credentials, paginated and streamed like /repos.
     """
-    creds: list[RepoCredentialsModel] = await get_all_credentials(db)
-    return creds
+    if stream:
+        streamed: Response = NDJSONResponse(stream_credentials(database, CredentialsFilterModel(name=name), sort, page))
+        return streamed
+    creds: PageModel[RepoCredentialsModel] = await get_all_credentials(db, CredentialsFilterModel(name=name), sort, page)
+    set_page_headers(response, creds)
+    return list(creds.items)
 
 
 @router.get(
     "/index",
     name="indexer:get-index",
+    response_model=list[IndexEntryModel],
 )
-async def get_index(db: Session = Depends(get_db)) -> list[dict[str, str | None]]:
+async def get_index(request: Request, repo_id: str | None = None, updated_since: datetime | None = None,
+                    sort: Literal["updated_at", "repo_id", "id"] = "updated_at",
+                    page: PageParams = Depends(get_page_params), stream: bool = Depends(get_stream_mode),
+                    database: Database = Depends(get_database),
+                    db: AsyncSession = Depends(get_db)) -> Response:
     """
-    Get indexing information for a specific repository.
+    Get indexing information, optionally for a specific repository, paginated, streamed and cached like /repos.
     """
-    try:
-        values: list[dict[str, str | None]] = await get_index_values(db)
-    except HTTPException as exc:
-        raise exc
+    filters = IndexFilterModel(repo_id=repo_id, updated_since=updated_since)
+    if stream:
+        streamed: Response = NDJSONResponse(stream_index_values(database, filters, sort, page))
+        return streamed
+
+    async def render() -> Response:
+        try:
+            values: PageModel[dict[str, Any]] = await get_index_values(db, filters, sort, page)
+        except HTTPException as exc:
+            raise exc
+
+        response: Response = ORJSONResponse(values.items)
+        set_page_headers(response, values)
+        return response
+
+    cached: Response = await cached_response(request, (Index.__tablename__,), render, db)
+    return cached
+
+
+@router.get(
+    "/index/{index_id}/compose",
+    name="indexer:get-index-compose",
+    response_class=PlainTextResponse,
+)
+async def get_index_compose_file(index_id: str, db: AsyncSession = Depends(get_db)) -> str:
+    """
+    Compose file content of an index entry.
+    """
+    content: str | None = await get_index_compose(index_id, db)
+    if content is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Index entry not found")
+    return content
+
+
+@router.get(
+    "/index/search",
+    name="indexer:search-index",
+    response_model=list[IndexSearchResultModel],
+)
+async def search_index_content(q: str = Query(..., min_length=1, max_length=256),
+                               page: PageParams = Depends(get_page_params),
+                               db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    Full-text search over indexed compose files, best match first with a snippet around the matched words.
+    Every word has to match, a trailing * matches a prefix. Pages continue with X-Next-Cursor like /repos.
+    """
+    results: PageModel[dict[str, Any]] = await search_index(q, page, db)
+    response: Response = ORJSONResponse(results.items)
+    set_page_headers(response, results)
+    return response
+
+
+@router.get(
+    "/index/services",
+    name="indexer:get-index-services",
+    response_model=list[IndexServiceModel],
+)
+async def get_index_services(image: str | None = None, tag: str | None = None, service: str | None = None,
+                             page: PageParams = Depends(get_page_params),
+                             db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    Services of the indexed compose files, filtered by image name (without tag), tag or service name.
+    Sorted by repository name and paginated like /repos, 100 rows without limit.
+    """
+    rows: PageModel[dict[str, Any]] = await find_services(db, image, tag, service, page)
+    response: Response = ORJSONResponse(rows.items)
+    set_page_headers(response, rows)
+    return response
 
-    return values
+
+@router.get(
+    "/index/ports",
+    name="indexer:get-index-ports",
+    response_model=list[IndexPortModel],
+)
+async def get_index_ports(published: int | None = None, protocol: str | None = None,
+                          page: PageParams = Depends(get_page_params),
+                          db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    Ports of the indexed compose files, e.g. every stack publishing port 443, paginated like /index/services.
+    """
+    rows: PageModel[dict[str, Any]] = await find_ports(db, published, protocol, page)
+    response: Response = ORJSONResponse(rows.items)
+    set_page_headers(response, rows)
+    return response
+
+
+@router.get(
+    "/index/volumes",
+    name="indexer:get-index-volumes",
+    response_model=list[IndexVolumeModel],
+)
+async def get_index_volumes(source: str | None = None, page: PageParams = Depends(get_page_params),
+                            db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    Volumes and bind mounts of the indexed compose files, filtered by named volume or host path,
+    paginated like /index/services.
+    """
+    rows: PageModel[dict[str, Any]] = await find_volumes(db, source, page)
+    response: Response = ORJSONResponse(rows.items)
+    set_page_headers(response, rows)
+    return response
+
+
+@router.get(
+    "/index/networks",
+    name="indexer:get-index-networks",
+    response_model=list[IndexNetworkModel],
+)
+async def get_index_networks(network: str | None = None, page: PageParams = Depends(get_page_params),
+                             db: AsyncSession = Depends(get_db)) -> Response:
+    """
+    Networks of the indexed compose files, both top-level and per service, paginated like /index/services.
+    """
+    rows: PageModel[dict[str, Any]] = await find_networks(db, network, page)
+    response: Response = ORJSONResponse(rows.items)
+    set_page_headers(response, rows)
+    return response
 
 
 @router.post(
     "/index",
     name="indexer:update-index",
+    status_code=status.HTTP_202_ACCEPTED,
 )
-async def update_index(force: bool = False, db: Session = Depends(get_db), auth_key: bytes = Depends(get_cryptography_key)) -> IndexerResponseModel:
+async def update_index(force: bool = False, db: AsyncSession = Depends(get_db),
+                       jobs: RescanJobManager = Depends(get_job_manager)) -> RescanJobSubmittedModel:
     """
-    Trigger re-indexing of all repositories. the force parameter is not used at the moment.
+    Queue a re-indexing of all repositories as a background job and return its id.
+    With force, repositories that already have an index entry are fetched again.
     """
-    if db.query(Repos).count() == 0:
+    if await count_repositories(db) == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                             detail="No repositories found to index.")
-    if force:
+
+    job, created = jobs.submit(force)
+    if not created:
+        message = "Re-indexing already queued."
+    elif force:
         message = "Re-indexing triggered with force."
     else:
         message = "Re-indexing triggered."
 
-    try:
-        await rescan_index_values(force, db, auth_key)
-    except HTTPException as exc:
-        raise exc
+    return RescanJobSubmittedModel(status=status.HTTP_202_ACCEPTED, message=message, job_id=job.id)
+
 
-    return IndexerResponseModel(status=status.HTTP_200_OK, message=message)
+@router.get(
+    "/index/jobs",
+    name="indexer:list-index-jobs",
+)
+async def list_index_jobs(jobs: RescanJobManager = Depends(get_job_manager)) -> list[RescanJobModel]:
+    """
+    List recent re-indexing jobs, newest first.
+    """
+    history: list[RescanJobModel] = jobs.list()
+    return history
+
+
+@router.get(
+    "/index/jobs/{job_id}",
+    name="indexer:get-index-job",
+)
+async def get_index_job(job_id: str, jobs: RescanJobManager = Depends(get_job_manager)) -> RescanJobModel:
+    """
+    Status and progress (done, failed and skipped repositories) of a re-indexing job.
+    """
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Job not found")
+    return job
+
+
+@router.get(
+    "/github/cache",
+    name="indexer:get-github-cache",
+)
+async def get_github_cache() -> CacheStatsModel:
+    """
+    Hit and miss counts of the conditional request cache used for GitHub content fetches.
+    """
+    cache = get_response_cache()
+    if not cache:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="GitHub response cache is disabled")
+    return cache.stats()
+
+
+@router.get(
+    "/github/rate-limits",
+    name="indexer:get-github-rate-limits",
+)
+async def get_github_rate_limits() -> list[RateLimitBucketModel]:
+    """
+    Quota left per credential id (and "anonymous") as last reported by GitHub.
+    """
+    buckets: list[RateLimitBucketModel] = rate_limiter.stats()
+    return buckets
@@ -0,0 +1,67 @@
+import json
+
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from dependencies import get_db, get_job_manager
+
+from core.config import WEBHOOK_SECRET
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.indexer import WebhookResponseModel
+
+from services.jobs import RescanJobManager
+from services.webhooks import find_pushed_repos, parse_push_event, verify_signature
+
+router = APIRouter()
+
+
+@router.post(
+    "/webhooks/push",
+    name="webhooks:push",
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def receive_push(request: Request, response: Response, db: AsyncSession = Depends(get_db),
+                       jobs: RescanJobManager = Depends(get_job_manager)) -> WebhookResponseModel:
+    """
+    Receive a signed push event from GitHub, Gitea, GitLab or any git server and queue a rescan
+    of the repositories tracking the pushed branch. Pushes that leave the compose folder alone are ignored.
+    """
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Webhooks are disabled")
+
+    body = await request.body()
+    if not verify_signature(WEBHOOK_SECRET, body, dict(request.headers)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Invalid webhook signature")
+
+    event_type = request.headers.get("x-github-event") or request.headers.get("x-gitea-event") \
+        or request.headers.get("x-gitlab-event") or "push"
+    if event_type.lower() not in ("push", "push hook"):
+        response.status_code = status.HTTP_200_OK
+        return WebhookResponseModel(status=status.HTTP_200_OK, message=f"Ignored {event_type} event.")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Webhook payload is not JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Webhook payload is not an object")
+
+    event = parse_push_event(payload)
+    repo_ids, matched = await find_pushed_repos(event, db) if not event.deleted else ([], 0)
+    if not repo_ids:
+        response.status_code = status.HTTP_200_OK
+        if event.deleted:
+            message = "Branch deletion ignored."
+        elif matched:
+            message = "Push does not touch the compose folder."
+        else:
+            message = "No repository tracks the pushed branch."
+        return WebhookResponseModel(status=status.HTTP_200_OK, message=message)
+
+    job, _ = jobs.submit(repo_ids=repo_ids, trigger="webhook")
+    return WebhookResponseModel(status=status.HTTP_202_ACCEPTED, message="Re-indexing triggered.",
+                                job_id=job.id, repo_ids=repo_ids)
@@ -1,21 +1,123 @@
 import logging
 import sys
 
+from collections.abc import Sequence
+
 from core.logging import InterceptHandler
 from loguru import logger
 from starlette.config import Config
+from starlette.datastructures import CommaSeparatedStrings
 
 config = Config(".env")
 
 API_PREFIX = "/api"
 VERSION = "0.1.0"
 DEBUG: bool = config("DEBUG", cast=bool, default=False)
+
+# storage configuration, sqlite:///... or postgresql://...
+DATABASE_URL: str = config("DATABASE_URL", default="sqlite:///./database.db")
 MAX_CONNECTIONS_COUNT: int = config(
     "MAX_CONNECTIONS_COUNT", cast=int, default=10)
 MIN_CONNECTIONS_COUNT: int = config(
     "MIN_CONNECTIONS_COUNT", cast=int, default=10)
+DATABASE_POOL_TIMEOUT: float = config(
+    "DATABASE_POOL_TIMEOUT", cast=float, default=30.0)
+DATABASE_POOL_RECYCLE: int = config(
+    "DATABASE_POOL_RECYCLE", cast=int, default=1800)
+SQLITE_BUSY_TIMEOUT_MS: int = config(
+    "SQLITE_BUSY_TIMEOUT_MS", cast=int, default=5000)
+SQLITE_CACHE_SIZE_KB: int = config(
+    "SQLITE_CACHE_SIZE_KB", cast=int, default=65536)
+SQLITE_MMAP_SIZE: int = config(
+    "SQLITE_MMAP_SIZE", cast=int, default=268435456)
 
 PROJECT_NAME: str = config("PROJECT_NAME", default="proxima-spaceport")
+MAX_PAGE_SIZE: int = config("MAX_PAGE_SIZE", cast=int, default=1000)
+# rows read from the database and written to the client per chunk of a streamed (NDJSON) list
+STREAM_CHUNK_SIZE: int = config("STREAM_CHUNK_SIZE", cast=int, default=500)
+# serialized /repos and /index responses kept in the process, until a write changes their tables
+READ_CACHE_MAX_ENTRIES: int = config("READ_CACHE_MAX_ENTRIES", cast=int, default=256)
+READ_CACHE_MAX_BYTES: int = config("READ_CACHE_MAX_BYTES", cast=int, default=64 * 1024 * 1024)
+
+# rows accepted by one bulk repository request, and rows sent per executemany
+BULK_MAX_ROWS: int = config("BULK_MAX_ROWS", cast=int, default=10000)
+BULK_WRITE_BATCH_SIZE: int = config("BULK_WRITE_BATCH_SIZE", cast=int, default=500)
+
+# rescan configuration
+RESCAN_MAX_CONCURRENCY: int = config(
+    "RESCAN_MAX_CONCURRENCY", cast=int, default=16)
+RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL: int = config(
+    "RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL", cast=int, default=4)
+# rows read from the work list per round trip, and index entries written per upsert
+RESCAN_READ_BATCH_SIZE: int = config(
+    "RESCAN_READ_BATCH_SIZE", cast=int, default=500)
+RESCAN_WRITE_BATCH_SIZE: int = config(
+    "RESCAN_WRITE_BATCH_SIZE", cast=int, default=200)
+# seconds between scheduled rescans, 0 disables the scheduler
+RESCAN_INTERVAL_SECONDS: float = config(
+    "RESCAN_INTERVAL_SECONDS", cast=float, default=0.0)
+# finished jobs kept for status polling
+RESCAN_JOB_HISTORY: int = config("RESCAN_JOB_HISTORY", cast=int, default=100)
+
+# where compose files are read from: "github" (REST API), "graphql" (batched GitHub GraphQL API,
+# REST for compose discovery and public repositories without a shared token) or "git" (local bare mirrors)
+INDEX_FETCH_BACKEND: str = config("INDEX_FETCH_BACKEND", default="github")
+# list the repository tree and index every compose file under compose_folder matching the patterns,
+# instead of reading {compose_folder}docker-compose.yml only
+COMPOSE_DISCOVERY: bool = config("COMPOSE_DISCOVERY", cast=bool, default=False)
+COMPOSE_FILE_PATTERNS: Sequence[str] = config(
+    "COMPOSE_FILE_PATTERNS", cast=CommaSeparatedStrings,
+    default="compose.yaml,compose.yml,docker-compose.yaml,docker-compose.yml,"
+            "compose.*.yaml,compose.*.yml,docker-compose.*.yaml,docker-compose.*.yml")
+GIT_MIRROR_ROOT: str = config("GIT_MIRROR_ROOT", default="./mirrors")
+# transports git may use for repository urls (GIT_ALLOW_PROTOCOL), add file to mirror local repositories
+GIT_ALLOWED_PROTOCOLS: Sequence[str] = config(
+    "GIT_ALLOWED_PROTOCOLS", cast=CommaSeparatedStrings, default="https,ssh")
+GIT_COMMAND_TIMEOUT: float = config(
+    "GIT_COMMAND_TIMEOUT", cast=float, default=120.0)
+
+# github configuration
+GITHUB_BASE_URL: str = config("GITHUB_BASE_URL", default="https://api.github.com")
+# repositories per GraphQL request of the "graphql" fetch backend
+GITHUB_GRAPHQL_BATCH_SIZE: int = config(
+    "GITHUB_GRAPHQL_BATCH_SIZE", cast=int, default=50)
+GITHUB_CLIENT_VALIDATION_TTL: float = config(
+    "GITHUB_CLIENT_VALIDATION_TTL", cast=float, default=900.0)
+# requests kept back from every quota, and the share of a quota below which requests are spaced out
+GITHUB_RATE_LIMIT_RESERVE: int = config(
+    "GITHUB_RATE_LIMIT_RESERVE", cast=int, default=5)
+GITHUB_RATE_LIMIT_PACING_FRACTION: float = config(
+    "GITHUB_RATE_LIMIT_PACING_FRACTION", cast=float, default=0.1)
+GITHUB_RATE_LIMIT_MAX_DELAY: float = config(
+    "GITHUB_RATE_LIMIT_MAX_DELAY", cast=float, default=2.0)
+# conditional request cache for GitHub content, empty to disable
+GITHUB_CACHE_PATH: str = config(
+    "GITHUB_CACHE_PATH", default="./github_cache.db")
+# responses not used for GITHUB_CACHE_MAX_AGE seconds are dropped, and the least recently used beyond the entries
+GITHUB_CACHE_MAX_AGE: float = config(
+    "GITHUB_CACHE_MAX_AGE", cast=float, default=7 * 24 * 3600.0)
+GITHUB_CACHE_MAX_ENTRIES: int = config(
+    "GITHUB_CACHE_MAX_ENTRIES", cast=int, default=50000)
+
+# webhook configuration, shared secret of push webhooks, empty disables the receiver
+WEBHOOK_SECRET: str = config("WEBHOOK_SECRET", default="")
+
+# tracing configuration, where traces go: "file" (OTLP JSON lines in TRACE_FILE_PATH),
+# "otlp" (an OTLP/HTTP collector at TRACE_OTLP_ENDPOINT) or empty to not export them
+TRACE_EXPORT: str = config("TRACE_EXPORT", default="")
+TRACE_FILE_PATH: str = config("TRACE_FILE_PATH", default="./traces.jsonl")
+TRACE_OTLP_ENDPOINT: str = config(
+    "TRACE_OTLP_ENDPOINT", default="http://localhost:4318/v1/traces")
+# requests taking longer log a breakdown of where the time went, 0 disables
+TRACE_SLOW_REQUEST_MS: float = config(
+    "TRACE_SLOW_REQUEST_MS", cast=float, default=1000.0)
+# spans kept per trace, a rescan of many repositories would otherwise keep every query
+TRACE_MAX_SPANS: int = config("TRACE_MAX_SPANS", cast=int, default=10000)
+# with DEBUG, requests sent with X-Profile: 1 are sampled and written as folded stacks
+TRACE_PROFILING: bool = config("TRACE_PROFILING", cast=bool, default=False)
+TRACE_PROFILE_INTERVAL_MS: float = config(
+    "TRACE_PROFILE_INTERVAL_MS", cast=float, default=5.0)
+TRACE_PROFILE_DIR: str = config("TRACE_PROFILE_DIR", default="./profiles")
 
 # logging configuration
 LOGGING_LEVEL = logging.DEBUG if DEBUG else logging.INFO
@@ -1,2 +1,22 @@
+from sqlalchemy.exc import IntegrityError
+
+
 class DatabaseException(BaseException):
     ...
+
+
+class RateLimitExceeded(Exception):
+    """The quota of a credential is used up until reset_at (epoch seconds)."""
+
+    def __init__(self, key: str, reset_at: float) -> None:
+        super().__init__(f"Rate limit of {key} exhausted until {reset_at:.0f}")
+        self.key = key
+        self.reset_at = reset_at
+
+
+def is_unique_violation(exc: IntegrityError) -> bool:
+    """Tell unique constraint violations apart from other integrity errors on every supported database."""
+    # postgres drivers expose the SQLSTATE, sqlite only has the message
+    if getattr(exc.orig, "sqlstate", None) == "23505":
+        return True
+    return "UNIQUE constraint failed" in str(exc.orig)
@@ -0,0 +1,97 @@
+import time
+
+from typing import Any
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import Engine, event
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# a registry of our own, the default one would be shared with anything else imported in the process
+registry = CollectorRegistry()
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests per route name",
+    ["method", "route", "status"], registry=registry)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of database statements, the count is the number of statements",
+    ["operation"], registry=registry,
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+GITHUB_REQUEST_DURATION = Histogram(
+    "github_request_duration_seconds", "Latency of GitHub API requests per credential",
+    ["credential", "api", "status"], registry=registry)
+RESCAN_DURATION = Histogram(
+    "rescan_duration_seconds", "Duration of rescan jobs",
+    ["trigger", "status"], registry=registry,
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0))
+RESCAN_REPOS = Counter(
+    "rescan_repos", "Repositories handled by rescan jobs per outcome",
+    ["outcome"], registry=registry)
+READ_CACHE_REQUESTS = Counter(
+    "read_cache_requests", "Cached list reads per route name and result (hit, miss, not_modified)",
+    ["route", "result"], registry=registry)
+STARTUP_DURATION = Gauge(
+    "startup_duration_seconds", "Phases of the cold start of this process (imports, database, encryption_key, total)",
+    ["phase"], registry=registry)
+
+DB_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+# requests that match no route are counted together, raw paths would make one series per url
+UNMATCHED_ROUTE = "unmatched"
+
+
+def render_metrics() -> bytes:
+    return generate_latest(registry)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement the engine sends to the database."""
+
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                              executemany: bool) -> None:
+        context._metrics_started_at = time.perf_counter()
+
+    def after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                             executemany: bool) -> None:
+        started_at = getattr(context, "_metrics_started_at", None)
+        if started_at is None:
+            return
+        keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        operation = keyword if keyword in DB_OPERATIONS else "OTHER"
+        DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started_at)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def observe_github_request(credential: str, api: str, status_code: int, seconds: float) -> None:
+    GITHUB_REQUEST_DURATION.labels(credential, api, str(status_code)).observe(seconds)
+
+
+class MetricsMiddleware:
+    """Records the latency of every HTTP request under the name of the route that served it."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router stores the matched route in the scope it was given. Its name is used
+            # rather than its path, which may be relative to the router it was included from
+            route = scope.get("route")
+            name = getattr(route, "name", None) or UNMATCHED_ROUTE
+            HTTP_REQUEST_DURATION.labels(scope["method"], name, str(status_code)).observe(
+                time.perf_counter() - started_at)
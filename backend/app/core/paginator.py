@@ -1,4 +1,14 @@
-from typing import Any
+import base64
+import json
+
+from datetime import datetime
+from typing import Any, Generic, TypeVar
+
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, Select, and_, or_
+
+T = TypeVar("T")
 
 
 def pagenation(
@@ -43,3 +53,86 @@ def pagenation(
         "totalCount": total_count,
         "listings": data[begin:end],
     }
+
+
+class PageParams(BaseModel):
+    limit: int | None = None
+    cursor: str | None = None
+    descending: bool = False
+    count: bool = False
+
+
+class PageModel(BaseModel, Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None
+    total: int | None = None
+
+
+def encode_cursor(sort_value: Any, row_id: str) -> str:
+    """Opaque token holding the sort key and id of the last row of a page."""
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[Any, str]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Invalid pagination cursor")
+    return sort_value, str(row_id)
+
+
+def keyset_paginate(stmt: Select[Any], sort_column: ColumnElement[Any], id_column: ColumnElement[Any],
+                    page: PageParams) -> Select[Any]:
+    """
+    Order stmt by (sort_column, id_column) and continue after page.cursor.
+
+    NULL sort keys go first in ascending and last in descending order, on every database.
+    One row more than page.limit is selected so the caller can tell whether a next page exists.
+    """
+    if page.descending:
+        stmt = stmt.order_by(sort_column.desc().nulls_last(), id_column.desc())
+    else:
+        stmt = stmt.order_by(sort_column.asc().nulls_first(), id_column.asc())
+
+    if page.cursor:
+        sort_value, row_id = decode_cursor(page.cursor)
+        if page.descending and sort_value is None:
+            stmt = stmt.where(sort_column.is_(None), id_column < row_id)
+        elif page.descending:
+            stmt = stmt.where(or_(sort_column < sort_value,
+                                  and_(sort_column == sort_value,
+                                       id_column < row_id),
+                                  sort_column.is_(None)))
+        elif sort_value is None:
+            stmt = stmt.where(or_(sort_column.is_not(None),
+                                  and_(sort_column.is_(None), id_column > row_id)))
+        else:
+            stmt = stmt.where(or_(sort_column > sort_value,
+                                  and_(sort_column == sort_value, id_column > row_id)))
+
+    if page.limit is not None:
+        stmt = stmt.limit(page.limit + 1)
+    return stmt
+
+
+def next_cursor(rows: list[Any], sort_key: str, page: PageParams) -> tuple[list[Any], str | None]:
+    """Trim the extra row selected by keyset_paginate and build the cursor of the next page."""
+    if page.limit is None or len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_key), last.id)
+
+
+def set_page_headers(response: Response, page: PageModel[Any]) -> None:
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        response.headers["X-Total-Count"] = str(page.total)
@@ -0,0 +1,135 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import READ_CACHE_MAX_BYTES, READ_CACHE_MAX_ENTRIES
+from core.metrics import READ_CACHE_REQUESTS
+from database import TableVersions
+
+# headers of a list response that belong to its body, kept with it in the cache
+CACHED_HEADERS = ("X-Next-Cursor", "X-Total-Count")
+
+
+class CachedBody:
+    def __init__(self, versions: tuple[int, ...], body: bytes, media_type: str | None,
+                 headers: dict[str, str]) -> None:
+        self.versions = versions
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers
+
+
+class ReadCache:
+    """
+    Version counter per table and the serialized bodies of list responses read at those versions.
+
+    Every write path bumps the tables it changed in its transaction, which makes the ETags of the
+    responses read from them change and their cached bodies unreachable. A response depends on its
+    route, its query string and the versions of the tables it reads, nothing else.
+
+    The counters are rows of table_versions, so a write through any worker is seen by all of them,
+    only the bodies are kept per process. A write straight into the database is not seen until the next bump.
+    """
+
+    def __init__(self, max_entries: int = READ_CACHE_MAX_ENTRIES, max_bytes: int = READ_CACHE_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bodies: OrderedDict[str, CachedBody] = OrderedDict()
+            self._size = 0
+
+    async def bump(self, db: AsyncSession, *tables: str) -> None:
+        """Count a write of tables in the transaction of db, every worker sees it once that commits."""
+        insert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else postgresql_insert
+        # sorted, so concurrent writers lock the rows in the same order
+        stmt = insert(TableVersions).values([{"name": table, "version": 1} for table in sorted(tables)])
+        await db.execute(stmt.on_conflict_do_update(index_elements=[TableVersions.name],
+                                                    set_={"version": TableVersions.version + 1}))
+
+    async def versions(self, db: AsyncSession, tables: tuple[str, ...]) -> tuple[int, ...]:
+        rows = await db.execute(select(TableVersions.name, TableVersions.version)
+                                .where(TableVersions.name.in_(tables)))
+        current = {name: version for name, version in rows}
+        return tuple(current.get(table, 0) for table in tables)
+
+    def etag(self, key: str, versions: tuple[int, ...]) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return f'W/"{"-".join(map(str, versions))}-{digest}"'
+
+    def get(self, key: str, versions: tuple[int, ...]) -> CachedBody | None:
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is None or cached.versions != versions:
+                return None
+            self._bodies.move_to_end(key)
+            return cached
+
+    def put(self, key: str, cached: CachedBody) -> None:
+        if len(cached.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._bodies.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._bodies[key] = cached
+            self._size += len(cached.body)
+            while len(self._bodies) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted.body)
+
+
+read_cache = ReadCache()
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # weak comparison, as If-None-Match asks for
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag.removeprefix("W/")
+               for candidate in if_none_match.split(","))
+
+
+async def cached_response(request: Request, tables: tuple[str, ...], render: Callable[[], Awaitable[Response]],
+                          db: AsyncSession) -> Response:
+    """
+    Answer a read of tables from the cache, or with 304 when the client holds the current version.
+
+    render is only awaited on a miss. Its body is kept when it answers 200.
+    """
+    route = getattr(request.scope.get("route"), "name", None) or request.url.path
+    # the parameters are sorted, the same query in another order is the same response
+    key = f"{route}?{'&'.join(sorted(f'{name}={value}' for name, value in request.query_params.multi_items()))}"
+    # versions are read before the rows, a write committed in between leaves a body that
+    # is newer than its versions, never an older one
+    versions = await read_cache.versions(db, tables)
+    etag = read_cache.etag(key, versions)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _matches(request.headers.get("if-none-match", ""), etag):
+        READ_CACHE_REQUESTS.labels(route, "not_modified").inc()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cached = read_cache.get(key, versions)
+    if cached is not None:
+        READ_CACHE_REQUESTS.labels(route, "hit").inc()
+        return Response(content=cached.body, media_type=cached.media_type, headers={**cached.headers, **headers})
+
+    READ_CACHE_REQUESTS.labels(route, "miss").inc()
+    response = await render()
+    if response.status_code == status.HTTP_200_OK:
+        read_cache.put(key, CachedBody(versions, bytes(response.body), response.media_type, {
+            name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}))
+        response.headers.update(headers)
+    return response
@@ -0,0 +1,56 @@
+from collections.abc import AsyncIterable, AsyncIterator
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from core.config import STREAM_CHUNK_SIZE
+from core.tracing import span
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    orjson serializes datetimes natively, so rows read from the database can be
+    rendered as they are, without building Pydantic models first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize"):
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _encode_default(value: Any) -> Any:
+    # encrypted secrets are base64 text, rendered as strings like Pydantic does
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+async def encode_ndjson(rows: AsyncIterable[Any], chunk_size: int = STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """One JSON document per line, sent in chunks of chunk_size rows."""
+    chunk: list[bytes] = []
+    async for row in rows:
+        chunk.append(orjson.dumps(row, default=_encode_default,
+                                  option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE))
+        if len(chunk) >= chunk_size:
+            yield b"".join(chunk)
+            chunk.clear()
+    if chunk:
+        yield b"".join(chunk)
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    Newline delimited JSON streamed while rows are read, so neither side holds the whole list.
+
+    Errors after the first chunk cannot change the status any more, the stream just ends early.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def __init__(self, rows: AsyncIterable[Any], chunk_size: int = STREAM_CHUNK_SIZE, **kwargs: Any) -> None:
+        super().__init__(encode_ndjson(rows, chunk_size), media_type=NDJSON_MEDIA_TYPE, **kwargs)
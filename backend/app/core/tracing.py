@@ -0,0 +1,341 @@
+import json
+import os
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from loguru import logger
+from sqlalchemy import Engine, event
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import DEBUG, PROJECT_NAME, TRACE_EXPORT, TRACE_FILE_PATH, TRACE_MAX_SPANS, TRACE_OTLP_ENDPOINT
+from core.config import TRACE_PROFILE_DIR, TRACE_PROFILE_INTERVAL_MS, TRACE_PROFILING, TRACE_SLOW_REQUEST_MS
+
+REQUEST_ID_HEADER = "x-request-id"
+PROFILE_HEADER = "x-profile"
+# request ids sent by clients are echoed in headers and logs, anything else gets a fresh one
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# statements are cut in span attributes, a bulk insert can be megabytes of SQL
+MAX_STATEMENT_LENGTH = 500
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans of one request or background job, shared by every task and thread working for it."""
+
+    def __init__(self, name: str, request_id: str | None, attributes: dict[str, Any]) -> None:
+        self.trace_id = uuid4().hex
+        self.request_id = request_id or self.trace_id
+        self.root = Span(name, self.trace_id, None, {"request.id": self.request_id, **attributes})
+        self.spans = [self.root]
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        # list.append is atomic, spans may be added from worker threads
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append(span)
+
+    def breakdown(self) -> list[tuple[str, int, float]]:
+        """Count and total milliseconds per span name, slowest first, the root span left out."""
+        counts: Counter[str] = Counter()
+        totals: dict[str, float] = {}
+        for span in self.spans[1:]:
+            counts[span.name] += 1
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        return sorted(((name, counts[name], totals[name]) for name in counts), key=lambda item: -item[2])
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def start_span(name: str, **attributes: Any) -> Span | None:
+    """Span below the current one, None outside of a trace. The caller has to end it."""
+    current = _current_trace.get()
+    if current is None:
+        return None
+    parent = _current_span.get() or current.root
+    started = Span(name, current.trace_id, parent.span_id, attributes)
+    current.add(started)
+    return started
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Time the block as a child of the current span, spans opened inside become its children."""
+    started = start_span(name, **attributes)
+    if started is None:
+        yield None
+        return
+    token = _current_span.set(started)
+    try:
+        yield started
+    finally:
+        started.end()
+        _current_span.reset(token)
+
+
+def to_otlp(traces: list[Trace]) -> dict[str, Any]:
+    """OTLP/HTTP JSON document of finished traces."""
+    def value(raw: Any) -> dict[str, Any]:
+        if isinstance(raw, bool):
+            return {"boolValue": raw}
+        if isinstance(raw, int):
+            return {"intValue": str(raw)}
+        if isinstance(raw, float):
+            return {"doubleValue": raw}
+        return {"stringValue": str(raw)}
+
+    spans = [{
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+        "name": span.name,
+        # SPAN_KIND_SERVER for the root, SPAN_KIND_INTERNAL below it
+        "kind": 2 if span.parent_id is None else 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": [{"key": key, "value": value(raw)} for key, raw in span.attributes.items()],
+    } for trace in traces for span in trace.spans]
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": PROJECT_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "proxima-spaceport"}, "spans": spans}],
+    }]}
+
+
+class TraceExporter:
+    """
+    Ships finished traces from a background thread, so requests never wait for the file or the collector.
+
+    kind is "file" (one OTLP JSON document per line of path), "otlp" (POSTed to an OTLP/HTTP endpoint)
+    or empty to keep traces in the process.
+    """
+
+    max_batch = 64
+
+    def __init__(self, kind: str = TRACE_EXPORT, path: str = TRACE_FILE_PATH,
+                 endpoint: str = TRACE_OTLP_ENDPOINT) -> None:
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self._queue: queue.Queue[Trace] = queue.Queue(maxsize=1000)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.kind)
+
+    def export(self, finished: Trace) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            logger.warning(f"Trace export queue is full, dropped trace {finished.request_id}")
+
+    def flush(self) -> None:
+        """Wait until every trace handed to export has been written."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning(f"Trace export to {self.kind} failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list[Trace]) -> None:
+        if self.kind == "file":
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(to_otlp(batch)) + "\n")
+        elif self.kind == "otlp":
+            import requests
+
+            response = requests.post(self.endpoint, json=to_otlp(batch), timeout=10)
+            response.raise_for_status()
+        else:
+            raise ValueError(f"Unknown trace exporter {self.kind}")
+
+
+exporter = TraceExporter()
+
+
+@contextmanager
+def trace(name: str, request_id: str | None = None, slow_ms: float = 0.0,
+          **attributes: Any) -> Iterator[Trace | None]:
+    """
+    Collect the spans of a request or job, then export them.
+
+    A trace lasting slow_ms or longer logs its breakdown per span name. Nothing is collected when
+    there is neither an exporter nor a threshold.
+    """
+    if not exporter.enabled and slow_ms <= 0:
+        yield None
+        return
+    current = Trace(name, request_id, attributes)
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(current.root)
+    try:
+        yield current
+    finally:
+        current.root.end()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if slow_ms > 0 and current.root.duration_ms >= slow_ms:
+            parts = ", ".join(f"{span_name} {count}x {total:.1f} ms" for span_name, count, total in current.breakdown())
+            dropped = f", {current.dropped} spans dropped" if current.dropped else ""
+            logger.warning(f"Slow {current.root.name} [{current.request_id}] took "
+                           f"{current.root.duration_ms:.1f} ms: {parts or 'no spans'}{dropped}")
+        exporter.export(current)
+
+
+def trace_engine(engine: Engine) -> None:
+    """Record every statement the engine sends to the database as a span of the current trace."""
+
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                              executemany: bool) -> None:
+        context._trace_span = start_span("db.query", **{
+            "db.system": engine.dialect.name, "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            "db.executemany": executemany})
+
+    def after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any,
+                             executemany: bool) -> None:
+        started = getattr(context, "_trace_span", None)
+        if started is not None:
+            started.end()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval, in the folded format of flame graph tools.
+
+    Async requests run on the event loop thread, so the samples of a profiled request include
+    whatever else the loop was doing at the time.
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter[str]:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+
+def write_profile(request_id: str, stacks: Counter[str], directory: str = TRACE_PROFILE_DIR) -> Path:
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    path = path / f"{request_id}.folded"
+    path.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()), encoding="utf-8")
+    return path
+
+
+class TracingMiddleware:
+    """
+    Gives every HTTP request a request id (X-Request-ID, taken from the request when it is sane) and a trace.
+
+    With DEBUG and TRACE_PROFILING set, a request sent with X-Profile: 1 is also sampled by a profiler.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        requested_id = headers.get(REQUEST_ID_HEADER, "")
+        request_id = requested_id if _VALID_REQUEST_ID.match(requested_id) else uuid4().hex
+        profiler = None
+        if DEBUG and TRACE_PROFILING and headers.get(PROFILE_HEADER) == "1":
+            profiler = SamplingProfiler(threading.get_ident(), TRACE_PROFILE_INTERVAL_MS / 1000)
+            profiler.start()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = request_id
+                if current is not None:
+                    current.root.attributes["http.status_code"] = message["status"]
+            await send(message)
+
+        try:
+            with trace(scope["method"], request_id, TRACE_SLOW_REQUEST_MS, **{
+                    "http.method": scope["method"], "http.target": scope["path"]}) as current:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    if current is not None:
+                        route = getattr(scope.get("route"), "name", None)
+                        current.root.name = f"{scope['method']} {route or scope['path']}"
+        finally:
+            if profiler is not None:
+                path = write_profile(request_id, profiler.stop())
+                logger.info(f"Profile of request {request_id} written to {path}")
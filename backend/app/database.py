@@ -1,29 +1,110 @@
-from sqlalchemy import create_engine, UniqueConstraint, String, DateTime, LargeBinary, ForeignKey
+from sqlalchemy import create_engine, event, make_url, UniqueConstraint, String, DateTime, LargeBinary, ForeignKey, Integer
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, mapped_column, DeclarativeBase
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from core.config import DATABASE_URL, DATABASE_POOL_RECYCLE, DATABASE_POOL_TIMEOUT
+from core.config import MAX_CONNECTIONS_COUNT, MIN_CONNECTIONS_COUNT
+from core.config import SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE
+from core.metrics import instrument_engine
+from core.tracing import trace_engine
+from migrations import HEAD, migrate
 
 from uuid import uuid4
 from typing import Any
 
-DATABASE_URL = "sqlite:///./database.db"
-
 
 class Base(DeclarativeBase):
     pass
 
 
+# one driver per dialect able to serve both the sync (startup) and the async (requests) engine
+SYNC_DRIVERS = {"postgresql": "postgresql+psycopg"}
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite",
+                 "postgresql": "postgresql+psycopg"}
+
+
+def make_sync_url(url: str) -> str:
+    parsed = make_url(url)
+    drivername = SYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def make_async_url(url: str) -> str:
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def set_sqlite_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers continue while a rescan is writing
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def engine_options(url: str) -> dict[str, Any]:
+    parsed = make_url(url)
+    options: dict[str, Any] = {
+        "pool_size": MIN_CONNECTIONS_COUNT,
+        "max_overflow": max(MAX_CONNECTIONS_COUNT - MIN_CONNECTIONS_COUNT, 0),
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+    }
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.database in (None, "", ":memory:"):
+            # every pooled connection would get its own empty in-memory database
+            return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+        options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = DATABASE_POOL_RECYCLE
+    return options
+
+
 class Database:
-    def __init__(self) -> None:
-        self.engine = create_engine(DATABASE_URL, connect_args={
-                                    "check_same_thread": False})
+    def __init__(self, url: str = DATABASE_URL) -> None:
+        # the sync engine is only used at startup (migrations, encryption key), requests go through the async one
+        sync_url = make_sync_url(url)
+        self.engine = create_engine(sync_url, **engine_options(sync_url))
         self.session = sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine)
 
-        Base.metadata.create_all(bind=self.engine)
+        async_url = make_async_url(url)
+        self.async_engine = create_async_engine(
+            async_url, **engine_options(async_url))
+        # keep attributes loaded after commit, lazy loads are not possible without a greenlet context
+        self.async_session = async_sessionmaker(
+            self.async_engine, autoflush=False, expire_on_commit=False)
+
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", set_sqlite_pragmas)
+            event.listen(self.async_engine.sync_engine,
+                         "connect", set_sqlite_pragmas)
+
+        for engine in (self.engine, self.async_engine.sync_engine):
+            instrument_engine(engine)
+            trace_engine(engine)
+
+        # the schema is owned by migrations.py, a database that is up to date costs one read
+        self.applied_migrations = migrate(self.engine)
+        self.schema_version = HEAD
 
     def get_session(self) -> Session:
         return self.session()
 
+    def get_async_session(self) -> AsyncSession:
+        return self.async_session()
+
+    async def dispose(self) -> None:
+        await self.async_engine.dispose()
+        self.engine.dispose()
+
 
 class BaseTable(Base):
     __abstract__ = True
@@ -43,7 +124,7 @@ class Repos(BaseTable):
     compose_folder = mapped_column(String, nullable=True)
     credentials_name = mapped_column(String)
     indexed_at = mapped_column(DateTime)  # ISO formatted datetime string
-    updated_at = mapped_column(DateTime)  # ISO formatted datetime string
+    updated_at = mapped_column(DateTime, index=True)  # ISO formatted datetime string
 
     __table_args__ = (UniqueConstraint(
         'name', 'url', 'branch', name='_id_name_url_branch_uc'),)
@@ -81,20 +162,97 @@ class Index(BaseTable):
     id = mapped_column(String, primary_key=True, index=True,
                        default=lambda: str(uuid4()))
     repo_id = mapped_column(String, ForeignKey("repos.id"), index=True)
-    compose_path = mapped_column(String)
+    # path of the compose file in the repository, a repository with several stacks has one entry per file
+    path = mapped_column(String, default="", nullable=False)
+    # content lives in compose_blobs, identical files are stored once
+    compose_hash = mapped_column(String, ForeignKey(
+        "compose_blobs.hash"), index=True)
+    # branch head and compose blob the entry was indexed from, a rescan only fetches when the head moved
+    commit_sha = mapped_column(String, nullable=True)
+    blob_sha = mapped_column(String, nullable=True)
     indexed_at = mapped_column(DateTime)  # ISO formatted datetime string
-    updated_at = mapped_column(DateTime)  # ISO formatted datetime string
+    updated_at = mapped_column(DateTime, index=True)  # ISO formatted datetime string
+
+    # one entry per compose file, also the conflict target of the rescan upsert
+    __table_args__ = (UniqueConstraint('repo_id', 'path', name='_index_repo_id_path_uc'),)
 
     def as_dict(self) -> dict[str, str | None]:
         return {
             "id": self.id,
             "repo_id": self.repo_id,
+            "path": self.path,
+            "compose_hash": self.compose_hash,
+            "commit_sha": self.commit_sha,
+            "blob_sha": self.blob_sha,
             "indexed_at": self.indexed_at.isoformat() if self.indexed_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
 
+class ComposeBlobs(BaseTable):
+    __tablename__ = "compose_blobs"
+
+    hash = mapped_column(String, primary_key=True)  # sha256 of the uncompressed content
+    size = mapped_column(Integer)  # uncompressed size in bytes
+    data = mapped_column(LargeBinary)  # zlib compressed content
+    created_at = mapped_column(DateTime)
+
+
+class ComposeServices(BaseTable):
+    __tablename__ = "compose_services"
+
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    compose_hash = mapped_column(String, ForeignKey(
+        "compose_blobs.hash"), index=True)
+    service = mapped_column(String, index=True)
+    image = mapped_column(String, nullable=True)
+    image_name = mapped_column(String, nullable=True, index=True)
+    image_tag = mapped_column(String, nullable=True, index=True)
+
+
+class ComposePorts(BaseTable):
+    __tablename__ = "compose_ports"
+
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    compose_hash = mapped_column(String, ForeignKey(
+        "compose_blobs.hash"), index=True)
+    service = mapped_column(String)
+    published = mapped_column(Integer, nullable=True, index=True)
+    target = mapped_column(Integer, nullable=True)
+    protocol = mapped_column(String, default="tcp")
+
+
+class ComposeVolumes(BaseTable):
+    __tablename__ = "compose_volumes"
+
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    compose_hash = mapped_column(String, ForeignKey(
+        "compose_blobs.hash"), index=True)
+    service = mapped_column(String, nullable=True)
+    source = mapped_column(String, nullable=True, index=True)
+    target = mapped_column(String, nullable=True)
+    type = mapped_column(String, default="volume")
+
+
+class ComposeNetworks(BaseTable):
+    __tablename__ = "compose_networks"
+
+    id = mapped_column(Integer, primary_key=True, autoincrement=True)
+    compose_hash = mapped_column(String, ForeignKey(
+        "compose_blobs.hash"), index=True)
+    service = mapped_column(String, nullable=True)
+    network = mapped_column(String, index=True)
+
+
 class Auth(BaseTable):
     __tablename__ = "auth"
 
     key = mapped_column(LargeBinary, primary_key=True)
+
+
+class TableVersions(BaseTable):
+    __tablename__ = "table_versions"
+
+    # bumped in the transaction of every write to the table, the read cache of every worker compares against it
+    name = mapped_column(String, primary_key=True)
+    version = mapped_column(Integer, default=0, nullable=False)
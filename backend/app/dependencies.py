@@ -1,18 +1,43 @@
-from collections.abc import Generator
-from typing import cast
+from collections.abc import AsyncGenerator
+from typing import Literal, cast
 
-from cryptography.fernet import Fernet
-from database import Auth
-from fastapi import FastAPI, Request
-from sqlalchemy.orm import Session
+from core.config import MAX_PAGE_SIZE
+from core.paginator import PageParams
+from core.responses import NDJSON_MEDIA_TYPE
+from database import Auth, Database
+from fastapi import FastAPI, Query, Request
+from services.jobs import RescanJobManager
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-def get_db(request: Request) -> Generator[Session, None, None]:
-    session: Session = request.app.state.db.get_session()
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    session: AsyncSession = request.app.state.db.get_async_session()
     try:
         yield session
     finally:
-        session.close()
+        await session.close()
+
+
+def get_database(request: Request) -> Database:
+    # streamed responses outlive the request session, they open sessions of their own
+    database: Database = request.app.state.db
+    return database
+
+
+def get_job_manager(request: Request) -> RescanJobManager:
+    jobs: RescanJobManager = request.app.state.jobs
+    return jobs
+
+
+def get_page_params(limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), cursor: str | None = None,
+                    order: Literal["asc", "desc"] = "asc", count: bool = False) -> PageParams:
+    return PageParams(limit=limit, cursor=cursor, descending=order == "desc", count=count)
+
+
+def get_stream_mode(request: Request, stream: bool = False) -> bool:
+    """Whether a list is streamed as NDJSON, asked for with stream=true or Accept: application/x-ndjson."""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
 
 
 def get_cryptography_key(request: Request) -> bytes | None:
@@ -25,17 +50,13 @@ def get_cryptography_key(request: Request) -> bytes | None:
 
 
 def init_cryptography_key(app: FastAPI) -> bytes | None:
+    # the key is made by the migrations, under their lock, a start only reads it
     session = app.state.db.get_session()
     try:
-        key = session.query(Auth).first()
-        if not key:
-            new_key = Auth(key=Fernet.generate_key())
-            session.add(new_key)
-            session.commit()
-            return cast(bytes, new_key.key)
-        return cast(bytes, key.key)
+        # ordered, so databases holding several keys from before give every process the same one
+        key = session.scalars(select(Auth.key).order_by(Auth.key).limit(1)).first()
+        return cast(bytes, key) if key else None
     except Exception:
-        session.rollback()
-        raise Exception("Failed to create encryption key in database")
+        raise Exception("Failed to read encryption key from database")
     finally:
         session.close()
@@ -1,33 +1,60 @@
+import time
+
+# the cold start is reported from here, before the application modules are imported
+IMPORT_STARTED = time.perf_counter()
+
 import os
 from contextlib import asynccontextmanager
 from collections.abc import AsyncGenerator
 
 from api.routes.api import router as api_router
-from core.config import API_PREFIX, DEBUG, PROJECT_NAME, VERSION
+from core.config import API_PREFIX, DEBUG, PROJECT_NAME, RESCAN_INTERVAL_SECONDS, VERSION
 from core.errors import DatabaseException
+from core.metrics import STARTUP_DURATION, MetricsMiddleware, render_metrics
+from core.tracing import TracingMiddleware
 from database import Database
 from dependencies import init_cryptography_key
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Response, status
+from loguru import logger
+from services.jobs import RescanJobManager
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
 
 @asynccontextmanager
 async def lifespan_manager(app: FastAPI) -> AsyncGenerator[None, None]:
     """Lifespan manager to handle startup and shutdown events."""
+    started = time.perf_counter()
     try:
         app.state.db = Database()
     except DatabaseException:
         raise RuntimeError("Failed to connect to the database")
+    database_ready = time.perf_counter()
 
     app.state.auth_key = init_cryptography_key(app)
     if not app.state.auth_key:
         raise RuntimeError("Failed to initialize encryption key")
+    key_ready = time.perf_counter()
 
-    print(f"DEV mode:{os.getenv('DEV')}")
+    app.state.jobs = RescanJobManager(app.state.db, app.state.auth_key)
+    app.state.jobs.start_scheduler(RESCAN_INTERVAL_SECONDS)
+
+    app.state.startup = {"imports": IMPORT_SECONDS, "database": database_ready - started,
+                         "encryption_key": key_ready - database_ready,
+                         "total": IMPORT_SECONDS + time.perf_counter() - started}
+    for phase, seconds in app.state.startup.items():
+        STARTUP_DURATION.labels(phase).set(seconds)
+    logger.info(f"Started in {app.state.startup['total']:.3f} s: imports {IMPORT_SECONDS:.3f} s, database "
+                f"{app.state.startup['database']:.3f} s (schema version {app.state.db.schema_version}, "
+                f"{len(app.state.db.applied_migrations)} migrations applied)")
+    logger.info(f"DEV mode:{os.getenv('DEV')}")
 
     yield
 
-    app.state.db.engine.dispose()
+    await app.state.jobs.shutdown()
+    await app.state.db.dispose()
 
 
 app = FastAPI(
@@ -40,7 +67,11 @@ app.add_middleware(
     allow_origins=["http://localhost", "http://localhost:5173"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Request-ID", "ETag"],
 )
+app.add_middleware(TracingMiddleware)
+# outermost, so the latency includes the other middlewares
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_router, prefix=API_PREFIX)
 
@@ -48,3 +79,8 @@ app.include_router(api_router, prefix=API_PREFIX)
 @app.get("/health", status_code=status.HTTP_200_OK)
 async def health_check() -> dict[str, int]:
     return {"status": 200}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,394 @@
+"""
+Versioned schema migrations.
+
+The version of a database is the single row of schema_version. Startup reads it and, when it is
+behind, applies the pending migrations in one transaction, under a lock so that processes starting
+together migrate once. Migrations carry their own table definitions, frozen at the time they were
+written, so the models in database.py can move on without changing what an old migration does.
+
+Databases created by create_all before this module existed have no schema_version. They are taken
+as version 1 and the later migrations bring them to the current schema from whatever revision
+they were created by.
+"""
+import hashlib
+import time
+import zlib
+
+from collections.abc import Callable
+from datetime import datetime, timezone
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import Column, Connection, DateTime, Engine, ForeignKey, Index, Integer, LargeBinary, MetaData
+from sqlalchemy import String, Table, UniqueConstraint, inspect, insert, select, text
+from sqlalchemy.exc import DBAPIError
+
+VERSION_TABLE = "schema_version"
+# pg_advisory_xact_lock key of the migration transaction
+LOCK_KEY = 7_013_101
+
+
+class Migration:
+    def __init__(self, version: int, description: str, upgrade: Callable[[Connection], None]) -> None:
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+
+
+def _initial_schema(conn: Connection) -> None:
+    metadata = MetaData()
+    Table("repos", metadata,
+          Column("id", String, primary_key=True, index=True),
+          Column("url", String, index=True),
+          Column("name", String, index=True),
+          Column("branch", String),
+          Column("compose_folder", String, nullable=True),
+          Column("credentials_name", String),
+          Column("indexed_at", DateTime),
+          Column("updated_at", DateTime),
+          UniqueConstraint("name", "url", "branch", name="_id_name_url_branch_uc"))
+    Table("credentials", metadata,
+          Column("id", String, primary_key=True, index=True),
+          Column("name", String, index=True),
+          Column("username", String),
+          Column("password", LargeBinary, nullable=True),
+          Column("token", LargeBinary, nullable=True),
+          UniqueConstraint("name", "username", name="_id_name_username_uc"))
+    Table("index", metadata,
+          Column("id", String, primary_key=True, index=True),
+          Column("repo_id", String, ForeignKey("repos.id"), index=True),
+          Column("compose_path", String),
+          Column("indexed_at", DateTime),
+          Column("updated_at", DateTime))
+    Table("auth", metadata, Column("key", LargeBinary, primary_key=True))
+    metadata.create_all(conn)
+
+
+def _blob_tables(metadata: MetaData) -> tuple[Table, Table]:
+    blobs = Table("compose_blobs", metadata,
+                  Column("hash", String, primary_key=True),
+                  Column("size", Integer),
+                  Column("data", LargeBinary),
+                  Column("created_at", DateTime))
+    index = Table("index", metadata,
+                  Column("id", String, primary_key=True, index=True),
+                  Column("repo_id", String, ForeignKey("repos.id"), index=True),
+                  Column("path", String, nullable=False),
+                  Column("compose_hash", String, ForeignKey("compose_blobs.hash"), index=True),
+                  Column("commit_sha", String, nullable=True),
+                  Column("blob_sha", String, nullable=True),
+                  Column("indexed_at", DateTime),
+                  Column("updated_at", DateTime, index=True),
+                  UniqueConstraint("repo_id", "path", name="_index_repo_id_path_uc"))
+    return blobs, index
+
+
+def _index_entries_per_file(conn: Connection) -> None:
+    """
+    Compose content moves to compose_blobs, stored once per sha256, and index gets one entry per
+    compose file (repo_id, path) with the commit and blob it was read from.
+
+    index is rebuilt: SQLite cannot add constraints to a table. Entries of a repository that share
+    a path, possible before the unique constraint, are reduced to the latest one.
+    """
+    metadata = MetaData()
+    repos = Table("repos", metadata, autoload_with=conn)
+    Index("ix_repos_updated_at", repos.c.updated_at).create(conn, checkfirst=True)
+    blobs, index = _blob_tables(metadata)
+    blobs.create(conn, checkfirst=True)
+
+    inspector = inspect(conn)
+    columns = {column["name"] for column in inspector.get_columns("index")}
+    uniques = {constraint["name"] for constraint in inspector.get_unique_constraints("index")}
+    if columns == set(index.c.keys()) and "_index_repo_id_path_uc" in uniques:
+        for table_index in index.indexes:
+            table_index.create(conn, checkfirst=True)
+        return
+
+    # reflected, so stored datetimes come back as datetimes on every dialect
+    old = Table("index", MetaData(), autoload_with=conn)
+    entries: dict[tuple[str, str], dict[str, Any]] = {}
+    contents: dict[str, str] = {}
+    for row in conn.execute(select(old).order_by(old.c.updated_at)).mappings():
+        compose_hash = row.get("compose_hash")
+        content = row.get("compose_path")
+        if compose_hash is None and content is not None:
+            compose_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            contents[compose_hash] = content
+        path = row.get("path") or ""
+        entries[(row["repo_id"], path)] = {
+            "id": row["id"], "repo_id": row["repo_id"], "path": path, "compose_hash": compose_hash,
+            "commit_sha": row.get("commit_sha"), "blob_sha": row.get("blob_sha"),
+            "indexed_at": row["indexed_at"], "updated_at": row["updated_at"]}
+
+    stored = set(conn.scalars(select(blobs.c.hash)))
+    now = datetime.now(timezone.utc)
+    new_blobs = [{"hash": blob_hash, "size": len(content.encode("utf-8")), "created_at": now,
+                  "data": zlib.compress(content.encode("utf-8"), 6)}
+                 for blob_hash, content in contents.items() if blob_hash not in stored]
+    if new_blobs:
+        conn.execute(insert(blobs), new_blobs)
+
+    old.drop(conn)
+    index.create(conn)
+    if entries:
+        conn.execute(insert(index), list(entries.values()))
+
+
+# the compose parsing of migration 3, copied from utilities/compose_parser.py when it was written so that
+# later parser changes do not change what the migration stores
+_MAX_PORT_RANGE = 1024
+
+
+def _split_image(image: str) -> tuple[str, str | None]:
+    if "@" in image:
+        name, digest = image.split("@", 1)
+        return name, digest
+    slash = image.rfind("/")
+    colon = image.rfind(":")
+    if colon > slash:
+        return image[:colon], image[colon + 1:]
+    return image, None
+
+
+def _port_range(value: str) -> list[int | None]:
+    if not value:
+        return [None]
+    if "-" in value:
+        start, end = (int(part) for part in value.split("-", 1))
+        return list(range(start, min(end, start + _MAX_PORT_RANGE - 1) + 1))
+    return [int(value)]
+
+
+def _parse_port(service: str, port: Any) -> list[dict[str, Any]]:
+    if isinstance(port, dict):
+        published = port.get("published")
+        return [{"service": service, "published": int(published) if published not in (None, "") else None,
+                 "target": int(port["target"]) if port.get("target") is not None else None,
+                 "protocol": str(port.get("protocol") or "tcp")}]
+
+    spec = str(port)
+    protocol = "tcp"
+    if "/" in spec:
+        spec, protocol = spec.rsplit("/", 1)
+    parts = spec.rsplit(":", 2) if not spec.startswith("[") else [
+        spec[:spec.index("]") + 1], *spec[spec.index("]") + 2:].split(":")]
+    targets = _port_range(parts[-1])
+    publisheds = _port_range(parts[-2] if len(parts) >= 2 else "")
+    if len(publisheds) == 1:
+        publisheds = publisheds * len(targets)
+    if len(targets) == 1:
+        targets = targets * len(publisheds)
+    return [{"service": service, "published": published, "target": target, "protocol": protocol}
+            for published, target in zip(publisheds, targets)]
+
+
+def _parse_volume(service: str, volume: Any) -> dict[str, Any]:
+    if isinstance(volume, dict):
+        return {"service": service, "source": volume.get("source"), "target": volume.get("target"),
+                "type": str(volume.get("type") or "volume")}
+    parts = str(volume).split(":")
+    if len(parts) == 1:
+        return {"service": service, "source": None, "target": parts[0], "type": "volume"}
+    is_bind = parts[0].startswith((".", "/", "~", "$"))
+    return {"service": service, "source": parts[0], "target": parts[1], "type": "bind" if is_bind else "volume"}
+
+
+def _parse_compose(content: str) -> dict[str, list[dict[str, Any]]]:
+    """Rows of the structure tables for one compose file. Raises ValueError when it is not a compose mapping."""
+    import yaml
+
+    try:
+        document = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid YAML: {e}")
+    if not isinstance(document, dict):
+        raise ValueError("Compose file is not a mapping")
+    services = document.get("services") or {}
+    if not isinstance(services, dict):
+        raise ValueError("services is not a mapping")
+
+    rows: dict[str, list[dict[str, Any]]] = {"services": [], "ports": [], "volumes": [], "networks": []}
+    for name, definition in services.items():
+        name = str(name)
+        definition = definition if isinstance(definition, dict) else {}
+        image = definition.get("image")
+        image_name, image_tag = _split_image(str(image)) if image else (None, None)
+        rows["services"].append({"service": name, "image": str(image) if image else None,
+                                 "image_name": image_name, "image_tag": image_tag})
+        for port in definition.get("ports") or []:
+            try:
+                rows["ports"].extend(_parse_port(name, port))
+            except (ValueError, KeyError, IndexError):
+                continue
+        for volume in definition.get("volumes") or []:
+            rows["volumes"].append(_parse_volume(name, volume))
+        networks = definition.get("networks") or []
+        for network in (networks.keys() if isinstance(networks, dict) else networks):
+            rows["networks"].append({"service": name, "network": str(network)})
+
+    for volume in (document.get("volumes") or {}):
+        rows["volumes"].append({"service": None, "source": str(volume), "target": None, "type": "volume"})
+    for network in (document.get("networks") or {}):
+        rows["networks"].append({"service": None, "network": str(network)})
+    return rows
+
+
+def _compose_structure(conn: Connection) -> None:
+    """Services, ports, volumes and networks of every stored compose blob."""
+    metadata = MetaData()
+    Table("compose_blobs", metadata, Column("hash", String, primary_key=True))
+
+    def structure_table(name: str, *columns: Column[Any]) -> Table:
+        return Table(name, metadata,
+                     Column("id", Integer, primary_key=True, autoincrement=True),
+                     Column("compose_hash", String, ForeignKey("compose_blobs.hash"), index=True),
+                     *columns)
+
+    tables = {
+        "services": structure_table("compose_services",
+                                    Column("service", String, index=True),
+                                    Column("image", String, nullable=True),
+                                    Column("image_name", String, nullable=True, index=True),
+                                    Column("image_tag", String, nullable=True, index=True)),
+        "ports": structure_table("compose_ports",
+                                 Column("service", String),
+                                 Column("published", Integer, nullable=True, index=True),
+                                 Column("target", Integer, nullable=True),
+                                 Column("protocol", String)),
+        "volumes": structure_table("compose_volumes",
+                                   Column("service", String, nullable=True),
+                                   Column("source", String, nullable=True, index=True),
+                                   Column("target", String, nullable=True),
+                                   Column("type", String)),
+        "networks": structure_table("compose_networks",
+                                    Column("service", String, nullable=True),
+                                    Column("network", String, index=True)),
+    }
+    inspector = inspect(conn)
+    if all(inspector.has_table(table.name) for table in tables.values()):
+        # created by create_all along with the blobs, and filled by every rescan since
+        return
+    for table in tables.values():
+        table.create(conn, checkfirst=True)
+
+    rows: dict[str, list[dict[str, Any]]] = {kind: [] for kind in tables}
+    for compose_hash, data in conn.execute(text("SELECT hash, data FROM compose_blobs")):
+        try:
+            parsed = _parse_compose(zlib.decompress(data).decode("utf-8"))
+        except ValueError as e:
+            logger.warning(f"Compose blob {compose_hash} not parsed: {e}")
+            continue
+        for kind in tables:
+            rows[kind].extend({"compose_hash": compose_hash, **row} for row in parsed[kind])
+    for kind, table in tables.items():
+        if rows[kind]:
+            conn.execute(insert(table), rows[kind])
+
+
+# full-text search over compose content, rows are keyed by blob hash like the content itself
+SEARCH_DDL = {
+    "sqlite": ["CREATE VIRTUAL TABLE IF NOT EXISTS compose_fts USING fts5(hash UNINDEXED, content)"],
+    "postgresql": ["CREATE TABLE IF NOT EXISTS compose_fts (hash VARCHAR PRIMARY KEY, content TEXT NOT NULL)",
+                   "CREATE INDEX IF NOT EXISTS ix_compose_fts_content ON compose_fts "
+                   "USING gin (to_tsvector('simple', content))"],
+}
+
+
+def _search_table(conn: Connection) -> None:
+    """Create the search table of the dialect and add the blobs stored before it existed."""
+    statements = SEARCH_DDL.get(conn.dialect.name)
+    if not statements:
+        return
+    for statement in statements:
+        conn.execute(text(statement))
+    missing = conn.execute(text(
+        "SELECT hash, data FROM compose_blobs WHERE hash NOT IN (SELECT hash FROM compose_fts)")).all()
+    if missing:
+        conn.execute(text("INSERT INTO compose_fts (hash, content) VALUES (:hash, :content)"),
+                     [{"hash": row.hash, "content": zlib.decompress(row.data).decode("utf-8")} for row in missing])
+
+
+def _encryption_key(conn: Connection) -> None:
+    """
+    The Fernet key credentials are encrypted with, made once per database.
+
+    Created here, under the migration lock, so processes starting together on a new database agree
+    on one key. Databases that already have a key keep it.
+    """
+    if conn.execute(text("SELECT key FROM auth")).first() is not None:
+        return
+    from cryptography.fernet import Fernet
+
+    conn.execute(text("INSERT INTO auth (key) VALUES (:key)"), {"key": Fernet.generate_key()})
+
+
+
+def _table_versions(conn: Connection) -> None:
+    """Write counters of the tables behind the read cache, shared by every worker."""
+    metadata = MetaData()
+    Table("table_versions", metadata,
+          Column("name", String, primary_key=True),
+          Column("version", Integer, nullable=False))
+    metadata.create_all(conn)
+
+
+MIGRATIONS = [
+    Migration(1, "initial schema", _initial_schema),
+    Migration(2, "compose blobs and one index entry per compose file", _index_entries_per_file),
+    Migration(3, "compose structure tables", _compose_structure),
+    Migration(4, "full-text search table", _search_table),
+    Migration(5, "encryption key", _encryption_key),
+    Migration(6, "table versions of the read cache", _table_versions),
+]
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(conn: Connection) -> int | None:
+    """Version of the database, None when it has no version table yet."""
+    try:
+        version: int | None = conn.execute(text(f"SELECT version FROM {VERSION_TABLE} WHERE id = 1")).scalar()
+    except DBAPIError:
+        conn.rollback()
+        return None
+    return version
+
+
+def migrate(engine: Engine) -> list[Migration]:
+    """
+    Bring the database to HEAD and return the migrations that were applied.
+
+    A database at HEAD costs a single-row read. Otherwise the migrations run in one transaction,
+    which rolls back as a whole when one fails.
+    """
+    with engine.connect() as conn:
+        if current_version(conn) == HEAD:
+            return []
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+                          "(id INTEGER PRIMARY KEY, version INTEGER NOT NULL)"))
+        # tables without a version were made by create_all, they hold at least the initial schema.
+        # On SQLite the insert also takes the write lock, a concurrent migration waits here
+        legacy = 1 if inspect(conn).has_table("repos") else 0
+        conn.execute(text(f"INSERT INTO {VERSION_TABLE} (id, version) VALUES (1, :version) "
+                          "ON CONFLICT (id) DO NOTHING"), {"version": legacy})
+        # read again under the lock, another process may have migrated meanwhile
+        version = conn.execute(text(f"SELECT version FROM {VERSION_TABLE} WHERE id = 1")).scalar_one()
+        if version > HEAD:
+            raise RuntimeError(f"Database schema version {version} is newer than this release ({HEAD})")
+
+        pending = [migration for migration in MIGRATIONS if migration.version > version]
+        for migration in pending:
+            logger.info(f"Applying migration {migration.version}: {migration.description}")
+            migration.upgrade(conn)
+            conn.execute(text(f"UPDATE {VERSION_TABLE} SET version = :version WHERE id = 1"),
+                         {"version": migration.version})
+
+    if pending:
+        logger.info(f"Database migrated from version {version} to {HEAD} "
+                    f"in {time.perf_counter() - started:.2f} s")
+    return pending
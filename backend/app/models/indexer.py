@@ -1,7 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 from datetime import datetime
-from typing import Any
 
 
 class NewRepoCredentialsModel(BaseModel):
@@ -26,8 +25,22 @@ class CreateNewRepoModel(BaseModel):
     compose_folder: str = ""
     credentials_name: str = ""  # Optional credentials name
 
+    @field_validator("url")
+    @classmethod
+    def url_is_not_an_option(cls, url: str) -> str:
+        # the url is passed to git, which would read a leading '-' as an option
+        if url.startswith("-"):
+            raise ValueError("must not start with '-'")
+        return url
+
+
+class UpdateRepoModel(CreateNewRepoModel):
+    id: str
+
 
 class RepositoryModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     url: str
     branch: str
@@ -37,19 +50,29 @@ class RepositoryModel(BaseModel):
     updated_at: datetime | None
     credentials_name: str | None = None  # Optional credentials name
 
-    def __init__(self, **data: Any) -> None:
-        for key in ("indexed_at", "updated_at"):
-            val = data.get(key)
-            if isinstance(val, str):
-                s = val
-                # support "Z" UTC marker
-                if s.endswith("Z"):
-                    s = s[:-1] + "+00:00"
-                try:
-                    data[key] = datetime.fromisoformat(s)
-                except Exception:
-                    data[key] = None
-        super(RepositoryModel, self).__init__(**data)
+
+class RescanRepositoryModel(RepositoryModel):
+    # branch head of the last indexed commit, None when unknown or when the rescan is forced
+    commit_sha: str | None = None
+    # git object id per indexed compose file path, compose discovery only fetches files whose id changed
+    known_blobs: dict[str, str] = {}
+
+
+class RepoFilterModel(BaseModel):
+    name: str | None = None
+    url: str | None = None
+    branch: str | None = None
+    credentials_name: str | None = None
+    updated_since: datetime | None = None
+
+
+class CredentialsFilterModel(BaseModel):
+    name: str | None = None
+
+
+class IndexFilterModel(BaseModel):
+    repo_id: str | None = None
+    updated_since: datetime | None = None
 
 
 class IndexerResponseModel(BaseModel):
@@ -57,9 +80,48 @@ class IndexerResponseModel(BaseModel):
     message: str
 
 
+class BulkRowResultModel(BaseModel):
+    row: int  # position in the upload, from 0
+    status: str  # created, updated, conflict, not_found, invalid, or skipped when an atomic request was rolled back
+    id: str | None = None
+    detail: str | None = None
+
+
+class BulkRepoResponseModel(IndexerResponseModel):
+    succeeded: int = 0
+    failed: int = 0
+    results: list[BulkRowResultModel] = []
+
+
+class BulkDeleteResponseModel(IndexerResponseModel):
+    deleted: int = 0
+
+
 class NewIndexEntryModel(BaseModel):
     repo_id: str
     compose_path: str
+    commit_sha: str | None = None
+    blob_sha: str | None = None  # git object id of the compose file
+    path: str = ""  # location of the compose file in the repository
+
+
+class RepoIndexResultModel(BaseModel):
+    """Every compose file of one repository, as found by compose discovery."""
+    repo_id: str
+    commit_sha: str | None = None
+    entries: list[NewIndexEntryModel] = []  # new or changed files
+    unchanged_paths: list[str] = []  # files still at their indexed blob
+
+
+class IndexEntryModel(BaseModel):
+    id: str
+    repo_id: str
+    path: str
+    compose_hash: str | None
+    commit_sha: str | None
+    blob_sha: str | None
+    indexed_at: datetime | None
+    updated_at: datetime | None
 
 
 class IndexModel(BaseModel):
@@ -68,3 +130,86 @@ class IndexModel(BaseModel):
     compose_path: str
     indexed_at: str | None  # ISO formatted datetime string
     updated_at: str | None  # ISO formatted datetime string
+
+
+class CacheStatsModel(BaseModel):
+    hits: int
+    misses: int
+    entries: int
+
+
+class RescanProgressModel(BaseModel):
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    deferred: int = 0  # held back by a rate limit, rescanned by a retry job
+    retry_at: datetime | None = None
+
+
+class RescanJobModel(BaseModel):
+    id: str
+    status: str = "pending"  # pending, running, completed or failed
+    trigger: str = "api"  # api, schedule, webhook or retry
+    force: bool = False
+    repo_ids: list[str] | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    progress: RescanProgressModel = Field(default_factory=RescanProgressModel)
+    error: str | None = None
+
+
+class RescanJobSubmittedModel(IndexerResponseModel):
+    job_id: str
+
+
+class ComposeStackModel(BaseModel):
+    index_id: str
+    repo_id: str
+    repo_name: str
+    branch: str
+
+
+class IndexServiceModel(ComposeStackModel):
+    service: str
+    image: str | None
+    image_name: str | None
+    image_tag: str | None
+
+
+class IndexPortModel(ComposeStackModel):
+    service: str
+    published: int | None
+    target: int | None
+    protocol: str
+
+
+class IndexVolumeModel(ComposeStackModel):
+    service: str | None
+    source: str | None
+    target: str | None
+    type: str
+
+
+class IndexNetworkModel(ComposeStackModel):
+    service: str | None
+    network: str
+
+
+class IndexSearchResultModel(ComposeStackModel):
+    compose_hash: str
+    rank: float  # lower is a better match
+    snippet: str
+
+
+class PushEventModel(BaseModel):
+    urls: list[str]  # every url the pushed repository is known by
+    branch: str
+    deleted: bool = False
+    # paths touched by the pushed commits, None when the payload does not list (all of) them
+    changed_paths: list[str] | None = None
+
+
+class WebhookResponseModel(IndexerResponseModel):
+    job_id: str | None = None
+    repo_ids: list[str] = []
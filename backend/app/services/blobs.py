@@ -0,0 +1,70 @@
+import hashlib
+import zlib
+
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import ComposeBlobs, Index
+from services.compose_index import delete_unreferenced_structure
+from services.search import delete_unreferenced_search_content
+
+COMPRESSION_LEVEL = 6
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def compress(content: str) -> bytes:
+    return zlib.compress(content.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+async def store_blobs(contents: dict[str, str], db: AsyncSession) -> dict[str, str]:
+    """
+    Store compose contents keyed by their hash, content that is already stored is left untouched.
+
+    Returns the contents that were not stored before.
+    """
+    if not contents:
+        return {}
+
+    existing = set(await db.scalars(select(ComposeBlobs.hash).where(ComposeBlobs.hash.in_(contents))))
+    new_contents = {blob_hash: content for blob_hash,
+                    content in contents.items() if blob_hash not in existing}
+    if not new_contents:
+        return {}
+
+    now = datetime.now(timezone.utc)
+    insert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else postgresql_insert
+    stmt = insert(ComposeBlobs).on_conflict_do_nothing(
+        index_elements=[ComposeBlobs.hash])
+    await db.execute(stmt, [
+        {"hash": blob_hash, "size": len(content.encode("utf-8")), "data": compress(content), "created_at": now}
+        for blob_hash, content in new_contents.items()
+    ])
+    return new_contents
+
+
+async def get_blob_content(blob_hash: str, db: AsyncSession) -> str | None:
+    data = await db.scalar(select(ComposeBlobs.data).where(ComposeBlobs.hash == blob_hash))
+    return decompress(data) if data is not None else None
+
+
+async def delete_unreferenced_blobs(db: AsyncSession) -> None:
+    """
+    Delete the blobs no index entry uses anymore, together with their structure and search rows.
+
+    Blobs are shared between entries, so they can only go once the last entry using them is updated or deleted.
+    """
+    await delete_unreferenced_structure(db)
+    await delete_unreferenced_search_content(db)
+    await db.execute(delete(ComposeBlobs).where(
+        ComposeBlobs.hash.not_in(select(Index.compose_hash).where(Index.compose_hash.is_not(None)))))
@@ -0,0 +1,256 @@
+import csv
+import io
+
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from typing import Any, TypeVar
+from uuid import uuid4
+
+import orjson
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import bindparam, delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import BULK_MAX_ROWS, BULK_WRITE_BATCH_SIZE
+from core.errors import is_unique_violation
+from core.read_cache import read_cache
+from core.responses import NDJSON_MEDIA_TYPE
+from database import Index, Repos
+from models.indexer import BulkRepoResponseModel, BulkRowResultModel, CreateNewRepoModel, RepoFilterModel
+from models.indexer import UpdateRepoModel
+from services.blobs import delete_unreferenced_blobs
+from services.indexer import filter_repositories
+
+M = TypeVar("M", bound=BaseModel)
+T = TypeVar("T")
+
+UNIQUE_CONSTRAINT = "_id_name_url_branch_uc"
+CSV_MEDIA_TYPE = "text/csv"
+
+
+def _chunks(items: list[T], size: int | None = None) -> Iterator[list[T]]:
+    size = size or BULK_WRITE_BATCH_SIZE
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse_rows(body: bytes, content_type: str) -> list[dict[str, Any] | str]:
+    """
+    Rows of a JSON array, NDJSON or CSV (with a header line) upload, by Content-Type.
+
+    A row that cannot be read is kept as the reason why, so it is reported at its position.
+    """
+    media_type = content_type.split(";", 1)[0].strip().lower() or "application/json"
+    rows: list[dict[str, Any] | str] = []
+    if media_type == "application/json":
+        try:
+            document = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body is not JSON")
+        if not isinstance(document, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body is not a JSON array")
+        rows = [row if isinstance(row, dict) else "Row is not an object" for row in document]
+    elif media_type in (NDJSON_MEDIA_TYPE, "application/jsonl"):
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                rows.append("Row is not JSON")
+                continue
+            rows.append(row if isinstance(row, dict) else "Row is not an object")
+    elif media_type == CSV_MEDIA_TYPE:
+        try:
+            text = body.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV is not UTF-8")
+        # cells missing from short lines are left out, the model defaults apply
+        rows = [{key: value for key, value in row.items() if key is not None and value is not None}
+                for row in csv.DictReader(io.StringIO(text))]
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Send application/json, {NDJSON_MEDIA_TYPE} or {CSV_MEDIA_TYPE}")
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {BULK_MAX_ROWS} rows per request")
+    return rows
+
+
+def _validate(rows: list[dict[str, Any] | str], model: type[M],
+              results: list[BulkRowResultModel]) -> list[tuple[int, M]]:
+    valid = []
+    for position, row in enumerate(rows):
+        if isinstance(row, str):
+            results.append(BulkRowResultModel(row=position, status="invalid", detail=row))
+            continue
+        try:
+            valid.append((position, model.model_validate(row)))
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            results.append(BulkRowResultModel(row=position, status="invalid", detail=errors))
+    return valid
+
+
+async def _finish(results: list[BulkRowResultModel], done: str, atomic: bool, db: AsyncSession,
+                  what: str) -> BulkRepoResponseModel:
+    """Commit, or roll back everything when atomic and a row failed, and summarize the results."""
+    results.sort(key=lambda result: result.row)
+    succeeded = sum(result.status == done for result in results)
+    failed = len(results) - succeeded
+    if atomic and failed:
+        await db.rollback()
+        for result in results:
+            if result.status == done:
+                result.status, result.id = "skipped", None
+        return BulkRepoResponseModel(status=status.HTTP_409_CONFLICT, failed=failed, results=results,
+                                     message=f"No repositories {what}, {failed} rows failed")
+
+    if succeeded:
+        await read_cache.bump(db, Repos.__tablename__)
+    await db.commit()
+    return BulkRepoResponseModel(status=status.HTTP_200_OK, succeeded=succeeded, failed=failed, results=results,
+                                 message=f"{succeeded} repositories {what}, {failed} rows failed")
+
+
+async def import_repositories(rows: list[dict[str, Any] | str], db: AsyncSession,
+                              atomic: bool = False) -> BulkRepoResponseModel:
+    """
+    Insert the rows in one transaction, a batch of BULK_WRITE_BATCH_SIZE rows per executemany.
+
+    Rows that collide with a stored repository or an earlier row on name, url and branch are
+    skipped by the database and reported as conflicts. With atomic, any failed row rolls back all.
+    """
+    results: list[BulkRowResultModel] = []
+    valid = _validate(rows, CreateNewRepoModel, results)
+
+    now = datetime.now(timezone.utc)
+    records = [{"id": str(uuid4()), **repo.model_dump(), "indexed_at": now, "updated_at": now} for _, repo in valid]
+    insert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else postgresql_insert
+    stmt = insert(Repos).on_conflict_do_nothing(index_elements=[Repos.name, Repos.url, Repos.branch])
+    inserted: set[str] = set()
+    for chunk in _chunks(records):
+        await db.execute(stmt, chunk)
+        # ids are made here, the ones found were not skipped by the conflict clause
+        inserted.update(await db.scalars(select(Repos.id).where(Repos.id.in_([record["id"] for record in chunk]))))
+
+    for (position, _), record in zip(valid, records):
+        if record["id"] in inserted:
+            results.append(BulkRowResultModel(row=position, status="created", id=record["id"]))
+        else:
+            results.append(BulkRowResultModel(row=position, status="conflict",
+                                              detail=f"Unique constraint violation on {UNIQUE_CONSTRAINT}"))
+    return await _finish(results, "created", atomic, db, "added")
+
+
+async def update_repositories(rows: list[dict[str, Any] | str], db: AsyncSession,
+                              atomic: bool = False) -> BulkRepoResponseModel:
+    """
+    Replace the fields of the repositories named by the id of each row, in one transaction.
+
+    Unknown ids are reported as not_found. A row whose name, url and branch belong to another
+    repository, or to an earlier row, is a conflict. Batches run in a savepoint each and are
+    retried row by row when the database still finds a collision.
+    """
+    results: list[BulkRowResultModel] = []
+    valid = _validate(rows, UpdateRepoModel, results)
+
+    ids = list({repo.id for _, repo in valid})
+    keys = list({(repo.name, repo.url, repo.branch) for _, repo in valid})
+    existing: set[str] = set()
+    owners: dict[tuple[str, str, str], str] = {}
+    for chunk in _chunks(ids):
+        existing.update(await db.scalars(select(Repos.id).where(Repos.id.in_(chunk))))
+    for key_chunk in _chunks(keys):
+        owned = await db.execute(select(Repos.name, Repos.url, Repos.branch, Repos.id)
+                                 .where(tuple_(Repos.name, Repos.url, Repos.branch).in_(key_chunk)))
+        owners.update({(name, url, branch): repo_id for name, url, branch, repo_id in owned})
+
+    updates: list[tuple[int, UpdateRepoModel]] = []
+    claimed: dict[tuple[str, str, str], str] = {}
+    for position, repo in valid:
+        key = (repo.name, repo.url, repo.branch)
+        owner = owners.get(key)
+        if repo.id not in existing:
+            results.append(BulkRowResultModel(row=position, status="not_found", id=repo.id,
+                                              detail="RepositoryModel not found"))
+        elif repo.id in claimed.values() or claimed.get(key, repo.id) != repo.id \
+                or (owner is not None and owner != repo.id and owner not in ids):
+            # the key of a repository moved by another row is free once that row is written
+            results.append(BulkRowResultModel(row=position, status="conflict", id=repo.id,
+                                              detail=f"Unique constraint violation on {UNIQUE_CONSTRAINT}"))
+        else:
+            claimed[key] = repo.id
+            updates.append((position, repo))
+
+    now = datetime.now(timezone.utc)
+    table = Repos.__table__
+    # core statement, bind names must differ from the column names
+    stmt = update(table).where(table.c.id == bindparam("repo_id")).values(
+        url=bindparam("new_url"), branch=bindparam("new_branch"), name=bindparam("new_name"),
+        compose_folder=bindparam("new_compose_folder"), credentials_name=bindparam("new_credentials_name"),
+        updated_at=bindparam("new_updated_at"))
+
+    def values(repo: UpdateRepoModel) -> dict[str, Any]:
+        return {"repo_id": repo.id, "new_url": repo.url, "new_branch": repo.branch, "new_name": repo.name,
+                "new_compose_folder": repo.compose_folder, "new_credentials_name": repo.credentials_name,
+                "new_updated_at": now}
+
+    updated: list[tuple[int, UpdateRepoModel]] = []
+    for chunk in _chunks(updates):
+        try:
+            async with db.begin_nested():
+                await db.execute(stmt, [values(repo) for _, repo in chunk])
+            updated.extend(chunk)
+            continue
+        except IntegrityError as e:
+            if not is_unique_violation(e):
+                raise
+        # rows swapping keys collide while the statement runs, the batch is retried row by row
+        for position, repo in chunk:
+            try:
+                async with db.begin_nested():
+                    await db.execute(stmt, [values(repo)])
+                updated.append((position, repo))
+            except IntegrityError as e:
+                if not is_unique_violation(e):
+                    raise
+                results.append(BulkRowResultModel(row=position, status="conflict", id=repo.id,
+                                                  detail=f"Unique constraint violation on {UNIQUE_CONSTRAINT}"))
+
+    results.extend(BulkRowResultModel(row=position, status="updated", id=repo.id) for position, repo in updated)
+    return await _finish(results, "updated", atomic, db, "edited")
+
+
+async def delete_repositories(db: AsyncSession, ids: list[str] | None = None,
+                              filters: RepoFilterModel | None = None) -> int:
+    """
+    Delete the repositories with the given ids and/or matching the filters in one transaction.
+
+    Their index entries go first, they reference the repository and would otherwise stay listed in /index.
+    Blobs that only their entries used are deleted with them.
+    """
+    if not ids and not (filters and filters.model_dump(exclude_none=True)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Give ids or a filter of the repositories to delete")
+
+    deleted = 0
+    query = filter_repositories(select(Repos.id), filters or RepoFilterModel())
+    for chunk in (_chunks(ids) if ids else [None]):
+        selected = list(await db.scalars(query.where(Repos.id.in_(chunk)) if chunk is not None else query))
+        for id_chunk in _chunks(selected):
+            # index entries reference their repository, they go first
+            await db.execute(delete(Index).where(Index.repo_id.in_(id_chunk)))
+            result = await db.execute(delete(Repos).where(Repos.id.in_(id_chunk))
+                                      .execution_options(synchronize_session=False))
+            deleted += result.rowcount  # type: ignore[attr-defined]
+    if deleted:
+        await delete_unreferenced_blobs(db)
+        await read_cache.bump(db, Repos.__tablename__, Index.__tablename__)
+    await db.commit()
+    return deleted
@@ -0,0 +1,119 @@
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import String, cast, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.paginator import PageModel, PageParams, keyset_paginate, next_cursor
+from database import ComposeNetworks, ComposePorts, ComposeServices, ComposeVolumes, Index, Repos
+from utilities.compose_parser import parse_compose
+
+# rows of a structure query without limit
+DEFAULT_PAGE_SIZE = 100
+
+
+async def store_compose_structure(contents: dict[str, str], db: AsyncSession) -> None:
+    """
+    Parse new compose blobs and store their services, ports, volumes and networks.
+
+    Rows are keyed by the blob hash, so content that was already stored is never parsed again.
+    """
+    services: list[dict[str, Any]] = []
+    ports: list[dict[str, Any]] = []
+    volumes: list[dict[str, Any]] = []
+    networks: list[dict[str, Any]] = []
+
+    for compose_hash, content in contents.items():
+        try:
+            parsed = parse_compose(content)
+        except ValueError as e:
+            logger.warning(f"Compose blob {compose_hash} not parsed: {e}")
+            continue
+        services.extend({"compose_hash": compose_hash, **row.model_dump()} for row in parsed.services)
+        ports.extend({"compose_hash": compose_hash, **row.model_dump()} for row in parsed.ports)
+        volumes.extend({"compose_hash": compose_hash, **row.model_dump()} for row in parsed.volumes)
+        networks.extend({"compose_hash": compose_hash, **row.model_dump()} for row in parsed.networks)
+
+    for table, rows in ((ComposeServices, services), (ComposePorts, ports),
+                        (ComposeVolumes, volumes), (ComposeNetworks, networks)):
+        if rows:
+            await db.execute(insert(table), rows)
+
+
+async def delete_unreferenced_structure(db: AsyncSession) -> None:
+    """Delete the services, ports, volumes and networks of blobs no index entry uses anymore."""
+    referenced = select(Index.compose_hash).where(Index.compose_hash.is_not(None))
+    for table in (ComposeServices, ComposePorts, ComposeVolumes, ComposeNetworks):
+        await db.execute(delete(table).where(table.compose_hash.not_in(referenced)))
+
+
+def _row_key(table: Any) -> Any:
+    # a blob used by several index entries yields one row per entry, the entry and structure row ids are unique
+    return Index.id + ":" + cast(table.id, String)
+
+
+def _matching_stacks(table: Any, *columns: Any) -> Any:
+    # structure rows belong to blobs, resolve them to the index entries and repositories using the blob
+    return (
+        select(Index.id.label("index_id"), Repos.id.label("repo_id"), Repos.name.label("repo_name"),
+               Repos.branch, *columns, _row_key(table).label("id"))
+        .select_from(table)
+        .join(Index, Index.compose_hash == table.compose_hash)
+        .join(Repos, Repos.id == Index.repo_id)
+    )
+
+
+async def _paginate(stmt: Any, table: Any, page: PageParams | None, db: AsyncSession) -> PageModel[dict[str, Any]]:
+    """A page of stmt ordered by repository name, like the other lists with limit, cursor, order and count."""
+    page = page or PageParams()
+    if page.limit is None:
+        page = page.model_copy(update={"limit": DEFAULT_PAGE_SIZE})
+    total = None
+    if page.count:
+        total = await db.scalar(stmt.with_only_columns(func.count(), maintain_column_froms=True)) or 0
+    result = await db.execute(keyset_paginate(stmt, Repos.name, _row_key(table), page))
+    rows, cursor = next_cursor(list(result), "repo_name", page)
+    # the row key only carries the cursor
+    items = [{name: value for name, value in row._mapping.items() if name != "id"} for row in rows]
+    return PageModel(items=items, next_cursor=cursor, total=total)
+
+
+async def find_services(db: AsyncSession, image: str | None = None, tag: str | None = None,
+                        service: str | None = None, page: PageParams | None = None) -> PageModel[dict[str, Any]]:
+    stmt = _matching_stacks(ComposeServices, ComposeServices.service, ComposeServices.image,
+                            ComposeServices.image_name, ComposeServices.image_tag)
+    if image is not None:
+        stmt = stmt.where(ComposeServices.image_name == image)
+    if tag is not None:
+        stmt = stmt.where(ComposeServices.image_tag == tag)
+    if service is not None:
+        stmt = stmt.where(ComposeServices.service == service)
+    return await _paginate(stmt, ComposeServices, page, db)
+
+
+async def find_ports(db: AsyncSession, published: int | None = None, protocol: str | None = None,
+                     page: PageParams | None = None) -> PageModel[dict[str, Any]]:
+    stmt = _matching_stacks(ComposePorts, ComposePorts.service, ComposePorts.published,
+                            ComposePorts.target, ComposePorts.protocol)
+    if published is not None:
+        stmt = stmt.where(ComposePorts.published == published)
+    if protocol is not None:
+        stmt = stmt.where(ComposePorts.protocol == protocol)
+    return await _paginate(stmt, ComposePorts, page, db)
+
+
+async def find_volumes(db: AsyncSession, source: str | None = None,
+                       page: PageParams | None = None) -> PageModel[dict[str, Any]]:
+    stmt = _matching_stacks(ComposeVolumes, ComposeVolumes.service, ComposeVolumes.source,
+                            ComposeVolumes.target, ComposeVolumes.type)
+    if source is not None:
+        stmt = stmt.where(ComposeVolumes.source == source)
+    return await _paginate(stmt, ComposeVolumes, page, db)
+
+
+async def find_networks(db: AsyncSession, network: str | None = None,
+                        page: PageParams | None = None) -> PageModel[dict[str, Any]]:
+    stmt = _matching_stacks(ComposeNetworks, ComposeNetworks.service, ComposeNetworks.network)
+    if network is not None:
+        stmt = stmt.where(ComposeNetworks.network == network)
+    return await _paginate(stmt, ComposeNetworks, page, db)
@@ -1,171 +1,546 @@
+import asyncio
+
 from collections.abc import AsyncIterator
-from cryptography.fernet import Fernet
 from datetime import datetime, timezone
+from typing import Any
+from uuid import uuid4
 
 from fastapi import HTTPException, status
+from loguru import logger
+from core.config import COMPOSE_DISCOVERY, GITHUB_GRAPHQL_BATCH_SIZE, INDEX_FETCH_BACKEND
+from core.config import RESCAN_MAX_CONCURRENCY, RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL
+from core.config import RESCAN_READ_BATCH_SIZE, RESCAN_WRITE_BATCH_SIZE, STREAM_CHUNK_SIZE
+from core.errors import RateLimitExceeded, is_unique_violation
 from database import Repos, Credentials, Index
 
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, case, delete, func, null, or_, select, tuple_, update, Select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
-from models.indexer import RepositoryModel, RepoCredentialsModel, NewIndexEntryModel
+from core.paginator import PageModel, PageParams, keyset_paginate, next_cursor
+from core.read_cache import read_cache
+from core.tracing import span
+from models.indexer import RepositoryModel, RescanRepositoryModel, RepoCredentialsModel, NewIndexEntryModel
+from models.indexer import RepoFilterModel, CredentialsFilterModel, IndexFilterModel, RescanProgressModel
+from models.indexer import RepoIndexResultModel
 
-from utilities.github_utils import make_index_entry
+from services.blobs import content_hash, delete_unreferenced_blobs, get_blob_content, store_blobs
+from services.compose_index import store_compose_structure
+from services.search import store_search_content
+from utilities.github_graphql import BatchOutcome, make_index_batch
+from utilities.github_utils import client_pool, make_index_entry
 
 
-async def create_new_repo(url: str, branch: str, name: str, compose_folder: str, credentials_name: str,  db: Session) -> bool:
+async def create_new_repo(url: str, branch: str, name: str, compose_folder: str, credentials_name: str,  db: AsyncSession) -> bool:
     new_repo = Repos(url=url, branch=branch, name=name, compose_folder=compose_folder, indexed_at=datetime.now(
         timezone.utc), updated_at=datetime.now(timezone.utc), credentials_name=credentials_name)
 
     try:
         db.add(new_repo)
-        db.commit()
+        await read_cache.bump(db, Repos.__tablename__)
+        await db.commit()
     except IntegrityError as e:
-        db.rollback()
-        if "UNIQUE constraint failed" in str(e.orig):
+        await db.rollback()
+        if is_unique_violation(e):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="Unique constraint violation!")
         else:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                 detail="Internal server error")
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="create_new_repo failed unexpectedly")
 
     return True
 
 
-async def list_repositories(db: Session) -> list[RepositoryModel]:
-    # synchronous DB call inside async function (consider SQLAlchemy async for non-blocking)
-    return [RepositoryModel(**repo.as_dict()) for repo in db.query(Repos).all()]
-
-
-async def get_repo_by_id(repo_id: str, db: Session) -> RepositoryModel | None:
-    orm_repo = db.query(Repos).filter(Repos.id == repo_id).first()
-    return RepositoryModel(**orm_repo.as_dict()) if orm_repo else None
+REPO_SORT_COLUMNS: dict[str, Any] = {
+    "name": Repos.name, "url": Repos.url, "updated_at": Repos.updated_at, "id": Repos.id}
+CREDENTIALS_SORT_COLUMNS: dict[str, Any] = {
+    "name": Credentials.name, "id": Credentials.id}
+INDEX_SORT_COLUMNS: dict[str, Any] = {
+    "updated_at": Index.updated_at, "repo_id": Index.repo_id, "id": Index.id}
+
+
+# list endpoints select plain columns, rows are rendered without going through ORM objects
+REPO_COLUMNS = (Repos.id, Repos.url, Repos.branch, Repos.name, Repos.compose_folder,
+                Repos.indexed_at, Repos.updated_at, Repos.credentials_name)
+CREDENTIALS_COLUMNS = (Credentials.id, Credentials.name,
+                       Credentials.username, Credentials.password, Credentials.token)
+INDEX_COLUMNS = (Index.id, Index.repo_id, Index.path, Index.compose_hash, Index.commit_sha, Index.blob_sha,
+                 Index.indexed_at, Index.updated_at)
+
+
+async def _stream(database: Any, stmt: Select[Any], sort_column: Any, id_column: Any,
+                  page: PageParams) -> AsyncIterator[dict[str, Any]]:
+    """
+    Rows of stmt in page order, read STREAM_CHUNK_SIZE at a time.
+
+    The rows are read by a session of their own, which lives as long as the response is streamed.
+    """
+    async with database.get_async_session() as session:
+        stmt = keyset_paginate(stmt, sort_column, id_column, page).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        result = await session.stream(stmt)
+        sent = 0
+        async for row in result:
+            # keyset_paginate selects one row more than the limit
+            if page.limit is not None and sent >= page.limit:
+                break
+            yield dict(row._mapping)
+            sent += 1
+        await result.close()
+
+
+async def _paginate(stmt: Select[Any], sort_column: Any, id_column: Any, sort: str, page: PageParams,
+                    db: AsyncSession) -> tuple[list[dict[str, Any]], str | None, int | None]:
+    total = None
+    if page.count:
+        total = await db.scalar(stmt.with_only_columns(func.count(), maintain_column_froms=True).order_by(None)) or 0
+    result = await db.execute(keyset_paginate(stmt, sort_column, id_column, page))
+    rows, cursor = next_cursor(list(result), sort, page)
+    return [dict(row._mapping) for row in rows], cursor, total
+
+
+def filter_repositories(stmt: Select[Any], filters: RepoFilterModel) -> Select[Any]:
+    if filters.name is not None:
+        stmt = stmt.where(Repos.name == filters.name)
+    if filters.url is not None:
+        stmt = stmt.where(Repos.url == filters.url)
+    if filters.branch is not None:
+        stmt = stmt.where(Repos.branch == filters.branch)
+    if filters.credentials_name is not None:
+        stmt = stmt.where(Repos.credentials_name == filters.credentials_name)
+    if filters.updated_since is not None:
+        stmt = stmt.where(Repos.updated_at >= filters.updated_since)
+    return stmt
+
+
+async def list_repositories(db: AsyncSession, filters: RepoFilterModel | None = None, sort: str = "name",
+                            page: PageParams | None = None) -> PageModel[dict[str, Any]]:
+    stmt = filter_repositories(select(*REPO_COLUMNS), filters or RepoFilterModel())
+    rows, cursor, total = await _paginate(stmt, REPO_SORT_COLUMNS[sort], Repos.id, sort, page or PageParams(), db)
+    return PageModel(items=rows, next_cursor=cursor, total=total)
+
+
+def stream_repositories(database: Any, filters: RepoFilterModel | None = None, sort: str = "name",
+                        page: PageParams | None = None) -> AsyncIterator[dict[str, Any]]:
+    stmt = filter_repositories(select(*REPO_COLUMNS), filters or RepoFilterModel())
+    return _stream(database, stmt, REPO_SORT_COLUMNS[sort], Repos.id, page or PageParams())
+
+
+async def get_repo_orm_by_id(repo_id: str, db: AsyncSession) -> Repos | None:
+    return await db.scalar(select(Repos).where(Repos.id == repo_id))
+
+
+async def get_repo_by_id(repo_id: str, db: AsyncSession) -> RepositoryModel | None:
+    orm_repo = await get_repo_orm_by_id(repo_id, db)
+    return RepositoryModel.model_validate(orm_repo) if orm_repo else None
+
+
+async def count_repositories(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(Repos)) or 0
+
+
+async def remove_repo(repo: Repos, db: AsyncSession) -> bool:
+    # index entries reference their repository, they go in the same transaction
+    await db.execute(delete(Index).where(Index.repo_id == repo.id))
+    await db.delete(repo)
+    await delete_unreferenced_blobs(db)
+    await read_cache.bump(db, Repos.__tablename__, Index.__tablename__)
+    await db.commit()
+    return True
 
 
-async def update_repo(repo: Repos, db: Session) -> bool:
+async def update_repo(repo: Repos, db: AsyncSession) -> bool:
     repo.updated_at = datetime.now(timezone.utc)
 
     try:
         db.add(repo)
-        db.commit()
+        await read_cache.bump(db, Repos.__tablename__)
+        await db.commit()
     except IntegrityError as e:
-        db.rollback()
-        if "UNIQUE constraint failed" in str(e.orig):
+        await db.rollback()
+        if is_unique_violation(e):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="Unique constraint violation!")
         else:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                 detail="Internal server error")
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail="edit_repo failed unexpectedly")
 
-    print(f"Edited repository with id: {repo.id}")
+    logger.info(f"Edited repository with id: {repo.id}")
     return True
 
 
-async def create_new_credentials(name: str, username: str, password: str, token: str, db: Session, auth_key: bytes) -> bool:
+async def create_new_credentials(name: str, username: str, password: str, token: str, db: AsyncSession, auth_key: bytes) -> bool:
     new_credentials = None
     encrypted_password = None
     encrypted_token = None
 
-    if password:
-        fernet = Fernet(auth_key)
-        encrypted_password = fernet.encrypt(password.encode('utf-8'))
+    from cryptography.fernet import Fernet
+
+    with span("crypto.encrypt"):
+        if password:
+            fernet = Fernet(auth_key)
+            encrypted_password = fernet.encrypt(password.encode('utf-8'))
 
-    if token:
-        fernet = Fernet(auth_key)
-        encrypted_token = fernet.encrypt(token.encode('utf-8'))
+        if token:
+            fernet = Fernet(auth_key)
+            encrypted_token = fernet.encrypt(token.encode('utf-8'))
 
     new_credentials = Credentials(
         name=name, username=username, password=encrypted_password, token=encrypted_token)
 
     try:
         db.add(new_credentials)
-        db.commit()
+        await db.commit()
     except IntegrityError as e:
-        db.rollback()
-        if "UNIQUE constraint failed" in str(e.orig):
+        await db.rollback()
+        if is_unique_violation(e):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="Unique constraint violation!")
         else:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                 detail="Internal server error")
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="create_new_credentials failed unexpectedly")
 
-    print(f"Storing new credentials for: {name}")
+    logger.info(f"Storing new credentials for: {name}")
     return True
 
 
-async def get_all_credentials(db: Session) -> list[RepoCredentialsModel]:
-    return [RepoCredentialsModel(**cred.as_dict()) for cred in db.query(Credentials).all()]
-
-
-async def get_credentials_by_name(credentials_name: str, db: Session) -> RepoCredentialsModel | None:
-    orm_cred = db.query(Credentials).filter(
-        Credentials.name == credentials_name).first()
-    return RepoCredentialsModel(**orm_cred.as_dict()) if orm_cred else None
-
-
-async def get_index_values(db: Session) -> list[dict[str, str | None]]:
-    return [entry.as_dict() for entry in db.query(Index).all()]
+def filter_credentials(stmt: Select[Any], filters: CredentialsFilterModel) -> Select[Any]:
+    if filters.name is not None:
+        stmt = stmt.where(Credentials.name == filters.name)
+    return stmt
 
 
-async def validate_uniqueness_index_entry(repo_id: int, db: Session) -> bool:
-    existing_index = db.query(Index).filter(Index.repo_id == repo_id).first()
-    return existing_index is None
+async def get_all_credentials(db: AsyncSession, filters: CredentialsFilterModel | None = None, sort: str = "name",
+                              page: PageParams | None = None) -> PageModel[RepoCredentialsModel]:
+    stmt = filter_credentials(select(*CREDENTIALS_COLUMNS), filters or CredentialsFilterModel())
+    rows, cursor, total = await _paginate(stmt, CREDENTIALS_SORT_COLUMNS[sort], Credentials.id, sort,
+                                          page or PageParams(), db)
+    return PageModel(items=[RepoCredentialsModel(**cred) for cred in rows], next_cursor=cursor, total=total)
 
 
-async def fetch_index_new_entries(db: Session, auth_key: bytes) -> AsyncIterator[NewIndexEntryModel]:
-    for entry in db.query(Repos).all():
-        # ensure uniqueness
-        if not await validate_uniqueness_index_entry(entry.id, db):
-            continue
+def stream_credentials(database: Any, filters: CredentialsFilterModel | None = None, sort: str = "name",
+                       page: PageParams | None = None) -> AsyncIterator[dict[str, Any]]:
+    stmt = filter_credentials(select(*CREDENTIALS_COLUMNS), filters or CredentialsFilterModel())
+    return _stream(database, stmt, CREDENTIALS_SORT_COLUMNS[sort], Credentials.id, page or PageParams())
 
-        cred = None
-        if entry.credentials_name:
-            cred = await get_credentials_by_name(entry.credentials_name, db)
-            if not cred:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                    detail=f"Credentials for {entry.credentials_name} not found")
 
-        new_entry = make_index_entry(RepositoryModel(
-            **entry.as_dict()), credentials=cred, auth_key=auth_key)
+async def get_credentials_by_name(credentials_name: str, db: AsyncSession) -> RepoCredentialsModel | None:
+    orm_cred = await db.scalar(select(Credentials).where(
+        Credentials.name == credentials_name))
+    return RepoCredentialsModel(**orm_cred.as_dict()) if orm_cred else None
 
-        if new_entry:
-            yield new_entry
 
+def filter_index(stmt: Select[Any], filters: IndexFilterModel) -> Select[Any]:
+    if filters.repo_id is not None:
+        stmt = stmt.where(Index.repo_id == filters.repo_id)
+    if filters.updated_since is not None:
+        stmt = stmt.where(Index.updated_at >= filters.updated_since)
+    return stmt
+
+
+async def get_index_values(db: AsyncSession, filters: IndexFilterModel | None = None, sort: str = "updated_at",
+                           page: PageParams | None = None) -> PageModel[dict[str, Any]]:
+    stmt = filter_index(select(*INDEX_COLUMNS), filters or IndexFilterModel())
+    rows, cursor, total = await _paginate(stmt, INDEX_SORT_COLUMNS[sort], Index.id, sort, page or PageParams(), db)
+    return PageModel(items=rows, next_cursor=cursor, total=total)
+
+
+def stream_index_values(database: Any, filters: IndexFilterModel | None = None, sort: str = "updated_at",
+                        page: PageParams | None = None) -> AsyncIterator[dict[str, Any]]:
+    stmt = filter_index(select(*INDEX_COLUMNS), filters or IndexFilterModel())
+    return _stream(database, stmt, INDEX_SORT_COLUMNS[sort], Index.id, page or PageParams())
+
+
+async def get_index_compose(index_id: str, db: AsyncSession) -> str | None:
+    compose_hash = await db.scalar(select(Index.compose_hash).where(Index.id == index_id))
+    if compose_hash is None:
+        return None
+    content: str | None = await get_blob_content(compose_hash, db)
+    return content
+
+
+def plan_rescan(force: bool, repo_ids: list[str] | None = None) -> Select[Any]:
+    """
+    Work list of a rescan in a single query: every repository (or only repo_ids) with its
+    credentials, the commit its index entries were built from and the blob of every entry.
+
+    Repositories whose branch head still is that commit are skipped by make_index_entry,
+    with force the commit is left out so every repository is fetched again.
+    """
+    # credential names are only unique together with the username, use the first one like get_credentials_by_name
+    first_credentials = (
+        select(Credentials.name, func.min(Credentials.id).label("id"))
+        .group_by(Credentials.name)
+        .subquery()
+    )
+    stmt = (
+        select(Repos.id, Repos.url, Repos.branch, Repos.name, Repos.compose_folder, Repos.credentials_name,
+               Repos.indexed_at, Repos.updated_at,
+               Credentials.id.label("cred_id"), Credentials.username, Credentials.password, Credentials.token)
+        .outerjoin(first_credentials, first_credentials.c.name == Repos.credentials_name)
+        .outerjoin(Credentials, Credentials.id == first_credentials.c.id)
+    )
+    if force:
+        stmt = stmt.add_columns(null().label("commit_sha"), null().label("known_blobs"))
+    else:
+        # entries of a repository are written together, they share one commit
+        indexed = (
+            select(Index.repo_id, func.max(Index.commit_sha).label("commit_sha"),
+                   func.aggregate_strings(Index.blob_sha + " " + Index.path, "\n").label("known_blobs"))
+            .group_by(Index.repo_id)
+            .subquery()
+        )
+        stmt = stmt.add_columns(indexed.c.commit_sha, indexed.c.known_blobs).outerjoin(
+            indexed, indexed.c.repo_id == Repos.id)
+    if repo_ids is not None:
+        stmt = stmt.where(Repos.id.in_(repo_ids))
+    return stmt.order_by(Repos.id).execution_options(yield_per=RESCAN_READ_BATCH_SIZE)
+
+
+def _known_blobs(aggregated: str | None) -> dict[str, str]:
+    # "<blob sha> <path>" lines as aggregated by plan_rescan
+    blobs = {}
+    for line in (aggregated or "").split("\n"):
+        blob_sha, _, path = line.partition(" ")
+        if path:
+            blobs[path] = blob_sha
+    return blobs
+
+
+async def upsert_index_entries(entries: list[NewIndexEntryModel], db: AsyncSession) -> None:
+    if not entries:
+        return
+
+    hashes = [content_hash(entry.compose_path) for entry in entries]
+    new_blobs = await store_blobs({blob_hash: entry.compose_path for blob_hash, entry in zip(hashes, entries)}, db)
+    await store_compose_structure(new_blobs, db)
+    await store_search_content(new_blobs, db)
+
+    now = datetime.now(timezone.utc)
+    insert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else postgresql_insert
+    stmt = insert(Index)
+    content_changed = Index.compose_hash.is_distinct_from(stmt.excluded.compose_hash)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Index.repo_id, Index.path],
+        set_={"compose_hash": stmt.excluded.compose_hash,
+              "commit_sha": stmt.excluded.commit_sha,
+              "blob_sha": stmt.excluded.blob_sha,
+              "updated_at": case((content_changed, stmt.excluded.updated_at), else_=Index.updated_at)},
+        # unchanged content keeps its entry untouched, change detection is a hash compare,
+        # a new head with the same compose file only moves the recorded commit
+        where=or_(content_changed, Index.commit_sha.is_distinct_from(stmt.excluded.commit_sha)),
+    )
+    await db.execute(stmt, [
+        {"id": str(uuid4()), "repo_id": entry.repo_id, "path": entry.path, "compose_hash": blob_hash,
+         "commit_sha": entry.commit_sha, "blob_sha": entry.blob_sha, "indexed_at": now, "updated_at": now}
+        for blob_hash, entry in zip(hashes, entries)
+    ])
+
+
+async def write_index_results(results: list[RepoIndexResultModel], db: AsyncSession) -> None:
+    """
+    Store the compose files found in each repository and drop the entries of files that are gone.
+    """
+    if not results:
+        return
+
+    await upsert_index_entries([entry for result in results for entry in result.entries], db)
+
+    unchanged = [{"repo": result.repo_id, "entry_path": path, "commit": result.commit_sha}
+                 for result in results for path in result.unchanged_paths]
+    if unchanged:
+        # the files did not change, only the commit they were last seen at moves
+        table = Index.__table__
+        # core statement, an ORM update with a parameter list would be a bulk update by primary key
+        await db.execute(
+            update(table)
+            .where(table.c.repo_id == bindparam("repo"), table.c.path == bindparam("entry_path"))
+            .values(commit_sha=bindparam("commit")),
+            unchanged)
+
+    kept = [(result.repo_id, path) for result in results
+            for path in [*(entry.path for entry in result.entries), *result.unchanged_paths]]
+    stale = delete(Index).where(Index.repo_id.in_([result.repo_id for result in results]))
+    if kept:
+        stale = stale.where(tuple_(Index.repo_id, Index.path).not_in(kept))
+    await db.execute(stale.execution_options(synchronize_session=False))
+
+
+async def _fetch_index_entry(repo: RescanRepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes,
+                             global_limit: asyncio.Semaphore, credential_limit: asyncio.Semaphore) -> list[BatchOutcome]:
+    # take the per-credential slot first so a busy credential does not hold global slots while waiting
+    async with credential_limit, global_limit:
+        # PyGithub is blocking, keep it off the event loop
+        result = await asyncio.to_thread(make_index_entry, repo, credentials, auth_key)
+    if result is None or isinstance(result, RepoIndexResultModel):
+        return [result]
+    # a single compose file is the only one of its repository
+    return [RepoIndexResultModel(repo_id=result.repo_id, commit_sha=result.commit_sha, entries=[result.model_dump()])]
+
+
+async def _fetch_index_batch(repos: list[RescanRepositoryModel], credentials: RepoCredentialsModel | None,
+                             auth_key: bytes, global_limit: asyncio.Semaphore,
+                             credential_limit: asyncio.Semaphore) -> list[BatchOutcome]:
+    async with credential_limit, global_limit:
+        return await asyncio.to_thread(make_index_batch, repos, credentials, auth_key)
+
+
+async def fetch_index_new_entries(force: bool, db: AsyncSession, auth_key: bytes, progress: RescanProgressModel,
+                                  repo_ids: list[str] | None = None,
+                                  deferred: list[str] | None = None) -> AsyncIterator[RepoIndexResultModel]:
+    global_limit = asyncio.Semaphore(RESCAN_MAX_CONCURRENCY)
+    credential_limits: dict[str, asyncio.Semaphore] = {}
+    # bounded window of fetches in flight, the work list is only read as fast as it is processed
+    window = RESCAN_MAX_CONCURRENCY * 2
+    pending: set[asyncio.Task[list[BatchOutcome]]] = set()
+    # every task answers for one repository, or for a whole GraphQL batch in the order of its list
+    task_repos: dict[asyncio.Task[list[BatchOutcome]], list[RescanRepositoryModel]] = {}
+    # GraphQL batches collected per credential, the compose file paths are fixed without discovery
+    batched = INDEX_FETCH_BACKEND == "graphql" and not COMPOSE_DISCOVERY
+    batches: dict[str, tuple[RepoCredentialsModel | None, list[RescanRepositoryModel]]] = {}
+
+    def launch(repos: list[RescanRepositoryModel], cred: RepoCredentialsModel | None, limit_key: str,
+               batch: bool) -> None:
+        # anonymous repositories share a single limit, like they share the unauthenticated quota
+        credential_limit = credential_limits.setdefault(
+            limit_key, asyncio.Semaphore(RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL))
+        if batch:
+            task = asyncio.create_task(_fetch_index_batch(repos, cred, auth_key, global_limit, credential_limit))
+        else:
+            task = asyncio.create_task(_fetch_index_entry(repos[0], cred, auth_key, global_limit, credential_limit))
+        task_repos[task] = repos
+        pending.add(task)
+
+    async def completed() -> AsyncIterator[RepoIndexResultModel]:
+        nonlocal pending
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            repos = task_repos.pop(task)
+            try:
+                outcomes = task.result()
+            except Exception as e:
+                # a failed request fails every repository it was made for
+                outcomes = [e] * len(repos)
+            for repo, outcome in zip(repos, outcomes):
+                if isinstance(outcome, RateLimitExceeded):
+                    # not a failure, the repository is picked up again once the quota is back
+                    retry_at = datetime.fromtimestamp(outcome.reset_at, timezone.utc)
+                    progress.deferred += 1
+                    progress.retry_at = max(progress.retry_at or retry_at, retry_at)
+                    if deferred is not None:
+                        deferred.append(repo.id)
+                elif isinstance(outcome, Exception):
+                    # one unreachable repository must not abort the whole rescan
+                    detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+                    logger.warning(f"Indexing of {repo.name} failed: {detail}")
+                    progress.failed += 1
+                elif outcome:
+                    yield outcome
+                else:
+                    progress.skipped += 1
+
+    # repositories without credentials are public, their requests may use the quota of any token
+    shared = await db.execute(select(*CREDENTIALS_COLUMNS).where(Credentials.token.is_not(None)))
+    client_pool.share([RepoCredentialsModel(**row._mapping) for row in shared])
+    # GraphQL needs a token, public repositories are only batched when a shared one exists
+    batch_public = client_pool.has_shared()
 
-async def rescan_index_values(force: bool, db: Session, auth_key: bytes) -> None:
-    new_index_entries = fetch_index_new_entries(db, auth_key)
-    async for entry in new_index_entries:
-        table_entry = Index(repo_id=entry.repo_id, compose_path=entry.compose_path,
-                            indexed_at=datetime.now(timezone.utc), updated_at=datetime.now(timezone.utc))
-        try:
-            existing_index = db.query(Index).filter(
-                Index.repo_id == table_entry.repo_id).first()
-            if existing_index:
-                if force:
-                    existing_index.compose_path = table_entry.compose_path
-                    existing_index.updated_at = datetime.now(timezone.utc)
-                    db.add(existing_index)
+    try:
+        plan = await db.stream(plan_rescan(force, repo_ids))
+        async for row in plan:
+            cred = None
+            if row.credentials_name:
+                if row.cred_id is None:
+                    logger.warning(
+                        f"Indexing of {row.name} failed: Credentials for {row.credentials_name} not found")
+                    progress.failed += 1
+                    continue
+                cred = RepoCredentialsModel(id=row.cred_id, name=row.credentials_name, username=row.username,
+                                            password=row.password, token=row.token)
+
+            repo = RescanRepositoryModel(id=row.id, url=row.url, branch=row.branch, name=row.name,
+                                         compose_folder=row.compose_folder, credentials_name=row.credentials_name,
+                                         indexed_at=row.indexed_at, updated_at=row.updated_at,
+                                         commit_sha=row.commit_sha, known_blobs=_known_blobs(row.known_blobs))
+            limit_key = row.credentials_name or ""
+            # credentials without a token (username and password) cannot query GraphQL
+            if batched and (bool(cred.token) if cred else batch_public):
+                _, group = batches.setdefault(limit_key, (cred, []))
+                group.append(repo)
+                if len(group) < GITHUB_GRAPHQL_BATCH_SIZE:
+                    continue
+                del batches[limit_key]
+                launch(group, cred, limit_key, batch=True)
             else:
-                db.add(table_entry)
-        except HTTPException:
-            db.rollback()
+                launch([repo], cred, limit_key, batch=False)
+
+            if len(pending) >= window:
+                async for result in completed():
+                    yield result
+
+        # partial batches go out once the work list is exhausted
+        for limit_key, (cred, group) in batches.items():
+            launch(group, cred, limit_key, batch=True)
+        batches.clear()
+
+        # yield entries in completion order so they can be written while slower repos are still fetching
+        while pending:
+            async for result in completed():
+                yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def rescan_index_values(force: bool, db: AsyncSession, auth_key: bytes, progress: RescanProgressModel | None = None,
+                              repo_ids: list[str] | None = None, deferred: list[str] | None = None) -> RescanProgressModel:
+    """
+    Fetch and store the compose files of the planned repositories.
+
+    progress is updated while the rescan runs, so a caller can report it before the rescan returns.
+    Ids of repositories held back by a rate limit are appended to deferred.
+    """
+    progress = progress or RescanProgressModel()
+    # the work list keeps a cursor open on db, results are written through their own session
+    async with AsyncSession(bind=db.bind, expire_on_commit=False) as writer:
+        batch: list[RepoIndexResultModel] = []
+        written = False
+        try:
+            async for result in fetch_index_new_entries(force, db, auth_key, progress, repo_ids, deferred):
+                batch.append(result)
+                if len(batch) >= RESCAN_WRITE_BATCH_SIZE:
+                    await write_index_results(batch, writer)
+                    await read_cache.bump(writer, Index.__tablename__)
+                    # commit per batch so finished repos are persisted even if a later one fails
+                    await writer.commit()
+                    progress.done += len(batch)
+                    written = True
+                    batch = []
+            await write_index_results(batch, writer)
+            if batch:
+                await read_cache.bump(writer, Index.__tablename__)
+            await writer.commit()
+            progress.done += len(batch)
+            if written or batch:
+                # once per rescan, the sweep reads every blob, and in its own transaction so it cannot undo a batch
+                await delete_unreferenced_blobs(writer)
+                await writer.commit()
+        except IntegrityError:
+            await writer.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                detail="rescan_index_values failed during the add of new entry")
-    try:
-        db.commit()
-    except HTTPException:
-        db.rollback()
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail="rescan_index_values failed during the commit of new entries")
+                                detail="rescan_index_values failed during the commit of new entries")
+
+    return progress
@@ -0,0 +1,126 @@
+import asyncio
+
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from typing import Any
+from uuid import uuid4
+
+from fastapi import HTTPException
+from loguru import logger
+
+from core.config import RESCAN_JOB_HISTORY
+from core.metrics import RESCAN_DURATION, RESCAN_REPOS
+from core.tracing import trace
+from models.indexer import RescanJobModel
+
+from services.indexer import rescan_index_values
+
+
+class RescanJobManager:
+    """
+    Runs rescans as background jobs, one at a time, outside of the HTTP requests that submit them.
+
+    Jobs live in memory: ids are only known to the process that created them.
+    """
+
+    def __init__(self, db: Any, auth_key: bytes, history: int = RESCAN_JOB_HISTORY) -> None:
+        self.db = db
+        self.auth_key = auth_key
+        self.history = history
+        self._jobs: OrderedDict[str, RescanJobModel] = OrderedDict()
+        self._queue: asyncio.Queue[RescanJobModel] = asyncio.Queue()
+        self._worker: asyncio.Task[None] | None = None
+        self._scheduler: asyncio.Task[None] | None = None
+        self._retries: set[asyncio.Task[None]] = set()
+
+    def submit(self, force: bool = False, repo_ids: list[str] | None = None, trigger: str = "api") -> tuple[RescanJobModel, bool]:
+        """Queue a rescan, or return the identical job already waiting. The flag tells whether a job was created."""
+        if repo_ids is not None:
+            repo_ids = sorted(set(repo_ids))
+        for job in self._jobs.values():
+            if job.status == "pending" and job.force == force and job.repo_ids == repo_ids:
+                return job, False
+
+        job = RescanJobModel(id=str(uuid4()), trigger=trigger, force=force, repo_ids=repo_ids,
+                             created_at=datetime.now(timezone.utc))
+        self._jobs[job.id] = job
+        self._prune()
+        self._queue.put_nowait(job)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return job, True
+
+    def get(self, job_id: str) -> RescanJobModel | None:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list[RescanJobModel]:
+        return list(reversed(self._jobs.values()))
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.status in ("completed", "failed")]
+        for job_id in finished[:max(len(self._jobs) - self.history, 0)]:
+            del self._jobs[job_id]
+
+    async def _run(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = datetime.now(timezone.utc)
+            deferred: list[str] = []
+            try:
+                with trace("rescan", job.id, trigger=job.trigger, force=job.force):
+                    async with self.db.get_async_session() as session:
+                        await rescan_index_values(job.force, session, self.auth_key, job.progress, job.repo_ids,
+                                                  deferred)
+                job.status = "completed"
+                if deferred and job.progress.retry_at:
+                    self._retry_later(job, deferred, job.progress.retry_at)
+            except Exception as e:
+                job.status = "failed"
+                job.error = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Rescan job {job.id} failed: {job.error}")
+            finally:
+                job.finished_at = datetime.now(timezone.utc)
+                RESCAN_DURATION.labels(job.trigger, job.status).observe(
+                    (job.finished_at - job.started_at).total_seconds())
+                for outcome in ("done", "failed", "skipped", "deferred"):
+                    RESCAN_REPOS.labels(outcome).inc(getattr(job.progress, outcome))
+                self._queue.task_done()
+
+    def _retry_later(self, job: RescanJobModel, repo_ids: Sequence[str], retry_at: datetime) -> None:
+        delay = max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        logger.info(f"Rescan job {job.id} deferred {len(repo_ids)} repositories for {delay:.0f}s")
+
+        async def retry() -> None:
+            await asyncio.sleep(delay)
+            self.submit(job.force, [*repo_ids], trigger="retry")
+
+        task = asyncio.create_task(retry())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def join(self) -> None:
+        """Wait until every queued job has finished."""
+        await self._queue.join()
+
+    def start_scheduler(self, interval: float) -> None:
+        if interval > 0 and self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule(interval))
+
+    async def _schedule(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.submit(trigger="schedule")
+
+    async def shutdown(self) -> None:
+        for task in (self._scheduler, self._worker, *self._retries):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._scheduler = None
+        self._worker = None
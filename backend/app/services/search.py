@@ -0,0 +1,125 @@
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.paginator import PageModel, PageParams, decode_cursor, encode_cursor
+
+SNIPPET_TOKENS = 16
+SNIPPET_OPEN = "["
+SNIPPET_CLOSE = "]"
+
+# matching blobs are resolved to index entries of existing repositories, so inserts, updates and deletes
+# of Index are reflected without touching compose_fts, which only changes when a blob is stored or swept
+SEARCH_QUERIES = {
+    "sqlite": """
+        SELECT * FROM (
+            SELECT i.id AS index_id, r.id AS repo_id, r.name AS repo_name, r.branch AS branch,
+                   i.compose_hash AS compose_hash, bm25(compose_fts) AS rank
+            FROM compose_fts
+            JOIN "index" AS i ON i.compose_hash = compose_fts.hash
+            JOIN repos AS r ON r.id = i.repo_id
+            WHERE compose_fts MATCH :query
+        ) AS matches
+        WHERE :after_rank IS NULL OR rank > :after_rank OR (rank = :after_rank AND index_id > :after_id)
+        ORDER BY rank, index_id
+        LIMIT :limit
+    """,
+    "postgresql": """
+        SELECT * FROM (
+            SELECT i.id AS index_id, r.id AS repo_id, r.name AS repo_name, r.branch AS branch,
+                   i.compose_hash AS compose_hash,
+                   -ts_rank(to_tsvector('simple', f.content), websearch_to_tsquery('simple', :query)) AS rank
+            FROM compose_fts AS f
+            JOIN "index" AS i ON i.compose_hash = f.hash
+            JOIN repos AS r ON r.id = i.repo_id
+            WHERE to_tsvector('simple', f.content) @@ websearch_to_tsquery('simple', :query)
+        ) AS matches
+        WHERE CAST(:after_rank AS DOUBLE PRECISION) IS NULL OR rank > :after_rank
+              OR (rank = :after_rank AND index_id > :after_id)
+        ORDER BY rank, index_id
+        LIMIT :limit
+    """,
+}
+
+# snippets are only built for the blobs of the returned page
+SNIPPET_QUERIES = {
+    "sqlite": f"""
+        SELECT hash, snippet(compose_fts, 1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '...', {SNIPPET_TOKENS}) AS snippet
+        FROM compose_fts
+        WHERE compose_fts MATCH :query AND hash IN :hashes
+    """,
+    "postgresql": f"""
+        SELECT hash, ts_headline('simple', content, websearch_to_tsquery('simple', :query),
+                                 'StartSel={SNIPPET_OPEN}, StopSel={SNIPPET_CLOSE}, MaxWords={SNIPPET_TOKENS}, MinWords=4')
+               AS snippet
+        FROM compose_fts
+        WHERE hash IN :hashes
+    """,
+}
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turn user input into an FTS5 query: every word has to match, a trailing * matches a prefix.
+
+    Words are quoted, so characters like - or : are searched for instead of being parsed as operators.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*") if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+async def store_search_content(contents: dict[str, str], db: AsyncSession) -> None:
+    """Add newly stored compose blobs to the search table."""
+    if not contents or db.get_bind().dialect.name not in SEARCH_QUERIES:
+        return
+    await db.execute(text("INSERT INTO compose_fts (hash, content) VALUES (:hash, :content)"),
+                     [{"hash": blob_hash, "content": content} for blob_hash, content in contents.items()])
+
+
+async def delete_unreferenced_search_content(db: AsyncSession) -> None:
+    """Drop the search content of blobs no index entry uses anymore."""
+    if db.get_bind().dialect.name not in SEARCH_QUERIES:
+        return
+    await db.execute(text("""
+        DELETE FROM compose_fts
+        WHERE hash NOT IN (SELECT compose_hash FROM "index" WHERE compose_hash IS NOT NULL)
+    """))
+
+
+async def search_index(query: str, page: PageParams, db: AsyncSession) -> PageModel[dict[str, Any]]:
+    """Index entries whose compose file matches query, best match first, with a highlighted snippet each."""
+    dialect = db.get_bind().dialect.name
+    if dialect not in SEARCH_QUERIES:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=f"Search is not available on {dialect}")
+
+    match = build_match_query(query) if dialect == "sqlite" else query
+    if not match:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Empty search query")
+
+    after_rank, after_id = decode_cursor(page.cursor) if page.cursor else (None, None)
+    limit = page.limit if page.limit is not None else 20
+    result = await db.execute(text(SEARCH_QUERIES[dialect]), {
+        "query": match, "after_rank": after_rank, "after_id": after_id, "limit": limit + 1})
+    rows = [dict(row._mapping) for row in result]
+
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = encode_cursor(rows[-1]["rank"], rows[-1]["index_id"])
+
+    if rows:
+        snippets_stmt = text(SNIPPET_QUERIES[dialect]).bindparams(bindparam("hashes", expanding=True))
+        snippets = {row.hash: row.snippet for row in await db.execute(snippets_stmt, {
+            "query": match, "hashes": list({row["compose_hash"] for row in rows})})}
+        for row in rows:
+            row["snippet"] = snippets.get(row["compose_hash"], "")
+
+    return PageModel(items=rows, next_cursor=cursor)
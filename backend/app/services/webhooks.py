@@ -0,0 +1,134 @@
+import hashlib
+import hmac
+import re
+
+from typing import Any
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import COMPOSE_DISCOVERY
+from database import Repos
+from models.indexer import PushEventModel
+from utilities.compose_discovery import is_compose_file
+
+# GitHub only lists the first commits of a push and GitLab the last ones
+MAX_LISTED_COMMITS = 20
+
+_SCP_URL = re.compile(r"^(?:[^@/]+@)?([^:/]+):(?!//)(.+)$")
+
+
+def verify_signature(secret: str, body: bytes, headers: dict[str, str]) -> bool:
+    """
+    Check the signature of a webhook delivery.
+
+    GitHub and Gitea sign the body with HMAC-SHA256 (X-Hub-Signature-256, X-Gitea-Signature),
+    GitLab sends the shared secret itself (X-Gitlab-Token).
+    """
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    signature = headers.get("x-hub-signature-256")
+    if signature is not None:
+        return hmac.compare_digest(signature, f"sha256={expected}")
+    signature = headers.get("x-gitea-signature")
+    if signature is not None:
+        return hmac.compare_digest(signature, expected)
+    token = headers.get("x-gitlab-token")
+    if token is not None:
+        return hmac.compare_digest(token.encode("utf-8"), secret.encode("utf-8"))
+    return False
+
+
+def normalize_url(url: str) -> str:
+    """host/path of a repository url, so https, ssh and scp-like urls of one repository compare equal."""
+    url = url.strip()
+    scp = _SCP_URL.match(url)
+    if scp and "://" not in url:
+        host, path = scp.groups()
+    else:
+        parts = urlsplit(url)
+        host, path = parts.hostname or "", parts.path
+    path = path.strip("/")
+    if path.endswith(".git"):
+        path = path[:-4]
+    return f"{host.lower()}/{path}"
+
+
+def url_variants(url: str) -> set[str]:
+    """Spellings a repository url may be stored with, to look it up through the url index."""
+    normalized = normalize_url(url)
+    host, _, path = normalized.partition("/")
+    variants = {url}
+    for suffix in ("", ".git", "/"):
+        variants.update({f"https://{normalized}{suffix}", f"http://{normalized}{suffix}",
+                         f"ssh://git@{normalized}{suffix}"})
+    variants.update({f"git@{host}:{path}", f"git@{host}:{path}.git"})
+    return variants
+
+
+def parse_push_event(payload: dict[str, Any]) -> PushEventModel:
+    """
+    Read a push event of GitHub, Gitea or GitLab, or a generic {"url", "branch", "paths"} payload.
+
+    Raises HTTPException 400 when the payload is not a branch push.
+    """
+    if "repository" in payload or "project" in payload:
+        project = payload.get("project") or {}
+        repository = payload.get("repository") or {}
+        urls = [value for value in (
+            repository.get("clone_url"), repository.get("html_url"), repository.get("ssh_url"),
+            repository.get("git_http_url"), repository.get("git_ssh_url"),
+            project.get("git_http_url"), project.get("git_ssh_url"), project.get("web_url"),
+        ) if isinstance(value, str) and value]
+        ref = str(payload.get("ref") or "")
+        if not ref.startswith("refs/heads/"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Not a branch push")
+
+        commits = payload.get("commits") or []
+        total = payload.get("total_commits_count", payload.get("size", len(commits)))
+        changed_paths: list[str] | None = None
+        if len(commits) < MAX_LISTED_COMMITS and total == len(commits):
+            changed_paths = sorted({path for commit in commits
+                                    for key in ("added", "modified", "removed")
+                                    for path in commit.get(key) or []})
+        # a push creating a branch lists no commits, the whole tree is new
+        if payload.get("created") or str(payload.get("before", "")).strip("0") == "":
+            changed_paths = None
+        deleted = bool(payload.get("deleted")) or str(payload.get("after", "x")).strip("0") == ""
+        return PushEventModel(urls=urls, branch=ref.removeprefix("refs/heads/"), deleted=deleted,
+                              changed_paths=changed_paths)
+
+    url, branch = payload.get("url"), payload.get("branch")
+    if not isinstance(url, str) or not isinstance(branch, str):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Push payload needs url and branch")
+    paths = payload.get("paths")
+    return PushEventModel(urls=[url], branch=branch,
+                          changed_paths=[str(path) for path in paths] if isinstance(paths, list) else None)
+
+
+def touches_compose_folder(compose_folder: str | None, changed_paths: list[str] | None) -> bool:
+    if changed_paths is None:
+        return True
+    if COMPOSE_DISCOVERY:
+        # the files a rescan would index, added, changed or removed
+        return any(is_compose_file(path, compose_folder) for path in changed_paths)
+    folder = (compose_folder or "").strip("/")
+    if not folder:
+        # the compose file lives in the repository root, only root files matter
+        return any("/" not in path for path in changed_paths)
+    return any(path == folder or path.startswith(folder + "/") for path in changed_paths)
+
+
+async def find_pushed_repos(event: PushEventModel, db: AsyncSession) -> tuple[list[str], int]:
+    """Ids of the repositories a push affects, and the number of repositories matching url and branch."""
+    variants = set().union(*(url_variants(url) for url in event.urls)) if event.urls else set()
+    normalized = {normalize_url(url) for url in event.urls}
+    result = await db.execute(
+        select(Repos.id, Repos.url, Repos.compose_folder)
+        .where(Repos.url.in_(variants), Repos.branch == event.branch))
+    rows = [row for row in result if normalize_url(row.url) in normalized]
+    affected = [row.id for row in rows if touches_compose_folder(row.compose_folder, event.changed_paths)]
+    return affected, len(rows)
@@ -0,0 +1,55 @@
+import posixpath
+
+from collections.abc import Callable, Iterable
+from fnmatch import fnmatchcase
+
+from core.config import COMPOSE_FILE_PATTERNS
+from models.indexer import NewIndexEntryModel, RepoCredentialsModel, RepoIndexResultModel, RepositoryModel
+from models.indexer import RescanRepositoryModel
+
+# (path, git blob id) of every file in a commit
+TreeLister = Callable[[RepositoryModel, RepoCredentialsModel | None, bytes, str], list[tuple[str, str]]]
+# content of a git blob
+BlobReader = Callable[[RepositoryModel, RepoCredentialsModel | None, bytes, str], str]
+# commit SHA of the branch head
+HeadResolver = Callable[[RepositoryModel, RepoCredentialsModel | None, bytes], str | None]
+
+
+def is_compose_file(path: str, compose_folder: str | None, patterns: Iterable[str] = COMPOSE_FILE_PATTERNS) -> bool:
+    """Whether path is below compose_folder (at any depth, anywhere when empty) and its file name matches a pattern."""
+    folder = (compose_folder or "").strip("/")
+    return ((not folder or path.startswith(folder + "/"))
+            and any(fnmatchcase(posixpath.basename(path), pattern) for pattern in patterns))
+
+
+def select_compose_files(tree: Iterable[tuple[str, str]], compose_folder: str | None,
+                         patterns: Iterable[str] = COMPOSE_FILE_PATTERNS) -> dict[str, str]:
+    """Compose files of a tree listing, as chosen by is_compose_file."""
+    patterns = list(patterns)
+    return {path: blob_sha for path, blob_sha in tree if is_compose_file(path, compose_folder, patterns)}
+
+
+def discover_index_entries(resolver: HeadResolver, lister: TreeLister, reader: BlobReader,
+                           repo: RescanRepositoryModel, credentials: RepoCredentialsModel | None,
+                           auth_key: bytes) -> RepoIndexResultModel | None:
+    """
+    Index every compose file of repo with one tree listing per new commit.
+
+    Returns None while the branch head is still repo.commit_sha (or cannot be resolved), and only reads the blobs
+    whose id differs from repo.known_blobs.
+    """
+    commit_sha = resolver(repo, credentials, auth_key)
+    # an unknown branch keeps its entries, like a missing compose file outside of discovery
+    if commit_sha is None or commit_sha == repo.commit_sha:
+        return None
+
+    files = select_compose_files(lister(repo, credentials, auth_key, commit_sha), repo.compose_folder)
+    result = RepoIndexResultModel(repo_id=repo.id, commit_sha=commit_sha)
+    for path, blob_sha in sorted(files.items()):
+        if repo.known_blobs.get(path) == blob_sha:
+            result.unchanged_paths.append(path)
+            continue
+        result.entries.append(NewIndexEntryModel(
+            repo_id=repo.id, path=path, compose_path=reader(repo, credentials, auth_key, blob_sha),
+            commit_sha=commit_sha, blob_sha=blob_sha))
+    return result
@@ -0,0 +1,159 @@
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class ComposeServiceModel(BaseModel):
+    service: str
+    image: str | None = None
+    image_name: str | None = None
+    image_tag: str | None = None
+
+
+class ComposePortModel(BaseModel):
+    service: str
+    published: int | None = None
+    target: int | None = None
+    protocol: str = "tcp"
+
+
+class ComposeVolumeModel(BaseModel):
+    service: str | None = None  # None for top-level named volumes
+    source: str | None = None
+    target: str | None = None
+    type: str = "volume"
+
+
+class ComposeNetworkModel(BaseModel):
+    service: str | None = None  # None for top-level networks
+    network: str
+
+
+class ParsedComposeModel(BaseModel):
+    services: list[ComposeServiceModel] = []
+    ports: list[ComposePortModel] = []
+    volumes: list[ComposeVolumeModel] = []
+    networks: list[ComposeNetworkModel] = []
+
+
+# ranges like 8000-8100:8000-8100 are expanded up to this many ports
+MAX_PORT_RANGE = 1024
+
+
+def split_image(image: str) -> tuple[str, str | None]:
+    """Split an image reference into name and tag (or digest), "nginx:1.25" -> ("nginx", "1.25")."""
+    if "@" in image:
+        name, digest = image.split("@", 1)
+        return name, digest
+    # a colon before the last slash belongs to a registry port
+    slash = image.rfind("/")
+    colon = image.rfind(":")
+    if colon > slash:
+        return image[:colon], image[colon + 1:]
+    return image, None
+
+
+def _port_range(value: str) -> list[int | None]:
+    if not value:
+        return [None]
+    if "-" in value:
+        start, end = (int(part) for part in value.split("-", 1))
+        return list(range(start, min(end, start + MAX_PORT_RANGE - 1) + 1))
+    return [int(value)]
+
+
+def parse_port(service: str, port: Any) -> list[ComposePortModel]:
+    if isinstance(port, dict):
+        published = port.get("published")
+        return [ComposePortModel(service=service,
+                                 published=int(published) if published not in (None, "") else None,
+                                 target=int(port["target"]) if port.get(
+                                     "target") is not None else None,
+                                 protocol=str(port.get("protocol") or "tcp"))]
+
+    spec = str(port)
+    protocol = "tcp"
+    if "/" in spec:
+        spec, protocol = spec.rsplit("/", 1)
+    # [host_ip:][published:]target, the host ip may itself be an IPv6 address in brackets
+    parts = spec.rsplit(":", 2) if not spec.startswith("[") else [
+        spec[:spec.index("]") + 1], *spec[spec.index("]") + 2:].split(":")]
+    target = parts[-1]
+    published = parts[-2] if len(parts) >= 2 else ""
+
+    targets = _port_range(target)
+    publisheds = _port_range(published)
+    if len(publisheds) == 1:
+        publisheds = publisheds * len(targets)
+    if len(targets) == 1:
+        targets = targets * len(publisheds)
+    return [ComposePortModel(service=service, published=p, target=t, protocol=protocol)
+            for p, t in zip(publisheds, targets)]
+
+
+def parse_volume(service: str, volume: Any) -> ComposeVolumeModel:
+    if isinstance(volume, dict):
+        return ComposeVolumeModel(service=service, source=volume.get("source"), target=volume.get("target"),
+                                  type=str(volume.get("type") or "volume"))
+
+    parts = str(volume).split(":")
+    if len(parts) == 1:
+        # anonymous volume
+        return ComposeVolumeModel(service=service, target=parts[0])
+    source = parts[0]
+    is_bind = source.startswith((".", "/", "~", "$"))
+    return ComposeVolumeModel(service=service, source=source, target=parts[1], type="bind" if is_bind else "volume")
+
+
+def parse_compose(content: str) -> ParsedComposeModel:
+    """
+    Extract services, images, published ports, volumes and networks from a compose file.
+
+    Raises ValueError when the content is not a compose mapping.
+    """
+    import yaml
+
+    try:
+        document = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise ValueError(f"Invalid YAML: {e}")
+    if not isinstance(document, dict):
+        raise ValueError("Compose file is not a mapping")
+
+    parsed = ParsedComposeModel()
+    services = document.get("services") or {}
+    if not isinstance(services, dict):
+        raise ValueError("services is not a mapping")
+
+    for name, definition in services.items():
+        name = str(name)
+        definition = definition if isinstance(definition, dict) else {}
+
+        image = definition.get("image")
+        if image:
+            image_name, image_tag = split_image(str(image))
+            parsed.services.append(ComposeServiceModel(service=name, image=str(image),
+                                                       image_name=image_name, image_tag=image_tag))
+        else:
+            parsed.services.append(ComposeServiceModel(service=name))
+
+        for port in definition.get("ports") or []:
+            try:
+                parsed.ports.extend(parse_port(name, port))
+            except (ValueError, KeyError, IndexError):
+                continue
+
+        for volume in definition.get("volumes") or []:
+            parsed.volumes.append(parse_volume(name, volume))
+
+        networks = definition.get("networks") or []
+        for network in (networks.keys() if isinstance(networks, dict) else networks):
+            parsed.networks.append(ComposeNetworkModel(
+                service=name, network=str(network)))
+
+    for volume in (document.get("volumes") or {}):
+        parsed.volumes.append(ComposeVolumeModel(source=str(volume)))
+    for network in (document.get("networks") or {}):
+        parsed.networks.append(ComposeNetworkModel(network=str(network)))
+
+    return parsed
@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import os
+import subprocess
+import threading
+
+from collections.abc import Sequence
+from pathlib import Path
+
+from fastapi import HTTPException, status
+from loguru import logger
+
+from core.config import GIT_ALLOWED_PROTOCOLS, GIT_COMMAND_TIMEOUT, GIT_MIRROR_ROOT
+from core.tracing import span
+from models.indexer import RepositoryModel, RepoCredentialsModel
+
+# characters git does not allow in a ref name, ':' also separates the two sides of a refspec
+INVALID_BRANCH_CHARACTERS = frozenset("~^:?*[\\")
+
+
+def check_remote(url: str, branch: str) -> None:
+    """Refuse a url or branch that git would read as an option, or a branch that is not a valid ref name."""
+    if url.startswith("-"):
+        raise ValueError(f"Repository url {url!r} starts with '-'")
+    if (not branch or branch.startswith(("-", "/", ".")) or branch.endswith(("/", ".", ".lock"))
+            or any(part in branch for part in ("..", "//", "@{", "/."))
+            or any(char in INVALID_BRANCH_CHARACTERS or char.isspace() or not char.isprintable() for char in branch)):
+        raise ValueError(f"Invalid branch name {branch!r}")
+
+
+class GitMirrorStore:
+    """
+    Local bare mirrors of the indexed repositories, one per repository url.
+
+    Every update fetches only the tracked branch, so after the first clone a rescan
+    transfers the new objects and compose files are read from the local object database.
+    """
+
+    def __init__(self, root: str, protocols: Sequence[str] = GIT_ALLOWED_PROTOCOLS) -> None:
+        self.root = Path(root)
+        self.protocols = list(protocols)
+        self._lock = threading.Lock()
+        self._mirror_locks: dict[str, threading.Lock] = {}
+
+    def mirror_path(self, url: str) -> Path:
+        return self.root / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.git"
+
+    def _mirror_lock(self, path: Path) -> threading.Lock:
+        with self._lock:
+            return self._mirror_locks.setdefault(str(path), threading.Lock())
+
+    @staticmethod
+    def _auth_env(credentials: RepoCredentialsModel | None, auth_key: bytes) -> dict[str, str]:
+        env = {"GIT_TERMINAL_PROMPT": "0"}
+        if not credentials:
+            return env
+
+        secret = credentials.token or credentials.password
+        if not secret:
+            return env
+        from cryptography.fernet import Fernet
+
+        with span("crypto.decrypt"):
+            decrypted = Fernet(auth_key).decrypt(secret).decode('utf-8')
+        basic = base64.b64encode(
+            f"{credentials.username}:{decrypted}".encode('utf-8')).decode('ascii')
+        # pass the header through the environment so the secret never shows up in the process list
+        env.update({
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {basic}",
+        })
+        return env
+
+    def _env(self, env: dict[str, str] | None = None) -> dict[str, str]:
+        # urls are stored by API users, git must not reach the server's filesystem or run helpers for them
+        return {**os.environ, "GIT_ALLOW_PROTOCOL": ":".join(self.protocols), **(env or {})}
+
+    def _git(self, git_dir: Path, *args: str, env: dict[str, str] | None = None) -> subprocess.CompletedProcess[bytes]:
+        with span("git", **{"git.command": args[0] if args else ""}):
+            return subprocess.run(
+                ["git", f"--git-dir={git_dir}", *args],
+                capture_output=True,
+                timeout=GIT_COMMAND_TIMEOUT,
+                env=self._env(env),
+                check=False,
+            )
+
+    def update(self, url: str, branch: str, credentials: RepoCredentialsModel | None, auth_key: bytes) -> Path:
+        check_remote(url, branch)
+        path = self.mirror_path(url)
+        with self._mirror_lock(path):
+            if not path.exists():
+                self.root.mkdir(parents=True, exist_ok=True)
+                init = subprocess.run(["git", "init", "--bare", "--quiet", "--", str(path)],
+                                      capture_output=True, timeout=GIT_COMMAND_TIMEOUT, check=False,
+                                      env=self._env())
+                if init.returncode != 0:
+                    raise RuntimeError(init.stderr.decode('utf-8', 'replace').strip())
+                self._git(path, "remote", "add", "--", "origin", url)
+
+            fetch = self._git(path, "fetch", "--quiet", "--prune", "--no-tags", "origin",
+                              f"+refs/heads/{branch}:refs/heads/{branch}",
+                              env=self._auth_env(credentials, auth_key))
+            if fetch.returncode != 0:
+                raise RuntimeError(fetch.stderr.decode('utf-8', 'replace').strip())
+        return path
+
+    def remote_head(self, url: str, branch: str, credentials: RepoCredentialsModel | None, auth_key: bytes) -> str | None:
+        """Commit SHA of the remote branch, a single ref advertisement without fetching any objects."""
+        check_remote(url, branch)
+        ls_remote = subprocess.run(["git", "ls-remote", "--heads", "--", url, f"refs/heads/{branch}"],
+                                   capture_output=True, timeout=GIT_COMMAND_TIMEOUT, check=False,
+                                   env=self._env(self._auth_env(credentials, auth_key)))
+        if ls_remote.returncode != 0:
+            raise RuntimeError(ls_remote.stderr.decode('utf-8', 'replace').strip())
+        for line in ls_remote.stdout.decode('utf-8').splitlines():
+            sha, _, ref = line.partition("\t")
+            if ref == f"refs/heads/{branch}":
+                return sha
+        return None
+
+    def list_tree(self, path: Path, commit_sha: str) -> list[tuple[str, str]]:
+        ls_tree = self._git(path, "ls-tree", "-r", "-z", "--full-tree", commit_sha)
+        if ls_tree.returncode != 0:
+            raise RuntimeError(ls_tree.stderr.decode('utf-8', 'replace').strip())
+        files = []
+        for record in ls_tree.stdout.decode('utf-8').split("\0"):
+            info, _, file_path = record.partition("\t")
+            parts = info.split()
+            if len(parts) == 3 and parts[1] == "blob":
+                files.append((file_path, parts[2]))
+        return files
+
+    def read_blob(self, path: Path, blob_sha: str) -> str | None:
+        show = self._git(path, "cat-file", "blob", blob_sha)
+        if show.returncode != 0:
+            return None
+        return show.stdout.decode('utf-8')
+
+    def read(self, path: Path, branch: str, file_path: str) -> str | None:
+        show = self._git(path, "cat-file", "blob", f"refs/heads/{branch}:{file_path}")
+        if show.returncode != 0:
+            return None
+        return show.stdout.decode('utf-8')
+
+
+mirror_store = GitMirrorStore(GIT_MIRROR_ROOT)
+
+
+def fetch_compose_path(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes) -> str | None:
+    path = f"{repo.compose_folder}docker-compose.yml" if repo.compose_folder else "docker-compose.yml"
+
+    try:
+        mirror = mirror_store.update(repo.url, repo.branch, credentials, auth_key)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error updating mirror of repository {repo.url}: {str(e)}")
+
+    content = mirror_store.read(mirror, repo.branch, path)
+    if content is None:
+        logger.info(f"File {path} not found in repository {repo.url}/{repo.branch}")
+    return content
+
+
+def resolve_branch_head(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes) -> str | None:
+    try:
+        return mirror_store.remote_head(repo.url, repo.branch, credentials, auth_key)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error resolving branch {repo.branch} of repository {repo.url}: {str(e)}")
+
+
+def list_tree(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes,
+              commit_sha: str) -> list[tuple[str, str]]:
+    try:
+        mirror = mirror_store.update(repo.url, repo.branch, credentials, auth_key)
+        return mirror_store.list_tree(mirror, commit_sha)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error listing the tree of repository {repo.url}: {str(e)}")
+
+
+def read_blob(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes, blob_sha: str) -> str:
+    # list_tree has just fetched the commit, the blob is in the local object database
+    content = mirror_store.read_blob(mirror_store.mirror_path(repo.url), blob_sha)
+    if content is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error reading blob {blob_sha} from repository {repo.url}")
+    return content
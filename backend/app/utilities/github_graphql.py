@@ -0,0 +1,143 @@
+import json
+import time
+
+from typing import TYPE_CHECKING, Any, TypeAlias
+from urllib.parse import urlsplit, urlunsplit
+
+from fastapi import HTTPException, status
+
+from core.config import GITHUB_BASE_URL
+from core.metrics import observe_github_request
+from core.tracing import span
+from models.indexer import NewIndexEntryModel, RepoCredentialsModel, RepoIndexResultModel, RescanRepositoryModel
+from utilities.github_utils import client_pool, get_github_instance, git_blob_sha
+from utilities.rate_limit import rate_limiter
+
+if TYPE_CHECKING:
+    from github import Github
+
+# GraphQL has its own points quota, kept in a bucket next to the REST one of the same credential
+GRAPHQL_BUCKET = ":graphql"
+
+# result of one repository of a batch: its index result, None when skipped, or the error of that repository
+BatchOutcome: TypeAlias = RepoIndexResultModel | None | Exception
+
+
+def graphql_url(base_url: str | None = None) -> str:
+    """GraphQL endpoint of a REST base url, GitHub Enterprise serves it next to /api/v3."""
+    parts = urlsplit(base_url or GITHUB_BASE_URL)
+    path = parts.path.rstrip("/")
+    path = path.removesuffix("/v3") + "/graphql" if path.endswith("/api/v3") else path + "/graphql"
+    return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+
+def compose_file_path(repo: RescanRepositoryModel) -> str:
+    return f"{repo.compose_folder}docker-compose.yml" if repo.compose_folder else "docker-compose.yml"
+
+
+def build_batch_query(repos: list[RescanRepositoryModel]) -> tuple[str, dict[str, str]]:
+    """
+    One query reading the branch head and the compose file of every repository, each under its own alias.
+
+    Names, branches and paths are passed as variables, so they never have to be escaped into the query text.
+    """
+    declarations, fields, variables = [], [], {}
+    for i, repo in enumerate(repos):
+        owner, _, name = repo.name.partition("/")
+        variables.update({f"owner{i}": owner, f"name{i}": name, f"ref{i}": f"refs/heads/{repo.branch}",
+                          f"expr{i}": f"{repo.branch}:{compose_file_path(repo)}"})
+        declarations.append(f"$owner{i}: String!, $name{i}: String!, $ref{i}: String!, $expr{i}: String!")
+        fields.append(
+            f"r{i}: repository(owner: $owner{i}, name: $name{i}) {{ "
+            f"ref(qualifiedName: $ref{i}) {{ target {{ oid }} }} "
+            f"file: object(expression: $expr{i}) {{ ... on Blob {{ oid text isBinary isTruncated }} }} }}")
+    query = f"query Compose({', '.join(declarations)}) {{ {' '.join(fields)} }}"
+    return query, variables
+
+
+def parse_batch_result(repos: list[RescanRepositoryModel], data: dict[str, Any]) -> list[BatchOutcome]:
+    outcomes: list[BatchOutcome] = []
+    for i, repo in enumerate(repos):
+        node = data.get(f"r{i}")
+        # unknown repositories and branches are skipped like a missing file on the REST path
+        if not node or not node.get("ref"):
+            outcomes.append(None)
+            continue
+        commit_sha = node["ref"]["target"]["oid"]
+        if commit_sha == repo.commit_sha:
+            outcomes.append(None)
+            continue
+        blob = node.get("file")
+        if not blob:
+            # the file was deleted or moved, the indexed entry goes
+            outcomes.append(RepoIndexResultModel(repo_id=repo.id, commit_sha=commit_sha))
+            continue
+        # text is null for these as well, they are checked first so they fail instead of looking missing
+        if blob.get("isBinary") or blob.get("isTruncated"):
+            outcomes.append(HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                          detail=f"Compose file of {repo.name} is too large or binary"))
+            continue
+        if blob.get("text") is None:
+            outcomes.append(None)
+            continue
+        path = compose_file_path(repo)
+        entry = NewIndexEntryModel(repo_id=repo.id, path=path, compose_path=blob["text"], commit_sha=commit_sha,
+                                   blob_sha=blob.get("oid") or git_blob_sha(blob["text"]))
+        outcomes.append(RepoIndexResultModel(repo_id=repo.id, commit_sha=commit_sha, entries=[entry]))
+    return outcomes
+
+
+def _get_client(credentials: RepoCredentialsModel | None, auth_key: bytes) -> "tuple[Github, str]":
+    if credentials:
+        return get_github_instance(credentials, auth_key), credentials.id
+    # GraphQL needs a token, public repositories use the shared credential with the most points left
+    client: "tuple[Github, str] | None" = client_pool.get_for_public(auth_key, GRAPHQL_BUCKET, allow_anonymous=False)
+    if client is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="GraphQL requests need a token")
+    return client
+
+
+def make_index_batch(repos: list[RescanRepositoryModel], credentials: RepoCredentialsModel | None,
+                     auth_key: bytes) -> list[BatchOutcome]:
+    """
+    Index results of many repositories read with a single GraphQL request, in the order of repos.
+
+    All repositories share credentials; without credentials they have to be public.
+    """
+    gh_instance, key = _get_client(credentials, auth_key)
+    bucket = key + GRAPHQL_BUCKET
+    query, variables = build_batch_query(repos)
+
+    rate_limiter.acquire(bucket)
+    started_at = time.perf_counter()
+    try:
+        with span("github.request", **{"http.method": "POST", "http.url": graphql_url(), "github.bucket": bucket,
+                                       "github.batch_size": len(repos)}) as current:
+            response_status, response_headers, body = gh_instance.requester.requestJson(
+                "POST", graphql_url(), input={"query": query, "variables": variables})
+            if current is not None:
+                current.attributes["http.status_code"] = response_status
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"GraphQL request failed: {str(e)}")
+    observe_github_request(key, "graphql", response_status, time.perf_counter() - started_at)
+    rate_limiter.update(bucket, response_status, response_headers)
+
+    if response_status != status.HTTP_200_OK:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"GraphQL request failed: HTTP {response_status}")
+    try:
+        document = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="GraphQL answer is not JSON")
+
+    errors = [error for error in document.get("errors") or [] if error.get("type") != "NOT_FOUND"]
+    if any(error.get("type") == "RATE_LIMITED" for error in errors):
+        # GraphQL reports an exhausted quota in the body, closing the bucket raises RateLimitExceeded
+        rate_limiter.update(bucket, status.HTTP_403_FORBIDDEN, {"x-ratelimit-remaining": "0"})
+    if errors and not document.get("data"):
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"GraphQL request failed: {errors[0].get('message')}")
+    return parse_batch_result(repos, document.get("data") or {})
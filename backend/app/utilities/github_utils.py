@@ -1,24 +1,185 @@
-from cryptography.fernet import Fernet
+import hashlib
+import json
+import threading
+import time
+
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+from urllib.parse import quote
 
 from fastapi import HTTPException, status
-from github import Github, BadCredentialsException, UnknownObjectException, Auth
+from loguru import logger
+from sqlalchemy import event
+from urllib3.util import Retry
 
-from models.indexer import RepositoryModel, RepoCredentialsModel, NewIndexEntryModel
+from core.config import COMPOSE_DISCOVERY, GITHUB_BASE_URL, GITHUB_CACHE_PATH, GITHUB_CLIENT_VALIDATION_TTL
+from core.config import INDEX_FETCH_BACKEND
+from core.config import RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL
+from core.errors import RateLimitExceeded
+from core.metrics import observe_github_request
+from core.tracing import span
+from database import Credentials
+from models.indexer import RepositoryModel, RescanRepositoryModel, RepoCredentialsModel, NewIndexEntryModel
+from models.indexer import RepoIndexResultModel
+from utilities import git_mirror
+from utilities.compose_discovery import BlobReader, HeadResolver, TreeLister, discover_index_entries
+from utilities.http_cache import ConditionalRequestCache
+from utilities.rate_limit import ANONYMOUS, rate_limiter
 
+# PyGithub and cryptography are imported by the first client, startup does not need them
+if TYPE_CHECKING:
+    from github import Auth, Github
+
+
+class _PooledClient:
+    def __init__(self, token: bytes, instance: "Github") -> None:
+        self.token = token
+        self.instance = instance
+        self.validated_at = 0.0
+
+
+class GithubClientPool:
+    """
+    Long-lived GitHub clients keyed by credential id.
+
+    Each client keeps its decrypted token and its HTTP connection for the lifetime of the
+    process, and the token is only re-validated once the validation TTL has expired.
+    """
+
+    def __init__(self, validation_ttl: float = GITHUB_CLIENT_VALIDATION_TTL) -> None:
+        self.validation_ttl = validation_ttl
+        self._lock = threading.Lock()
+        self._clients: dict[str, _PooledClient] = {}
+        # held while a client of the credential is made or validated, a network round trip
+        self._credential_locks: dict[str, threading.Lock] = {}
+        self._anonymous: "Github | None" = None
+        # token credentials that may also read public repositories
+        self._shared: dict[str, RepoCredentialsModel] = {}
+
+    @staticmethod
+    def _new_client(auth: "Auth.Token | None" = None) -> "Github":
+        from github import Github
+
+        # requests are spread over threads by the rescan engine, so let every worker
+        # get its own keep-alive connection and skip PyGithub's built-in request spacing.
+        # Rate limits are handled by rate_limiter, PyGithub's own retry would sleep a worker until the reset.
+        return Github(auth=auth, base_url=GITHUB_BASE_URL, pool_size=RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL,
+                      seconds_between_requests=None,
+                      retry=Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504)))
+
+    def get_anonymous(self) -> "Github":
+        with self._lock:
+            if self._anonymous is None:
+                self._anonymous = self._new_client()
+            return self._anonymous
+
+    def _credential_lock(self, credentials_id: str) -> threading.Lock:
+        with self._lock:
+            return self._credential_locks.setdefault(credentials_id, threading.Lock())
+
+    def get(self, credentials: RepoCredentialsModel, auth_key: bytes) -> "Github":
+        from cryptography.fernet import Fernet
+        from github import Auth, BadCredentialsException
 
-def get_github_instance_by_token(credentials: RepoCredentialsModel, auth_key: bytes) -> Github:
-    try:
         if not credentials.token:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail="No token found in credentials")
-        fernet = Fernet(auth_key)
-        decrypted_token = fernet.decrypt(credentials.token).decode('utf-8')
-        auth = Auth.Token(decrypted_token)
-
-        gh_instance = Github(auth=auth)
-        # Test the credentials by fetching the authenticated user
-        gh_instance.get_user()
-        return gh_instance
+
+        # only callers of the same credential wait for its validation, the others go on
+        with self._credential_lock(credentials.id):
+            with self._lock:
+                client = self._clients.get(credentials.id)
+            # a rotated token shows up as a different ciphertext
+            if client is None or client.token != credentials.token:
+                if client is not None:
+                    client.instance.close()
+                with span("crypto.decrypt"):
+                    decrypted_token = Fernet(auth_key).decrypt(
+                        credentials.token).decode('utf-8')
+                client = _PooledClient(
+                    credentials.token, self._new_client(Auth.Token(decrypted_token)))
+                with self._lock:
+                    self._clients[credentials.id] = client
+
+            if not client.validated_at or time.monotonic() - client.validated_at > self.validation_ttl:
+                # Test the credentials by fetching the authenticated user
+                try:
+                    client.instance.get_user().login
+                except BadCredentialsException:
+                    with self._lock:
+                        if self._clients.get(credentials.id) is client:
+                            del self._clients[credentials.id]
+                    raise
+                client.validated_at = time.monotonic()
+
+            return client.instance
+
+    def share(self, credentials: list[RepoCredentialsModel]) -> None:
+        """Credentials whose quota may be spent on public repositories as well."""
+        with self._lock:
+            self._shared = {cred.id: cred for cred in credentials if cred.token}
+
+    def has_shared(self) -> bool:
+        with self._lock:
+            return bool(self._shared)
+
+    def get_for_public(self, auth_key: bytes, bucket_suffix: str = "",
+                       allow_anonymous: bool = True) -> "tuple[Github, str] | None":
+        """
+        Client for a public repository, on the shared credential (or anonymous access) with the most quota left.
+
+        bucket_suffix selects a separate quota, like the GraphQL one. None when no client is left.
+        """
+        from github import BadCredentialsException
+
+        with self._lock:
+            shared = dict(self._shared)
+        while True:
+            candidates = [*shared, ANONYMOUS] if allow_anonymous else list(shared)
+            if not candidates:
+                return None
+            key = rate_limiter.pick([candidate + bucket_suffix for candidate in candidates])
+            key = key.removesuffix(bucket_suffix) if bucket_suffix else key
+            if key == ANONYMOUS:
+                return self.get_anonymous(), ANONYMOUS
+            try:
+                return self.get(shared[key], auth_key), key
+            except (HTTPException, BadCredentialsException):
+                # an unusable token is not offered again until the next share
+                del shared[key]
+                with self._lock:
+                    self._shared.pop(key, None)
+
+    def invalidate(self, credentials_id: str | None = None) -> None:
+        with self._lock:
+            if credentials_id is None:
+                clients = list(self._clients.values())
+                self._clients.clear()
+                self._shared.clear()
+            else:
+                self._shared.pop(credentials_id, None)
+                removed = self._clients.pop(credentials_id, None)
+                clients = [removed] if removed else []
+        for client in clients:
+            client.instance.close()
+
+
+client_pool = GithubClientPool()
+
+
+@event.listens_for(Credentials, "after_update")
+@event.listens_for(Credentials, "after_delete")
+def _invalidate_pooled_client(_mapper: object, _connection: object, target: Credentials) -> None:
+    client_pool.invalidate(target.id)
+
+
+def get_github_instance_by_token(credentials: RepoCredentialsModel, auth_key: bytes) -> "Github":
+    from github import BadCredentialsException
+
+    try:
+        return client_pool.get(credentials, auth_key)
+    except HTTPException:
+        raise
     except BadCredentialsException:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="Invalid GitHub credentials")
@@ -27,46 +188,225 @@ def get_github_instance_by_token(credentials: RepoCredentialsModel, auth_key: by
                             detail=f"Error initializing GitHub instance: {str(e)}")
 
 
-def get_github_instance(credentials: RepoCredentialsModel, auth_key: bytes) -> Github:
+def get_github_instance(credentials: RepoCredentialsModel, auth_key: bytes) -> "Github":
     return get_github_instance_by_token(credentials, auth_key)
 
 
+_response_cache: ConditionalRequestCache | None = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ConditionalRequestCache | None:
+    global _response_cache
+    if not GITHUB_CACHE_PATH:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ConditionalRequestCache(GITHUB_CACHE_PATH)
+        return _response_cache
+
+
+def _get_client(credentials: RepoCredentialsModel | None, auth_key: bytes) -> "tuple[Github, str]":
+    """Client and rate-limit bucket key, repositories without credentials are spread over the shared ones."""
+    if credentials:
+        return get_github_instance(credentials, auth_key), credentials.id
+    client = client_pool.get_for_public(auth_key)
+    if client is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail="No GitHub client available")
+    return client
+
+
+def _conditional_get(gh_instance: "Github", bucket: str, url: str, parameters: dict[str, str],
+                     accept: str) -> tuple[int, str | None]:
+    """
+    GET url and answer from the response cache when GitHub replies 304 Not Modified.
+
+    A 304 answer is not counted against the rate limit, so always revalidate instead of re-downloading.
+    Raises RateLimitExceeded when the quota of bucket is used up.
+    """
+    cache = get_response_cache()
+    cache_key = ConditionalRequestCache.key(
+        bucket, accept, f"{url}?{'&'.join(f'{key}={value}' for key, value in parameters.items())}")
+    headers = {"Accept": accept}
+    if cache:
+        headers.update(cache.conditional_headers(cache_key))
+
+    rate_limiter.acquire(bucket)
+    started_at = time.perf_counter()
+    with span("github.request", **{"http.method": "GET", "http.url": url, "github.bucket": bucket}) as current:
+        response_status, response_headers, body = gh_instance.requester.requestJson(
+            "GET", url, parameters=parameters, headers=headers)
+        if current is not None:
+            current.attributes["http.status_code"] = response_status
+    observe_github_request(bucket, "rest", response_status, time.perf_counter() - started_at)
+    rate_limiter.update(bucket, response_status, response_headers)
+
+    if response_status == status.HTTP_304_NOT_MODIFIED and cache:
+        cached_body: str | None = cache.revalidated(cache_key)
+        if cached_body is not None:
+            return status.HTTP_200_OK, cached_body
+        # the cached entry vanished between the lookup and the answer, fetch it again unconditionally
+        cache.forget(cache_key)
+        return _conditional_get(gh_instance, bucket, url, parameters, accept)
+    if response_status != status.HTTP_200_OK:
+        if cache:
+            cache.forget(cache_key)
+        return response_status, None
+
+    if cache:
+        cache.store(cache_key, response_headers.get("etag"),
+                    response_headers.get("last-modified"), body)
+    return response_status, body
+
+
 def fetch_compose_path(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes) -> str | None:
     path = f"{repo.compose_folder}docker-compose.yml" if repo.compose_folder else "docker-compose.yml"
+    gh_instance, bucket = _get_client(credentials, auth_key)
+
+    try:
+        response_status, body = _conditional_get(gh_instance, bucket, f"/repos/{repo.name}/contents/{quote(path)}",
+                                                 {"ref": repo.branch}, "application/vnd.github.raw")
+    except RateLimitExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error reading file {path} from repository {repo.url}: {str(e)}")
+
+    if response_status == status.HTTP_404_NOT_FOUND:
+        logger.info(f"File {path} not found in repository {repo.url}/{repo.branch}")
+        return None
+    if response_status != status.HTTP_200_OK:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error reading file {path} from repository {repo.url}: HTTP {response_status}")
+    return body
 
-    if credentials:
-        gh_instance = get_github_instance(credentials, auth_key)
-    else:
-        gh_instance = Github()
 
-    print(gh_instance.get_repo(repo.name))
+def resolve_branch_head(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes) -> str | None:
+    """Commit SHA of the branch head, None when the branch cannot be resolved."""
+    gh_instance, bucket = _get_client(credentials, auth_key)
+
     try:
-        gh_repo = gh_instance.get_repo(repo.name)
-        file_content = gh_repo.get_contents(path, ref=repo.branch)
-        # PyGithub may return a single ContentFile or a list; handle both
-        if isinstance(file_content, list):
-            # take first item
-            content_item = file_content[0]
-        else:
-            content_item = file_content
-        # content_item is a ContentFile with decoded_content bytes
-        decoded_obj = getattr(content_item, "decoded_content", None)
-        if isinstance(decoded_obj, (bytes, bytearray)):
-            return bytes(decoded_obj).decode("utf-8")
-        # Unexpected type — treat as error
+        # the sha media type answers with the bare SHA, and with a 304 while the branch has not moved
+        response_status, body = _conditional_get(gh_instance, bucket,
+                                                 f"/repos/{repo.name}/commits/{quote(repo.branch, safe='')}",
+                                                 {}, "application/vnd.github.sha")
+    except RateLimitExceeded:
+        raise
+    except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"Unexpected content type for {path} from repository {repo.url}")
-    except UnknownObjectException:
-        print(f"File {path} not found in repository {repo.url}/{repo.branch}")
+                            detail=f"Error resolving branch {repo.branch} of repository {repo.url}: {str(e)}")
+
+    if response_status in (status.HTTP_404_NOT_FOUND, status.HTTP_422_UNPROCESSABLE_ENTITY):
         return None
+    if response_status != status.HTTP_200_OK or body is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error resolving branch {repo.branch} of repository {repo.url}: HTTP {response_status}")
+    return body.strip()
+
+
+def git_blob_sha(content: str) -> str:
+    """Object id git (and GitHub) gives to a file with this content."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def list_tree(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes,
+              commit_sha: str) -> list[tuple[str, str]]:
+    """Path and blob SHA of every file in the commit, from a single recursive tree call."""
+    gh_instance, bucket = _get_client(credentials, auth_key)
+
+    try:
+        # trees are immutable per commit, a cached listing is revalidated for free
+        response_status, body = _conditional_get(gh_instance, bucket, f"/repos/{repo.name}/git/trees/{commit_sha}",
+                                                 {"recursive": "1"}, "application/vnd.github+json")
+        tree = json.loads(body) if response_status == status.HTTP_200_OK and body else None
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"Error reading file {path} from repository {repo.url}: {str(e)}")
+                            detail=f"Error listing the tree of repository {repo.url}: {str(e)}")
 
+    if not isinstance(tree, dict):
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error listing the tree of repository {repo.url}: HTTP {response_status}")
+    if tree.get("truncated"):
+        logger.warning(f"Tree of {repo.name} is truncated, compose files in the remainder are not indexed")
+    return [(item["path"], item["sha"]) for item in tree.get("tree", []) if item.get("type") == "blob"]
 
-def make_index_entry(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes) -> NewIndexEntryModel | None:
-    compose_content = fetch_compose_path(repo, credentials, auth_key)
-    if compose_content is None:
+
+def fetch_blob(repo: RepositoryModel, credentials: RepoCredentialsModel | None, auth_key: bytes, blob_sha: str) -> str:
+    gh_instance, bucket = _get_client(credentials, auth_key)
+
+    try:
+        response_status, body = _conditional_get(gh_instance, bucket, f"/repos/{repo.name}/git/blobs/{blob_sha}",
+                                                 {}, "application/vnd.github.raw")
+    except RateLimitExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error reading blob {blob_sha} from repository {repo.url}: {str(e)}")
+
+    if response_status != status.HTTP_200_OK or body is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error reading blob {blob_sha} from repository {repo.url}: HTTP {response_status}")
+    return body
+
+
+FetchBackend = Callable[[RepositoryModel,
+                         RepoCredentialsModel | None, bytes], str | None]
+
+# the graphql backend batches in the rescan engine, single repositories go through REST
+FETCH_BACKENDS: dict[str, FetchBackend] = {
+    "github": fetch_compose_path,
+    "graphql": fetch_compose_path,
+    "git": git_mirror.fetch_compose_path,
+}
+HEAD_RESOLVERS: dict[str, HeadResolver] = {
+    "github": resolve_branch_head,
+    "graphql": resolve_branch_head,
+    "git": git_mirror.resolve_branch_head,
+}
+DISCOVERY_BACKENDS: dict[str, tuple[TreeLister, BlobReader]] = {
+    "github": (list_tree, fetch_blob),
+    "graphql": (list_tree, fetch_blob),
+    "git": (git_mirror.list_tree, git_mirror.read_blob),
+}
+
+
+def make_index_entry_with(backend: FetchBackend, resolver: HeadResolver, repo: RescanRepositoryModel,
+                          credentials: RepoCredentialsModel | None,
+                          auth_key: bytes) -> NewIndexEntryModel | RepoIndexResultModel | None:
+    """
+    Fetch the compose file of repo, or return None when the branch head is unknown or still repo.commit_sha.
+
+    A branch that moved and has no compose file any more gives a result without entries, which drops the indexed one.
+    """
+    # one cheap lookup per repository, content is only fetched once the branch moved
+    commit_sha = resolver(repo, credentials, auth_key)
+    if commit_sha is not None and commit_sha == repo.commit_sha:
         return None
 
-    return NewIndexEntryModel(repo_id=repo.id, compose_path=compose_content)
+    compose_content = backend(repo, credentials, auth_key)
+    if compose_content is None:
+        return RepoIndexResultModel(repo_id=repo.id, commit_sha=commit_sha) if commit_sha is not None else None
+
+    path = f"{repo.compose_folder}docker-compose.yml" if repo.compose_folder else "docker-compose.yml"
+    return NewIndexEntryModel(repo_id=repo.id, path=path, compose_path=compose_content,
+                              commit_sha=commit_sha, blob_sha=git_blob_sha(compose_content))
+
+
+def make_index_entry(repo: RescanRepositoryModel, credentials: RepoCredentialsModel | None,
+                     auth_key: bytes) -> NewIndexEntryModel | RepoIndexResultModel | None:
+    """
+    Index entry of the compose file of repo, or with COMPOSE_DISCOVERY the entries of all its compose files.
+    """
+    backend = FETCH_BACKENDS.get(INDEX_FETCH_BACKEND)
+    resolver = HEAD_RESOLVERS.get(INDEX_FETCH_BACKEND)
+    discovery = DISCOVERY_BACKENDS.get(INDEX_FETCH_BACKEND)
+    if backend is None or resolver is None or discovery is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Unknown index fetch backend {INDEX_FETCH_BACKEND}")
+    if COMPOSE_DISCOVERY:
+        return discover_index_entries(resolver, *discovery, repo, credentials, auth_key)
+    return make_index_entry_with(backend, resolver, repo, credentials, auth_key)
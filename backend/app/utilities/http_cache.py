@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from core.config import GITHUB_CACHE_MAX_AGE, GITHUB_CACHE_MAX_ENTRIES
+from models.indexer import CacheStatsModel
+
+# stores between two evictions, the size bound is allowed to overshoot by as many entries
+EVICT_INTERVAL = 100
+
+
+class CachedResponse(BaseModel):
+    etag: str | None
+    last_modified: str | None
+    body: str
+
+
+class ConditionalRequestCache:
+    """
+    SQLite-backed store of validators (ETag / Last-Modified) and bodies per credential, Accept header and URL.
+
+    A hit is a request answered with 304 and served from the stored body, a miss is a
+    request that had to download the full body.
+
+    Entries not used for max_age seconds are evicted, and the least recently used ones beyond max_entries.
+    """
+
+    def __init__(self, path: str, max_age: float = GITHUB_CACHE_MAX_AGE,
+                 max_entries: int = GITHUB_CACHE_MAX_ENTRIES) -> None:
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(responses)")}
+            if columns and "used_at" not in columns:
+                # entries of earlier releases are keyed without credential and Accept header, they cannot be used
+                self._connection.execute("DROP TABLE responses")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body TEXT NOT NULL, used_at REAL NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS ix_responses_used_at ON responses (used_at)")
+            self._evict()
+            self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self._stores = 0
+
+    @staticmethod
+    def key(credential: str, accept: str, url: str) -> str:
+        """Key of a response, bodies differ per Accept header and private content per credential."""
+        return f"{credential} {accept} {url}"
+
+    def lookup(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return CachedResponse(etag=row[0], last_modified=row[1], body=row[2])
+
+    def conditional_headers(self, key: str) -> dict[str, str]:
+        cached = self.lookup(key)
+        headers: dict[str, str] = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def store(self, key: str, etag: str | None, last_modified: str | None, body: str) -> None:
+        with self._lock:
+            self.misses += 1
+            if not (etag or last_modified):
+                return
+            self._connection.execute(
+                "INSERT INTO responses (key, etag, last_modified, body, used_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET etag = excluded.etag, "
+                "last_modified = excluded.last_modified, body = excluded.body, used_at = excluded.used_at",
+                (key, etag, last_modified, body, time.time()))
+            self._stores += 1
+            if self._stores % EVICT_INTERVAL == 0:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        self._connection.execute("DELETE FROM responses WHERE used_at < ?", (time.time() - self.max_age,))
+        self._connection.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def evict(self) -> None:
+        """Drop expired entries and the least recently used ones beyond max_entries."""
+        with self._lock:
+            self._evict()
+            self._connection.commit()
+
+    def revalidated(self, key: str) -> str | None:
+        cached = self.lookup(key)
+        if cached is None:
+            return None
+        with self._lock:
+            self.hits += 1
+            self._connection.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+        return cached.body
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key = ?", (key,))
+            self._connection.commit()
+
+    def stats(self) -> CacheStatsModel:
+        with self._lock:
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+            return CacheStatsModel(hits=self.hits, misses=self.misses, entries=entries)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
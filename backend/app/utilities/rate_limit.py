@@ -0,0 +1,146 @@
+import threading
+import time
+
+from collections.abc import Iterable, Iterator, Mapping
+
+from prometheus_client.core import GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+from pydantic import BaseModel
+
+from core.config import GITHUB_RATE_LIMIT_MAX_DELAY, GITHUB_RATE_LIMIT_PACING_FRACTION, GITHUB_RATE_LIMIT_RESERVE
+from core.errors import RateLimitExceeded
+from core.metrics import registry
+
+ANONYMOUS = "anonymous"
+# back-off of an exhausted bucket whose answers did not say when its window resets
+UNKNOWN_RESET_SECONDS = 60.0
+
+
+class RateLimitBucketModel(BaseModel):
+    key: str
+    limit: int | None = None  # unknown until the first response
+    remaining: int | None = None
+    reset_at: float = 0.0  # epoch seconds of the next quota window
+
+
+class RateLimiter:
+    """
+    Token bucket per credential (and one for anonymous access) filled from GitHub's rate-limit headers.
+
+    Every request takes a token before it is sent, the headers of the answer then correct the count.
+    Requests are spaced out once the bucket runs low, and refused with RateLimitExceeded when only
+    the reserve is left, instead of letting GitHub answer 403 until the window resets.
+    """
+
+    def __init__(self, reserve: int = GITHUB_RATE_LIMIT_RESERVE, pacing_fraction: float = GITHUB_RATE_LIMIT_PACING_FRACTION,
+                 max_delay: float = GITHUB_RATE_LIMIT_MAX_DELAY) -> None:
+        self.reserve = reserve
+        self.pacing_fraction = pacing_fraction
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._buckets: dict[str, RateLimitBucketModel] = {}
+
+    def _bucket(self, key: str, now: float) -> RateLimitBucketModel:
+        bucket = self._buckets.setdefault(key, RateLimitBucketModel(key=key))
+        if bucket.reset_at and bucket.reset_at <= now and bucket.limit is not None:
+            # a new window started, GitHub refills the whole quota at once
+            bucket.remaining = bucket.limit
+            bucket.reset_at = 0.0
+        return bucket
+
+    def acquire(self, key: str) -> None:
+        """Take a token from the bucket of key, sleeping first when the bucket runs low."""
+        with self._lock:
+            now = time.time()
+            bucket = self._bucket(key, now)
+            if bucket.remaining is None or bucket.limit is None:
+                return
+            if bucket.remaining <= self.reserve:
+                if not bucket.reset_at:
+                    # the bucket only refills at a reset, without one it would refuse (and be retried) forever
+                    bucket.reset_at = now + UNKNOWN_RESET_SECONDS
+                raise RateLimitExceeded(key, bucket.reset_at)
+            bucket.remaining -= 1
+            delay = 0.0
+            if bucket.remaining < bucket.limit * self.pacing_fraction and bucket.reset_at > now:
+                # spread what is left over the rest of the window
+                delay = min((bucket.reset_at - now) / max(bucket.remaining - self.reserve, 1), self.max_delay)
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, key: str, status_code: int, headers: Mapping[str, str]) -> None:
+        """
+        Record the rate-limit headers of an answer.
+
+        Raises RateLimitExceeded when GitHub refused the request because of its primary or secondary limit.
+        """
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            try:
+                if "x-ratelimit-limit" in headers:
+                    bucket.limit = int(headers["x-ratelimit-limit"])
+                if "x-ratelimit-remaining" in headers:
+                    bucket.remaining = int(headers["x-ratelimit-remaining"])
+                if "x-ratelimit-reset" in headers:
+                    bucket.reset_at = float(headers["x-ratelimit-reset"])
+                retry_after = float(headers["retry-after"]) if "retry-after" in headers else None
+            except ValueError:
+                return
+
+            if status_code not in (403, 429):
+                return
+            if retry_after is not None:
+                reset_at = now + retry_after
+            elif bucket.remaining == 0:
+                reset_at = bucket.reset_at or now + UNKNOWN_RESET_SECONDS
+            else:
+                # a 403 that is not about the rate limit
+                return
+            bucket.remaining = 0
+            bucket.reset_at = max(bucket.reset_at, reset_at)
+        raise RateLimitExceeded(key, reset_at)
+
+    def pick(self, keys: Iterable[str]) -> str:
+        """The key with the most quota left, unknown buckets first so every credential gets measured."""
+        now = time.time()
+        with self._lock:
+            def left(key: str) -> float:
+                bucket = self._bucket(key, now)
+                if bucket.remaining is None:
+                    return float("inf")
+                return bucket.remaining - self.reserve
+            return max(keys, key=left)
+
+    def stats(self) -> list[RateLimitBucketModel]:
+        with self._lock:
+            return [bucket.model_copy() for bucket in self._buckets.values()]
+
+
+class RateLimitCollector(Collector):
+    """Exposes the buckets of a RateLimiter at scrape time."""
+
+    def __init__(self, limiter: RateLimiter) -> None:
+        self.limiter = limiter
+
+    def collect(self) -> Iterator[Metric]:
+        remaining = GaugeMetricFamily("github_rate_limit_remaining", "Requests left in the current quota window",
+                                      labels=["bucket"])
+        limit = GaugeMetricFamily("github_rate_limit_limit", "Requests allowed per quota window",
+                                  labels=["bucket"])
+        reset = GaugeMetricFamily("github_rate_limit_reset_timestamp_seconds",
+                                  "Epoch seconds of the next quota window", labels=["bucket"])
+        for bucket in self.limiter.stats():
+            # buckets are only measured after their first answer
+            if bucket.remaining is not None:
+                remaining.add_metric([bucket.key], bucket.remaining)
+            if bucket.limit is not None:
+                limit.add_metric([bucket.key], bucket.limit)
+            reset.add_metric([bucket.key], bucket.reset_at)
+        yield remaining
+        yield limit
+        yield reset
+
+
+rate_limiter = RateLimiter()
+registry.register(RateLimitCollector(rate_limiter))
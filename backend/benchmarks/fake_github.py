@@ -0,0 +1,220 @@
+import hashlib
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# files next to the compose file, so tree listings are not trivially small
+EXTRA_FILES = ("README.md", "docs/setup.md", ".env.example")
+
+
+class FakeGithub(ThreadingHTTPServer):
+    """
+    Local stand-in for the parts of the GitHub API the indexer uses.
+
+    Every repository exists, with a branch head and a compose file derived from its name and generation.
+    Answers are delayed by latency seconds, carry rate-limit headers and honour If-None-Match with a 304,
+    which, like on GitHub, does not count against the quota. Once the quota is spent requests get a 403
+    until the window resets.
+    """
+
+    daemon_threads = True
+    # the rescan engine keeps many keep-alive connections open at once
+    request_queue_size = 256
+
+    def __init__(self, latency: float = 0.0, rate_limit: int = 1_000_000, window: float = 3600.0,
+                 host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), FakeGithubHandler)
+        self.host = host
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._generations: dict[str, int] = {}
+        self._generation = 0
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.server_port}"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.remaining = self.rate_limit
+            self.reset_at = time.time() + self.window
+            self.requests: dict[str, int] = {}
+
+    def count(self, kind: str, status: int) -> None:
+        with self._lock:
+            key = f"{kind} {status}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def take_quota(self) -> bool:
+        with self._lock:
+            if time.time() >= self.reset_at:
+                self.remaining = self.rate_limit
+                self.reset_at = time.time() + self.window
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def quota_headers(self) -> dict[str, str]:
+        with self._lock:
+            return {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": str(self.remaining),
+                    "X-RateLimit-Reset": str(int(self.reset_at))}
+
+    def advance(self, fraction: float) -> int:
+        """Move the branch of every 1/fraction-th repository seen so far, returns how many moved."""
+        with self._lock:
+            self._generation += 1
+            step = max(int(round(1 / fraction)), 1) if fraction > 0 else 0
+            moved = [name for i, name in enumerate(sorted(self._generations)) if step and i % step == 0]
+            for name in moved:
+                self._generations[name] = self._generation
+            return len(moved)
+
+    def generation(self, repo: str) -> int:
+        with self._lock:
+            return self._generations.setdefault(repo, 0)
+
+    def head(self, repo: str) -> str:
+        return hashlib.sha1(f"{repo}@{self.generation(repo)}".encode("utf-8")).hexdigest()
+
+    def compose(self, repo: str) -> str:
+        number = int(hashlib.sha1(repo.encode("utf-8")).hexdigest()[:4], 16)
+        return (f"services:\n"
+                f"  app:\n"
+                f"    image: ghcr.io/{repo}:{self.generation(repo)}\n"
+                f"    ports:\n"
+                f"      - \"{8000 + number % 1000}:80\"\n"
+                f"    volumes:\n"
+                f"      - data:/var/lib/app\n"
+                f"  db:\n"
+                f"    image: postgres:16\n"
+                f"volumes:\n"
+                f"  data: {{}}\n")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"requests": dict(self.requests), "remaining": self.remaining}
+
+
+def blob_sha(content: str) -> str:
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    server: FakeGithub
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: str | bytes = b"", etag: str | None = None,
+              content_type: str = "application/json; charset=utf-8", quota: bool = True) -> None:
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if etag:
+            self.send_header("ETag", etag)
+        if quota:
+            for key, value in self.server.quota_headers().items():
+                self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _conditional(self, kind: str, content: str, etag: str, content_type: str) -> None:
+        if self.headers.get("If-None-Match") == etag:
+            self.server.count(kind, 304)
+            self._send(304, etag=etag)
+            return
+        if not self.server.take_quota():
+            self.server.count(kind, 403)
+            self._send(403, json.dumps({"message": "API rate limit exceeded"}))
+            return
+        self.server.count(kind, 200)
+        self._send(200, content, etag=etag, content_type=content_type)
+
+    def do_GET(self) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        segments = [unquote(segment) for segment in parts.path.strip("/").split("/")]
+
+        if segments == ["user"]:
+            self._send(200, json.dumps({"login": "benchmark", "id": 1}))
+            return
+        if segments[:1] == ["_bench"]:
+            self._send(200, json.dumps(self.server.stats()), quota=False)
+            return
+        if len(segments) < 4 or segments[0] != "repos":
+            self.server.count("unknown", 404)
+            self._send(404, json.dumps({"message": "Not Found"}))
+            return
+
+        repo, rest = f"{segments[1]}/{segments[2]}", segments[3:]
+        head = self.server.head(repo)
+        if rest[0] == "commits":
+            self._conditional("head", head, f'"{head}"', "application/vnd.github.sha")
+        elif rest[0] == "contents":
+            path = "/".join(rest[1:])
+            if not path.endswith("docker-compose.yml"):
+                self.server.count("contents", 404)
+                self._send(404, json.dumps({"message": "Not Found"}))
+                return
+            content = self.server.compose(repo)
+            self._conditional("contents", content, f'"{blob_sha(content)}"', "application/vnd.github.raw")
+        elif rest[:2] == ["git", "trees"]:
+            content = self.server.compose(repo)
+            tree = [{"path": "docker-compose.yml", "type": "blob", "sha": blob_sha(content)}]
+            tree += [{"path": path, "type": "blob", "sha": blob_sha(path)} for path in EXTRA_FILES]
+            body = json.dumps({"sha": head, "tree": tree, "truncated": False})
+            self._conditional("tree", body, f'"{head}"', "application/json; charset=utf-8")
+        elif rest[:2] == ["git", "blobs"]:
+            content = self.server.compose(repo)
+            self._conditional("blob", content, f'"{rest[2]}"', "application/vnd.github.raw")
+        else:
+            self.server.count("unknown", 404)
+            self._send(404, json.dumps({"message": "Not Found"}))
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+
+        if parts.path == "/_bench/advance":
+            fraction = float(parse_qs(parts.query).get("fraction", ["0.1"])[0])
+            self._send(200, json.dumps({"moved": self.server.advance(fraction)}), quota=False)
+            return
+        if parts.path == "/_bench/reset":
+            self.server.reset()
+            self._send(200, json.dumps(self.server.stats()), quota=False)
+            return
+        if parts.path != "/graphql":
+            self._send(404, json.dumps({"message": "Not Found"}))
+            return
+
+        if not self.server.take_quota():
+            self.server.count("graphql", 200)
+            self._send(200, json.dumps({"errors": [{"type": "RATE_LIMITED", "message": "API rate limit exceeded"}]}))
+            return
+        variables = json.loads(body).get("variables") or {}
+        data = {}
+        i = 0
+        while f"owner{i}" in variables:
+            repo = f"{variables[f'owner{i}']}/{variables[f'name{i}']}"
+            content = self.server.compose(repo)
+            data[f"r{i}"] = {"ref": {"target": {"oid": self.server.head(repo)}},
+                             "file": {"oid": blob_sha(content), "text": content,
+                                      "isBinary": False, "isTruncated": False}}
+            i += 1
+        self.server.count("graphql", 200)
+        self._send(200, json.dumps({"data": data}))
@@ -0,0 +1,285 @@
+"""
+Benchmark of the indexer against a local fake GitHub API.
+
+For every size a fresh process seeds a SQLite database with that many repositories, then measures
+a cold (forced) rescan, a warm rescan answered by 304s, an incremental rescan after a share of the
+branches moved, the latency of GET /repos and /index, the statements sent to the database and the
+peak memory. A second fresh process then measures the cold start of the application on the database
+the first one left behind, like a container restart would. Results are written as JSON, and compared
+to an earlier run with --compare.
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+    return {"requests": len(ordered), "mean_ms": statistics.fmean(ordered), "p50_ms": cuts[49],
+            "p90_ms": cuts[89], "p99_ms": cuts[98], "max_ms": ordered[-1]}
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _fake_github_call(url: str, method: str = "GET") -> dict[str, Any]:
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=30) as response:
+        result: dict[str, Any] = json.loads(response.read())
+        return result
+
+
+async def run_size(size: int, github_url: str, requests: int, page_size: int, moved_fraction: float) -> dict[str, Any]:
+    """One size, in a process whose configuration (database, GitHub url, backend) came from the environment."""
+    sys.path.insert(0, str(BACKEND_DIR / "app"))
+    from cryptography.fernet import Fernet
+    from httpx import ASGITransport, AsyncClient
+    from sqlalchemy import event, insert
+
+    from core.config import API_PREFIX
+    from database import Credentials, Repos
+    from main import app
+
+    statements: dict[str, int] = {}
+
+    def count(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        statements[keyword] = statements.get(keyword, 0) + 1
+
+    def take_statements() -> dict[str, int]:
+        taken = dict(statements)
+        statements.clear()
+        return taken
+
+    result: dict[str, Any] = {"size": size}
+    async with app.router.lifespan_context(app):
+        db, jobs = app.state.db, app.state.jobs
+
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        token = Fernet(app.state.auth_key).encrypt(b"benchmark-token")
+        with db.get_session() as session:
+            session.execute(insert(Credentials), [{"name": "benchmark", "username": "benchmark", "token": token}])
+            for offset in range(0, size, 10_000):
+                session.execute(insert(Repos), [{
+                    "url": f"https://github.com/bench/repo{i}", "branch": "main", "name": f"bench/repo{i}",
+                    "compose_folder": "", "credentials_name": "benchmark", "indexed_at": now, "updated_at": now,
+                } for i in range(offset, min(offset + 10_000, size))])
+            session.commit()
+        result["seed_seconds"] = time.perf_counter() - started
+
+        event.listen(db.async_engine.sync_engine, "before_cursor_execute", count)
+
+        async def rescan(name: str, force: bool) -> None:
+            _fake_github_call(f"{github_url}/_bench/reset", "POST")
+            take_statements()
+            started = time.perf_counter()
+            job, _ = jobs.submit(force=force)
+            await jobs.join()
+            seconds = time.perf_counter() - started
+            result[name] = {
+                "seconds": seconds, "repos_per_second": size / seconds if seconds else None,
+                "status": job.status, "error": job.error, "progress": job.progress.model_dump(mode="json"),
+                "db_statements": take_statements(), "github": _fake_github_call(f"{github_url}/_bench")["requests"],
+            }
+
+        await rescan("rescan_cold", force=True)
+        await rescan("rescan_warm", force=False)
+        result["moved_repos"] = _fake_github_call(f"{github_url}/_bench/advance?fraction={moved_fraction}",
+                                                  "POST")["moved"]
+        await rescan("rescan_incremental", force=False)
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark") as client:
+            async def timed(path: str, params: dict[str, Any], headers: dict[str, str] | None = None) -> tuple[float, Any]:
+                started = time.perf_counter()
+                response = await client.get(API_PREFIX + "/v1" + path, params=params, headers=headers)
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 304:
+                    response.raise_for_status()
+                return elapsed, response
+
+            latency: dict[str, Any] = {}
+            for path in ("/repos", "/index"):
+                take_statements()
+                first_page = [(await timed(path, {"limit": page_size}))[0] for _ in range(requests)]
+                latency[f"{path} first page"] = {**percentiles(first_page),
+                                                 "db_statements": take_statements()}
+
+                # a dashboard polling with the ETag it was given, answered with 304
+                etag = (await timed(path, {"limit": page_size}))[1].headers["etag"]
+                take_statements()
+                polls = [(await timed(path, {"limit": page_size}, {"If-None-Match": etag}))[0] for _ in range(requests)]
+                latency[f"{path} conditional poll"] = {**percentiles(polls), "db_statements": take_statements()}
+
+                # walk every page once, the later pages show whether the cursor stays on the index
+                pages, cursor = [], None
+                while True:
+                    elapsed, response = await timed(path, {"limit": page_size, **({"cursor": cursor} if cursor else {})})
+                    pages.append(elapsed)
+                    cursor = response.headers.get("x-next-cursor")
+                    if not cursor:
+                        break
+                latency[f"{path} all pages"] = {**percentiles(pages), "db_statements": take_statements()}
+
+                whole = [(await timed(path, {}))[0] for _ in range(max(requests // 10, 1))]
+                latency[f"{path} unpaginated"] = {**percentiles(whole), "db_statements": take_statements()}
+            result["latency"] = latency
+
+        event.remove(db.async_engine.sync_engine, "before_cursor_execute", count)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def cold_start() -> dict[str, Any]:
+    """Import the application and run its startup, in a process that has imported nothing else yet."""
+    started = time.perf_counter()
+    sys.path.insert(0, str(BACKEND_DIR / "app"))
+    from main import app
+
+    async def start() -> dict[str, float]:
+        async with app.router.lifespan_context(app):
+            phases: dict[str, float] = dict(app.state.startup)
+            return phases
+
+    phases = asyncio.run(start())
+    return {**phases, "process_seconds": time.perf_counter() - started,
+            "modules": sorted(name for name in ("github", "cryptography", "yaml", "requests") if name in sys.modules)}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """Relative change of the headline numbers of every size present in both runs."""
+    lines = []
+    previous = {result["size"]: result for result in baseline.get("results", [])}
+    for result in current["results"]:
+        before = previous.get(result["size"])
+        if before is None:
+            continue
+        pairs = [(f"{name} repos/s", result[name].get("repos_per_second"), before.get(name, {}).get("repos_per_second"))
+                 for name in ("rescan_cold", "rescan_warm", "rescan_incremental")]
+        pairs += [(f"{name} p50 ms", values.get("p50_ms"), before.get("latency", {}).get(name, {}).get("p50_ms"))
+                  for name, values in result.get("latency", {}).items()]
+        pairs.append(("peak rss MB", result.get("peak_rss_mb"), before.get("peak_rss_mb")))
+        pairs.append(("cold start s", result.get("cold_start", {}).get("total"),
+                      before.get("cold_start", {}).get("total")))
+        for label, now, then in pairs:
+            if now and then:
+                lines.append(f"{result['size']:>7} {label:<32} {then:12.2f} -> {now:12.2f} ({(now - then) / then:+.1%})")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated numbers of seeded repositories")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="delay of every fake GitHub answer")
+    parser.add_argument("--rate-limit", type=int, default=1_000_000, help="requests per quota window")
+    parser.add_argument("--backend", default="github", choices=("github", "graphql"), help="INDEX_FETCH_BACKEND")
+    parser.add_argument("--requests", type=int, default=50, help="samples per latency measurement")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--moved-fraction", type=float, default=0.1,
+                        help="share of branches moved before the incremental rescan")
+    parser.add_argument("--output", type=Path, help="result file, benchmarks/results/<commit>-<time>.json by default")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare with")
+    # internal: run a single size in this process
+    parser.add_argument("--worker-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--github-url", help=argparse.SUPPRESS)
+    parser.add_argument("--cold-start", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start:
+        print(json.dumps(cold_start()))
+        return
+    if args.worker_size is not None:
+        result = asyncio.run(run_size(args.worker_size, args.github_url, args.requests, args.page_size,
+                                      args.moved_fraction))
+        print(json.dumps(result))
+        return
+
+    from benchmarks.fake_github import FakeGithub
+
+    server = FakeGithub(latency=args.latency_ms / 1000, rate_limit=args.rate_limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    config = {key: getattr(args, key) for key in ("latency_ms", "rate_limit", "backend", "requests",
+                                                  "page_size", "moved_fraction")}
+    run: dict[str, Any] = {"commit": git_commit(), "created_at": datetime.now(timezone.utc).isoformat(),
+                           "python": platform.python_version(), "platform": platform.platform(),
+                           "config": config, "results": []}
+    try:
+        for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+            with tempfile.TemporaryDirectory() as workdir:
+                # a process per size: fresh configuration, and a peak memory of its own
+                env = {**os.environ, "DATABASE_URL": f"sqlite:///{workdir}/benchmark.db",
+                       "GITHUB_BASE_URL": server.url, "GITHUB_CACHE_PATH": f"{workdir}/github_cache.db",
+                       "INDEX_FETCH_BACKEND": args.backend, "RESCAN_INTERVAL_SECONDS": "0",
+                       "TRACE_SLOW_REQUEST_MS": "0", "TRACE_EXPORT": ""}
+                print(f"benchmarking {size} repositories", file=sys.stderr)
+                worker = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.run", "--worker-size", str(size), "--github-url", server.url,
+                     "--requests", str(args.requests), "--page-size", str(args.page_size),
+                     "--moved-fraction", str(args.moved_fraction)],
+                    cwd=workdir, env={**env, "PYTHONPATH": str(BACKEND_DIR)}, capture_output=True, text=True)
+                if worker.returncode != 0:
+                    sys.stderr.write(worker.stderr)
+                    raise SystemExit(f"benchmark of {size} repositories failed")
+                result = json.loads(worker.stdout.strip().splitlines()[-1])
+
+                started = time.perf_counter()
+                restart = subprocess.run([sys.executable, "-m", "benchmarks.run", "--cold-start"], cwd=workdir,
+                                         env={**env, "PYTHONPATH": str(BACKEND_DIR)}, capture_output=True, text=True)
+                if restart.returncode != 0:
+                    sys.stderr.write(restart.stderr)
+                    raise SystemExit(f"cold start with {size} repositories failed")
+                # wall time of the whole process, the interpreter start included
+                result["cold_start"] = {**json.loads(restart.stdout.strip().splitlines()[-1]),
+                                        "wall_seconds": time.perf_counter() - started}
+                run["results"].append(result)
+    finally:
+        server.shutdown()
+
+    output = args.output or RESULTS_DIR / f"{run['commit'] or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, indent=2))
+    print(f"results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        for line in compare(run, json.loads(args.compare.read_text())):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
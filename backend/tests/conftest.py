@@ -1,6 +1,8 @@
 from typing import Any
 from tests.db_helpers import create_temp_db_file
+from tests import git_helpers
 import importlib
+import time
 from collections.abc import Generator
 import pytest
 from fastapi.testclient import TestClient
@@ -34,6 +36,10 @@ def client(tmp_db: Any) -> Generator[TestClient, None, None]:
     app.state.db = tmp_db
     # create encryption key entry in the test DB
     app.state.auth_key = init_cryptography_key(app)
+    jobs_module = importlib.import_module("services.jobs")
+    app.state.jobs = jobs_module.RescanJobManager(tmp_db, app.state.auth_key)
+    # versions and bodies of the previous test belong to another database
+    importlib.import_module("core.read_cache").read_cache.clear()
 
     # monkeypatch GitHub helper to prevent network calls
     for util_mod in ("app.utilities.github_utils", "utilities.github_utils"):
@@ -59,3 +65,45 @@ def client(tmp_db: Any) -> Generator[TestClient, None, None]:
 def api_v1() -> str:
     from app.core.config import API_PREFIX
     return API_PREFIX + "/v1"
+
+
+@pytest.fixture
+def run_rescan(client, api_v1):
+    # submit a rescan job and poll it until it has finished
+    def _run(**params):
+        r = client.post(api_v1 + "/index", params=params)
+        assert r.status_code == 202
+        job_id = r.json()["job_id"]
+        for _ in range(1000):
+            job = client.get(api_v1 + f"/index/jobs/{job_id}").json()
+            if job["status"] in ("completed", "failed"):
+                return job
+            time.sleep(0.01)
+        raise AssertionError(f"rescan job {job_id} did not finish")
+    return _run
+
+
+@pytest.fixture
+def add_repos(client, api_v1):
+    # add one repository per name, fields override the defaults of every payload
+    def _add(names, **fields):
+        for name in names:
+            payload = {
+                "url": f"http://example.com/{name}.git",
+                "branch": "main",
+                "name": name,
+                "compose_folder": "",
+                "credentials_name": "",
+                **fields
+            }
+            r = client.post(api_v1 + "/repos", json=payload)
+            assert r.status_code == 200
+    return _add
+
+
+@pytest.fixture
+def make_upstream(tmp_path):
+    # create a local git repository to mirror from, the tests commit further changes with git_helpers.git
+    def _make(files):
+        return git_helpers.make_upstream(tmp_path / "upstream", files)
+    return _make
@@ -0,0 +1,19 @@
+import subprocess
+from pathlib import Path
+
+
+def git(cwd: Path, *args: str) -> None:
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+
+def make_upstream(path: Path, files: dict[str, str]) -> Path:
+    # a local repository on branch main holding files in a single commit
+    path.mkdir(parents=True)
+    git(path, "init", "--quiet", "-b", "main")
+    for name, content in files.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(content)
+    git(path, "add", ".")
+    git(path, "commit", "--quiet", "-m", "initial")
+    return path
@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.run import compare, percentiles
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_percentiles():
+    stats = percentiles([float(i) for i in range(1, 101)])
+    assert stats["requests"] == 100
+    assert 50.0 <= stats["p50_ms"] <= 51.0 and stats["p99_ms"] >= 99.0 and stats["max_ms"] == 100.0
+    assert percentiles([]) == {}
+
+
+def test_benchmark_runs_the_real_fetch_path(tmp_path):
+    output = tmp_path / "result.json"
+    run = subprocess.run([sys.executable, "-m", "benchmarks.run", "--sizes", "25", "--latency-ms", "0",
+                          "--requests", "3", "--page-size", "10", "--output", str(output)],
+                         cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300)
+    assert run.returncode == 0, run.stderr
+
+    result = json.loads(output.read_text())
+    size = result["results"][0]
+    assert size["size"] == 25
+    assert size["rescan_cold"]["progress"]["done"] == 25
+    assert size["rescan_cold"]["github"] == {"head 200": 25, "contents 200": 25}
+    # an unchanged branch is revalidated with a 304 and nothing else
+    assert size["rescan_warm"]["progress"]["skipped"] == 25
+    assert size["rescan_warm"]["github"] == {"head 304": 25}
+    assert size["rescan_incremental"]["progress"]["done"] == size["moved_repos"] > 0
+    assert size["latency"]["/repos all pages"]["requests"] == 3
+    # the restart finds the database migrated, and the rescan-only modules are not imported
+    assert size["cold_start"]["total"] > 0
+    assert size["cold_start"]["modules"] == []
+    assert all(line.endswith("(+0.0%)") for line in compare(result, result))
@@ -0,0 +1,93 @@
+import importlib
+import zlib
+
+from sqlalchemy import func, select
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def test_identical_compose_files_are_stored_once(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    database = importlib.import_module("database")
+    contents = {"user/fork1": "services:\n  web:\n    image: nginx\n",
+                "user/fork2": "services:\n  web:\n    image: nginx\n",
+                "user/other": "services:\n  db:\n    image: postgres\n"}
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=contents[repo.name]))
+    add_repos(contents)
+
+    assert run_rescan()["status"] == "completed"
+
+    session = client.app.state.db.get_session()
+    try:
+        assert session.scalar(select(func.count()).select_from(database.ComposeBlobs)) == 2
+        blob = session.scalars(select(database.ComposeBlobs)).first()
+        assert zlib.decompress(blob.data).decode("utf-8") in contents.values()
+    finally:
+        session.close()
+
+    entries = client.get(api_v1 + "/index").json()
+    assert len({entry["compose_hash"] for entry in entries}) == 2
+    r = client.get(api_v1 + f"/index/{entries[0]['id']}/compose")
+    assert r.status_code == 200
+    assert r.text in contents.values()
+    assert client.get(api_v1 + "/index/missing/compose").status_code == 404
+
+
+def test_unchanged_content_keeps_entry(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    content = {"text": "services: {}\n"}
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=content["text"]))
+    add_repos(["user/stable"])
+
+    assert run_rescan()["status"] == "completed"
+    before = client.get(api_v1 + "/index").json()[0]
+
+    assert run_rescan(force=True)["status"] == "completed"
+    assert client.get(api_v1 + "/index").json()[0] == before
+
+    content["text"] = "services:\n  web: {}\n"
+    assert run_rescan(force=True)["status"] == "completed"
+    after = client.get(api_v1 + "/index").json()[0]
+    assert after["compose_hash"] != before["compose_hash"]
+    assert after["updated_at"] != before["updated_at"]
+
+
+def test_unreferenced_blobs_are_swept(client, api_v1, add_repos, run_rescan, monkeypatch):
+    from sqlalchemy import text
+
+    svc = importlib.import_module("services.indexer")
+    database = importlib.import_module("database")
+    contents = {"user/fork1": "services:\n  web:\n    image: nginx\n",
+                "user/fork2": "services:\n  web:\n    image: nginx\n",
+                "user/other": "services:\n  db:\n    image: postgres\n"}
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=contents[repo.name]))
+    add_repos(contents)
+    assert run_rescan()["status"] == "completed"
+    ids = {repo["name"]: repo["id"] for repo in client.get(api_v1 + "/repos").json()}
+
+    def stored():
+        session = client.app.state.db.get_session()
+        try:
+            return [session.scalar(select(func.count()).select_from(table))
+                    for table in (database.ComposeBlobs, database.ComposeServices)] + [
+                session.scalar(text("SELECT count(*) FROM compose_fts"))]
+        finally:
+            session.close()
+
+    assert stored() == [2, 2, 2]
+
+    # a changed file leaves its old blob behind
+    contents["user/other"] = "services:\n  db:\n    image: mariadb\n"
+    assert run_rescan(force=True)["status"] == "completed"
+    assert stored() == [2, 2, 2]
+
+    # a blob shared by two repositories stays until the last one is gone
+    assert client.delete(api_v1 + f"/repos/{ids['user/fork1']}").status_code == 200
+    assert stored() == [2, 2, 2]
+    assert client.delete(api_v1 + "/repos", params={"id": [ids["user/fork2"]]}).json()["deleted"] == 1
+    assert stored() == [1, 1, 1]
+    assert client.get(api_v1 + f"/index/{client.get(api_v1 + '/index').json()[0]['id']}/compose").text == \
+        contents["user/other"]
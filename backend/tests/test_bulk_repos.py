@@ -0,0 +1,123 @@
+import importlib
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def _repo(name, branch="main"):
+    return {"url": f"http://example.com/{name}.git", "branch": branch, "name": name,
+            "compose_folder": "", "credentials_name": ""}
+
+
+def _names(client, api_v1):
+    return [repo["name"] for repo in client.get(api_v1 + "/repos").json()]
+
+
+def test_import_reports_every_row(client, api_v1):
+    assert client.post(api_v1 + "/repos", json=_repo("user/taken")).status_code == 200
+
+    r = client.post(api_v1 + "/repos/bulk", json=[_repo("user/a"), _repo("user/taken"), _repo("user/a"),
+                                                    "not a repo", _repo("user/b", branch="dev")])
+    assert r.status_code == 200
+    body = r.json()
+    assert [row["status"] for row in body["results"]] == ["created", "conflict", "conflict", "invalid", "created"]
+    assert "_id_name_url_branch_uc" in body["results"][1]["detail"]
+    assert (body["succeeded"], body["failed"]) == (2, 3)
+    assert _names(client, api_v1) == ["user/a", "user/b", "user/taken"]
+
+
+def test_import_ndjson_and_csv(client, api_v1):
+    ndjson = '{"url": "http://example.com/a.git", "name": "user/a"}\n\n{not json\n'
+    r = client.post(api_v1 + "/repos/bulk", content=ndjson, headers={"Content-Type": "application/x-ndjson"})
+    assert [row["status"] for row in r.json()["results"]] == ["created", "invalid"]
+
+    csv = "﻿name,url,branch\nuser/b,http://example.com/b.git,main\nuser/c,http://example.com/c.git\n"
+    r = client.post(api_v1 + "/repos/bulk", content=csv.encode("utf-8"), headers={"Content-Type": "text/csv"})
+    assert [row["status"] for row in r.json()["results"]] == ["created", "created"]
+    assert _names(client, api_v1) == ["user/a", "user/b", "user/c"]
+
+    assert client.post(api_v1 + "/repos/bulk", content="x", headers={"Content-Type": "text/plain"}).status_code == 415
+    assert client.post(api_v1 + "/repos/bulk", json={"name": "user/d"}).status_code == 400
+
+
+def test_atomic_import_rolls_back(client, api_v1):
+    client.post(api_v1 + "/repos", json=_repo("user/taken"))
+    r = client.post(api_v1 + "/repos/bulk", params={"atomic": True}, json=[_repo("user/a"), _repo("user/taken")])
+    assert r.status_code == 409
+    assert [row["status"] for row in r.json()["results"]] == ["skipped", "conflict"]
+    assert _names(client, api_v1) == ["user/taken"]
+
+
+def test_import_is_one_transaction(client, api_v1, monkeypatch):
+    bulk = importlib.import_module("services.bulk")
+    # several executemany batches, a single commit
+    monkeypatch.setattr(bulk, "BULK_WRITE_BATCH_SIZE", 2)
+    commits = []
+    original = bulk.AsyncSession.commit
+
+    async def commit(self):
+        commits.append(True)
+        await original(self)
+    monkeypatch.setattr(bulk.AsyncSession, "commit", commit)
+
+    r = client.post(api_v1 + "/repos/bulk", json=[_repo(f"user/{i}") for i in range(5)])
+    assert r.json()["succeeded"] == 5
+    assert len(commits) == 1
+
+
+def test_bulk_update(client, api_v1):
+    client.post(api_v1 + "/repos/bulk", json=[_repo("user/a"), _repo("user/b"), _repo("user/c")])
+    ids = {repo["name"]: repo["id"] for repo in client.get(api_v1 + "/repos").json()}
+
+    r = client.put(api_v1 + "/repos/bulk", json=[
+        {**_repo("user/a", branch="dev"), "id": ids["user/a"]},
+        {**_repo("user/c"), "id": ids["user/b"]},  # user/c is taken
+        {**_repo("user/x"), "id": "missing"},
+        # the key of user/b is free once it moved... but user/b did not move, so user/c cannot take it
+        {**_repo("user/b"), "id": ids["user/c"]},
+    ])
+    assert r.status_code == 200
+    assert [row["status"] for row in r.json()["results"]] == ["updated", "conflict", "not_found", "conflict"]
+    repos = {repo["id"]: repo for repo in client.get(api_v1 + "/repos").json()}
+    assert repos[ids["user/a"]]["branch"] == "dev"
+    assert repos[ids["user/b"]]["name"] == "user/b"
+
+
+def test_bulk_delete_by_ids_and_filter(client, api_v1):
+    client.post(api_v1 + "/repos/bulk", json=[_repo("user/a"), _repo("user/b"), _repo("user/c", branch="dev")])
+    ids = {repo["name"]: repo["id"] for repo in client.get(api_v1 + "/repos").json()}
+
+    assert client.delete(api_v1 + "/repos").status_code == 400
+    r = client.delete(api_v1 + "/repos", params={"id": [ids["user/a"], "missing"]})
+    assert r.json()["deleted"] == 1
+    r = client.delete(api_v1 + "/repos", params={"branch": "dev"})
+    assert r.json()["deleted"] == 1
+    assert _names(client, api_v1) == ["user/b"]
+
+
+def test_deleted_repos_take_their_index_entries(client, api_v1, run_rescan, monkeypatch):
+    monkeypatch.setattr(importlib.import_module("services.indexer"), "make_index_entry",
+                        lambda repo, credentials, auth_key: NewIndexEntryModel(
+                            repo_id=repo.id, compose_path=f"services:\n  {repo.name.split('/')[1]}: {{}}\n"))
+    client.post(api_v1 + "/repos/bulk", json=[_repo("user/a"), _repo("user/b"), _repo("user/c", branch="dev")])
+    assert run_rescan()["status"] == "completed"
+    ids = {repo["name"]: repo["id"] for repo in client.get(api_v1 + "/repos").json()}
+    assert len(client.get(api_v1 + "/index").json()) == 3
+
+    assert client.delete(api_v1 + f"/repos/{ids['user/a']}").status_code == 200
+    assert {entry["repo_id"] for entry in client.get(api_v1 + "/index").json()} == {ids["user/b"], ids["user/c"]}
+
+    r = client.delete(api_v1 + "/repos", params={"id": [ids["user/b"]], "name": "user/b"})
+    assert r.json()["deleted"] == 1
+    assert client.delete(api_v1 + "/repos", params={"branch": "dev"}).json()["deleted"] == 1
+    assert client.get(api_v1 + "/index").json() == []
+    assert client.get(api_v1 + "/index", headers={"Accept": "application/x-ndjson"}).content == b""
+
+
+def test_urls_starting_with_a_dash_are_refused(client, api_v1):
+    option = {**_repo("user/a"), "url": "--upload-pack=touch /tmp/x; git-upload-pack"}
+    assert client.post(api_v1 + "/repos", json=option).status_code == 422
+
+    r = client.post(api_v1 + "/repos/bulk", json=[option, _repo("user/b")])
+    assert [row["status"] for row in r.json()["results"]] == ["invalid", "created"]
+    assert "must not start with '-'" in r.json()["results"][0]["detail"]
+    assert _names(client, api_v1) == ["user/b"]
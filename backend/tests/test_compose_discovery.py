@@ -0,0 +1,72 @@
+import importlib
+
+from tests.git_helpers import git
+
+# one folder per stack, stacks/b also holds an override and a file that is not compose
+STACKS = {
+    "stacks/a/compose.yaml": "services:\n  a:\n    image: nginx:1\n",
+    "stacks/b/docker-compose.yml": "services:\n  b:\n    image: redis\n",
+    "stacks/b/docker-compose.override.yml": "services:\n  b:\n    ports: ['6379:6379']\n",
+    "stacks/b/README.md": "not a compose file\n",
+    "other/compose.yaml": "services: {}\n",
+}
+
+
+def test_select_compose_files():
+    discovery = importlib.import_module("utilities.compose_discovery")
+    tree = [("compose.yaml", "1"), ("stacks/a/compose.yml", "2"), ("stacks/a/.env", "3"),
+            ("stacks/b/docker-compose.prod.yaml", "4"), ("stacksx/compose.yaml", "5")]
+    assert discovery.select_compose_files(tree, "stacks/") == {"stacks/a/compose.yml": "2",
+                                                                "stacks/b/docker-compose.prod.yaml": "4"}
+    assert set(discovery.select_compose_files(tree, "")) == {"compose.yaml", "stacks/a/compose.yml",
+                                                              "stacks/b/docker-compose.prod.yaml", "stacksx/compose.yaml"}
+    assert discovery.select_compose_files(tree, None, patterns=["*.toml"]) == {}
+
+
+def test_multi_stack_repo_is_indexed_per_file(client, api_v1, run_rescan, tmp_path, make_upstream, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    discovery = importlib.import_module("utilities.compose_discovery")
+    monkeypatch.setattr(git_mirror, "mirror_store", git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    upstream = make_upstream(STACKS)
+    calls = {"list": 0, "read": 0}
+
+    def list_tree(*args):
+        calls["list"] += 1
+        return git_mirror.list_tree(*args)
+
+    def read_blob(*args):
+        calls["read"] += 1
+        return git_mirror.read_blob(*args)
+
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: discovery.discover_index_entries(
+        git_mirror.resolve_branch_head, list_tree, read_blob, repo, credentials, auth_key))
+    payload = {"url": upstream.as_uri(), "branch": "main", "name": "user/stacks",
+               "compose_folder": "stacks/", "credentials_name": ""}
+    assert client.post(api_v1 + "/repos", json=payload).status_code == 200
+
+    assert run_rescan()["status"] == "completed"
+    entries = {entry["path"]: entry for entry in client.get(api_v1 + "/index").json()}
+    assert set(entries) == {"stacks/a/compose.yaml", "stacks/b/docker-compose.yml",
+                            "stacks/b/docker-compose.override.yml"}
+    assert calls == {"list": 1, "read": 3}
+
+    # an unchanged head costs neither a listing nor a read
+    assert run_rescan()["status"] == "completed"
+    assert calls == {"list": 1, "read": 3}
+
+    (upstream / "stacks/a/compose.yaml").write_text("services:\n  a:\n    image: nginx:2\n")
+    git(upstream, "rm", "--quiet", "stacks/b/docker-compose.override.yml")
+    git(upstream, "commit", "--quiet", "-am", "update")
+    assert run_rescan()["status"] == "completed"
+    assert calls == {"list": 2, "read": 4}
+
+    after = {entry["path"]: entry for entry in client.get(api_v1 + "/index").json()}
+    assert set(after) == {"stacks/a/compose.yaml", "stacks/b/docker-compose.yml"}
+    unchanged = after["stacks/b/docker-compose.yml"]
+    assert unchanged["id"] == entries["stacks/b/docker-compose.yml"]["id"]
+    assert unchanged["updated_at"] == entries["stacks/b/docker-compose.yml"]["updated_at"]
+    assert unchanged["commit_sha"] == after["stacks/a/compose.yaml"]["commit_sha"] != entries[
+        "stacks/a/compose.yaml"]["commit_sha"]
+    r = client.get(api_v1 + f"/index/{after['stacks/a/compose.yaml']['id']}/compose")
+    assert "nginx:2" in r.text
@@ -0,0 +1,114 @@
+import importlib
+
+import pytest
+
+from app.models.indexer import NewIndexEntryModel
+from app.utilities.compose_parser import parse_compose, parse_port, split_image
+
+COMPOSE = """
+services:
+  web:
+    image: registry.example.com:5000/nginx:1.25
+    ports:
+      - "443:443"
+      - "127.0.0.1:8080:80/udp"
+      - target: 9000
+        published: 9001
+    volumes:
+      - ./html:/usr/share/nginx/html
+      - data:/data
+    networks: [front]
+  db:
+    image: postgres@sha256:abc
+volumes:
+  data: {}
+networks:
+  front: {}
+"""
+
+
+def test_parse_compose_extracts_structure():
+    parsed = parse_compose(COMPOSE)
+
+    assert [(s.service, s.image_name, s.image_tag) for s in parsed.services] == [
+        ("web", "registry.example.com:5000/nginx", "1.25"), ("db", "postgres", "sha256:abc")]
+    assert [(p.published, p.target, p.protocol) for p in parsed.ports] == [
+        (443, 443, "tcp"), (8080, 80, "udp"), (9001, 9000, "tcp")]
+    assert {(v.service, v.source, v.type) for v in parsed.volumes} == {
+        ("web", "./html", "bind"), ("web", "data", "volume"), (None, "data", "volume")}
+    assert {(n.service, n.network) for n in parsed.networks} == {("web", "front"), (None, "front")}
+
+
+def test_parse_helpers():
+    assert split_image("nginx") == ("nginx", None)
+    assert [p.published for p in parse_port("web", "8000-8002:80")] == [8000, 8001, 8002]
+    assert [p.published for p in parse_port("web", "[::1]:53:53/udp")] == [53]
+    with pytest.raises(ValueError):
+        parse_compose("- not a mapping")
+
+
+def test_index_structure_queries(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    contents = {"user/web": COMPOSE, "user/fork": COMPOSE, "user/broken": "services: ["}
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=contents[repo.name]))
+    add_repos(contents)
+
+    assert run_rescan()["status"] == "completed"
+    assert len(client.get(api_v1 + "/index").json()) == 3
+
+    services = client.get(api_v1 + "/index/services", params={"image": "postgres"}).json()
+    assert sorted(s["repo_name"] for s in services) == ["user/fork", "user/web"]
+    assert services[0]["image_tag"] == "sha256:abc"
+
+    ports = client.get(api_v1 + "/index/ports", params={"published": 443}).json()
+    assert {(p["repo_name"], p["service"]) for p in ports} == {("user/web", "web"), ("user/fork", "web")}
+    assert client.get(api_v1 + "/index/ports", params={"published": 443, "limit": 1}).json()[0]["target"] == 443
+
+    volumes = client.get(api_v1 + "/index/volumes", params={"source": "./html"}).json()
+    assert len(volumes) == 2 and volumes[0]["type"] == "bind"
+    assert len(client.get(api_v1 + "/index/networks", params={"network": "front"}).json()) == 4
+
+
+def test_index_structure_pages(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=COMPOSE))
+    # the same blob in every repository, its rows are told apart by their index entry
+    add_repos(["user/c", "user/a", "user/b"])
+    assert run_rescan()["status"] == "completed"
+
+    for order in ("asc", "desc"):
+        rows, cursor = [], None
+        while True:
+            params = {"limit": 4, "order": order, "count": True, **({"cursor": cursor} if cursor else {})}
+            r = client.get(api_v1 + "/index/ports", params=params)
+            assert r.status_code == 200 and r.headers["X-Total-Count"] == "9"
+            rows.extend((port["repo_name"], port["published"]) for port in r.json())
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert len(rows) == len(set(rows)) == 9
+        assert [name for name, _ in rows] == sorted((name for name, _ in rows), reverse=order == "desc")
+    assert "id" not in client.get(api_v1 + "/index/services").json()[0]
+
+
+def test_unchanged_blobs_are_not_parsed_again(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    structure = importlib.import_module("services.compose_index")
+    parsed = []
+    original = structure.parse_compose
+
+    def counting_parse(content):
+        parsed.append(content)
+        return original(content)
+
+    monkeypatch.setattr(structure, "parse_compose", counting_parse)
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=COMPOSE))
+    add_repos(["user/a", "user/b"])
+
+    assert run_rescan()["status"] == "completed"
+    assert run_rescan(force=True)["status"] == "completed"
+    assert len(parsed) == 1
+    assert len(client.get(api_v1 + "/index/services").json()) == 4
@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import UniqueConstraint, create_engine, inspect, select, text
+
+from app.database import Database, Index, Repos, make_async_url, make_sync_url
+
+
+def test_sqlite_engine_uses_wal_and_sized_pool(tmp_path):
+    from app.core.config import MIN_CONNECTIONS_COUNT
+
+    db = Database(f"sqlite:///{(tmp_path / 'wal.db').as_posix()}")
+    try:
+        with db.engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert db.engine.pool.size() == MIN_CONNECTIONS_COUNT
+        assert db.async_engine.pool.size() == MIN_CONNECTIONS_COUNT
+    finally:
+        asyncio.run(db.dispose())
+
+
+def test_database_urls_map_to_drivers():
+    assert make_async_url("sqlite:///./database.db") == "sqlite+aiosqlite:///./database.db"
+    assert make_sync_url("postgresql://u:p@db/spaceport") == "postgresql+psycopg://u:p@db/spaceport"
+    assert make_async_url("postgresql://u:p@db/spaceport") == "postgresql+psycopg://u:p@db/spaceport"
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL not set")
+def test_postgres_round_trip():
+    db = Database(os.environ["TEST_POSTGRES_URL"])
+
+    async def round_trip():
+        async with db.get_async_session() as session:
+            session.add(Repos(url="http://example.com/pg.git", name="user/pg", branch="main"))
+            await session.commit()
+            found = await session.scalar(select(Repos).where(Repos.name == "user/pg"))
+            assert found is not None
+            await session.delete(found)
+            await session.commit()
+        await db.dispose()
+
+    asyncio.run(round_trip())
+
+
+def test_index_of_an_earlier_release_is_rebuilt(tmp_path):
+    url = f"sqlite:///{(tmp_path / 'legacy.db').as_posix()}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        # the tables as the first release made them, without the unique constraint of index
+        conn.execute(text("CREATE TABLE repos (id VARCHAR PRIMARY KEY, url VARCHAR, name VARCHAR, branch VARCHAR, "
+                          "compose_folder VARCHAR, credentials_name VARCHAR, indexed_at DATETIME, "
+                          "updated_at DATETIME, CONSTRAINT _id_name_url_branch_uc UNIQUE (name, url, branch))"))
+        conn.execute(text('CREATE TABLE "index" (id VARCHAR PRIMARY KEY, repo_id VARCHAR REFERENCES repos (id), '
+                          "compose_path VARCHAR, indexed_at DATETIME, updated_at DATETIME)"))
+        conn.execute(text("CREATE TABLE auth (key BLOB PRIMARY KEY)"))
+        conn.execute(text('INSERT INTO "index" (id, repo_id, compose_path) VALUES (\'i1\', \'r1\', \'services: {}\')'))
+    engine.dispose()
+
+    db = Database(url)
+    try:
+        expected = {constraint.name for constraint in Index.__table__.constraints
+                    if isinstance(constraint, UniqueConstraint)}
+        assert expected <= {constraint["name"] for constraint in inspect(db.engine).get_unique_constraints("index")}
+    finally:
+        asyncio.run(db.dispose())
@@ -0,0 +1,121 @@
+import importlib
+import subprocess
+
+import pytest
+from fastapi import HTTPException
+
+from tests.git_helpers import git
+
+STACK = {"stack/docker-compose.yml": "services:\n  web:\n    image: nginx:1\n"}
+
+
+def _repo(url, compose_folder="stack/"):
+    models = importlib.import_module("models.indexer")
+    return models.RepositoryModel(id="r1", url=url, branch="main", name="user/repo",
+                                  compose_folder=compose_folder, indexed_at=None, updated_at=None)
+
+
+def test_mirror_reads_compose_and_fetches_incrementally(tmp_path, make_upstream, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    monkeypatch.setattr(git_mirror, "mirror_store", git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    upstream = make_upstream(STACK)
+    repo = _repo(upstream.as_uri())
+
+    assert git_mirror.fetch_compose_path(repo, None, b"") == "services:\n  web:\n    image: nginx:1\n"
+    assert git_mirror.mirror_store.mirror_path(repo.url).exists()
+
+    (upstream / "stack" / "docker-compose.yml").write_text("services:\n  web:\n    image: nginx:2\n")
+    git(upstream, "commit", "--quiet", "-am", "bump")
+
+    assert git_mirror.fetch_compose_path(repo, None, b"") == "services:\n  web:\n    image: nginx:2\n"
+
+
+def test_mirror_missing_compose_file(tmp_path, make_upstream, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    monkeypatch.setattr(git_mirror, "mirror_store", git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    upstream = make_upstream(STACK)
+
+    assert git_mirror.fetch_compose_path(_repo(upstream.as_uri(), compose_folder=""), None, b"") is None
+
+
+def test_remote_head_follows_branch(tmp_path, make_upstream, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    monkeypatch.setattr(git_mirror, "mirror_store", git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    upstream = make_upstream(STACK)
+    repo = _repo(upstream.as_uri())
+
+    head = git_mirror.resolve_branch_head(repo, None, b"")
+    assert head == subprocess.run(["git", "rev-parse", "HEAD"], cwd=upstream, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    # resolving the head does not create a mirror
+    assert not git_mirror.mirror_store.mirror_path(repo.url).exists()
+
+    git(upstream, "commit", "--quiet", "--allow-empty", "-m", "empty")
+    assert git_mirror.resolve_branch_head(repo, None, b"") != head
+    assert git_mirror.resolve_branch_head(repo.model_copy(update={"branch": "missing"}), None, b"") is None
+
+
+def test_mirror_refuses_local_repositories_unless_allowed(tmp_path, make_upstream, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    monkeypatch.setattr(git_mirror, "mirror_store", git_mirror.GitMirrorStore(str(tmp_path / "mirrors")))
+    upstream = make_upstream(STACK)
+
+    for url in (upstream.as_uri(), str(upstream)):
+        with pytest.raises(HTTPException, match="not allowed"):
+            git_mirror.fetch_compose_path(_repo(url), None, b"")
+
+
+def test_mirror_refuses_branches_outside_one_ref(tmp_path, make_upstream, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    monkeypatch.setattr(git_mirror, "mirror_store",
+                        git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    upstream = make_upstream(STACK)
+
+    for branch in ("main:refs/heads/other", "--upload-pack=true", "main other", "a..b"):
+        repo = _repo(upstream.as_uri()).model_copy(update={"branch": branch})
+        with pytest.raises(HTTPException, match="Invalid branch name"):
+            git_mirror.fetch_compose_path(repo, None, b"")
+        assert not git_mirror.mirror_store.mirror_path(repo.url).exists()
+
+
+def test_option_urls_are_not_passed_to_git(tmp_path, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    # even with local repositories allowed
+    monkeypatch.setattr(git_mirror, "mirror_store",
+                        git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    marker = tmp_path / "PWNED"
+    repo = _repo(f"--upload-pack=touch {marker}; git-upload-pack")
+
+    with pytest.raises(HTTPException, match="starts with '-'"):
+        git_mirror.resolve_branch_head(repo, None, b"")
+    with pytest.raises(HTTPException, match="starts with '-'"):
+        git_mirror.fetch_compose_path(repo, None, b"")
+    assert not marker.exists()
+
+    # past the check, git reads the url after '--' as a repository and not as an option
+    monkeypatch.setattr(git_mirror, "check_remote", lambda url, branch: None)
+    with pytest.raises(RuntimeError):
+        git_mirror.mirror_store.remote_head(repo.url, repo.branch, None, b"")
+    assert not marker.exists()
+
+
+def test_deleted_compose_file_drops_its_entry(client, api_v1, run_rescan, tmp_path, make_upstream, monkeypatch):
+    git_mirror = importlib.import_module("utilities.git_mirror")
+    gh_utils = importlib.import_module("utilities.github_utils")
+    monkeypatch.setattr(git_mirror, "mirror_store",
+                        git_mirror.GitMirrorStore(str(tmp_path / "mirrors"), protocols=["file"]))
+    monkeypatch.setattr(importlib.import_module("services.indexer"), "make_index_entry",
+                        lambda repo, credentials, auth_key: gh_utils.make_index_entry_with(
+                            git_mirror.fetch_compose_path, git_mirror.resolve_branch_head, repo, credentials, auth_key))
+    upstream = make_upstream(STACK)
+    payload = {"url": upstream.as_uri(), "branch": "main", "name": "user/repo",
+               "compose_folder": "stack/", "credentials_name": ""}
+    assert client.post(api_v1 + "/repos", json=payload).status_code == 200
+    assert run_rescan()["status"] == "completed"
+    assert len(client.get(api_v1 + "/index").json()) == 1
+
+    git(upstream, "rm", "--quiet", "stack/docker-compose.yml")
+    git(upstream, "commit", "--quiet", "-m", "remove the stack")
+    job = run_rescan()
+    assert job["status"] == "completed" and job["progress"]["done"] == 1
+    assert client.get(api_v1 + "/index").json() == []
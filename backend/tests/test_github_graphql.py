@@ -0,0 +1,144 @@
+import importlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class StubGithub(ThreadingHTTPServer):
+    """Local stand-in for the GitHub API: the authenticated user and a GraphQL endpoint."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.heads = {}
+        self.files = {}
+        self.batches = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self, document):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Limit", "5000")
+        self.send_header("X-RateLimit-Remaining", "4999")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._answer({"login": "tester"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        variables = request["variables"]
+        self.server.batches.append(len([name for name in variables if name.startswith("owner")]))
+        data = {}
+        for i in range(self.server.batches[-1]):
+            name = f"{variables[f'owner{i}']}/{variables[f'name{i}']}"
+            if name not in self.server.heads:
+                data[f"r{i}"] = None
+                continue
+            text = self.server.files.get(name)
+            data[f"r{i}"] = {"ref": {"target": {"oid": self.server.heads[name]}},
+                             "file": None if text is None else {
+                                 "oid": "f" * 40, "text": text, "isBinary": False, "isTruncated": False}}
+        self._answer({"data": data})
+
+
+@pytest.fixture
+def stub_github(monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    graphql = importlib.import_module("utilities.github_graphql")
+    server = StubGithub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(gh_utils, "GITHUB_BASE_URL", server.url)
+    monkeypatch.setattr(graphql, "GITHUB_BASE_URL", server.url)
+    gh_utils.client_pool.invalidate()
+    try:
+        yield server
+    finally:
+        gh_utils.client_pool.invalidate()
+        server.shutdown()
+        server.server_close()
+
+
+def _repo(i, commit_sha=None, compose_folder=""):
+    models = importlib.import_module("models.indexer")
+    return models.RescanRepositoryModel(id=f"id{i}", url=f"https://github.com/user/repo{i}", branch="main",
+                                        name=f"user/repo{i}", compose_folder=compose_folder, indexed_at=None,
+                                        updated_at=None, commit_sha=commit_sha)
+
+
+def test_batch_query_and_result():
+    graphql = importlib.import_module("utilities.github_graphql")
+    repos = [_repo(0, compose_folder="stack/"), _repo(1, commit_sha="a" * 40), _repo(2), _repo(3), _repo(4)]
+
+    query, variables = graphql.build_batch_query(repos)
+    assert query.count("repository(") == 5
+    assert variables["expr0"] == "main:stack/docker-compose.yml"
+    assert variables["ref1"] == "refs/heads/main"
+
+    outcomes = graphql.parse_batch_result(repos, {
+        "r0": {"ref": {"target": {"oid": "b" * 40}}, "file": {"oid": "c" * 40, "text": "services: {}\n"}},
+        "r1": {"ref": {"target": {"oid": "a" * 40}}, "file": {"oid": "c" * 40, "text": "services: {}\n"}},
+        "r2": None,
+        "r3": {"ref": {"target": {"oid": "d" * 40}}, "file": None},
+        "r4": {"ref": {"target": {"oid": "e" * 40}},
+               "file": {"oid": "f" * 40, "text": None, "isBinary": False, "isTruncated": True}},
+    })
+    assert outcomes[0].commit_sha == "b" * 40
+    assert outcomes[0].entries[0].path == "stack/docker-compose.yml"
+    # an unchanged head and an unknown repository are both skipped
+    assert outcomes[1:3] == [None, None]
+    # a moved branch without the compose file keeps no entry
+    assert (outcomes[3].commit_sha, outcomes[3].entries) == ("d" * 40, [])
+    # a truncated blob has no text, it fails the repository instead of dropping its entry
+    assert "too large or binary" in outcomes[4].detail
+
+    assert graphql.graphql_url("https://api.github.com") == "https://api.github.com/graphql"
+    assert graphql.graphql_url("https://ghe.example.com/api/v3") == "https://ghe.example.com/api/graphql"
+
+
+def test_rescan_fetches_repositories_in_batches(client, api_v1, run_rescan, stub_github, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    # the conftest stub would answer every repository on its own
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: pytest.fail("REST fetch"))
+    monkeypatch.setattr(svc, "INDEX_FETCH_BACKEND", "graphql")
+    monkeypatch.setattr(svc, "GITHUB_GRAPHQL_BATCH_SIZE", 3)
+
+    r = client.post(api_v1 + "/credentials", json={"name": "cred", "username": "u", "password": "", "token": "t"})
+    assert r.status_code == 200
+    for i in range(7):
+        r = client.post(api_v1 + "/repos", json={"url": f"https://github.com/user/repo{i}", "branch": "main",
+                                                 "name": f"user/repo{i}", "compose_folder": "",
+                                                 "credentials_name": "cred"})
+        assert r.status_code == 200
+        if i != 6:
+            stub_github.heads[f"user/repo{i}"] = "a" * 40
+            stub_github.files[f"user/repo{i}"] = f"services:\n  app{i}:\n    image: nginx\n"
+
+    job = run_rescan()
+    assert job["status"] == "completed"
+    assert sorted(stub_github.batches) == [1, 3, 3]
+    # the missing repository is skipped like a missing compose file
+    assert job["progress"]["done"] == 6 and job["progress"]["skipped"] == 1
+    assert len(client.get(api_v1 + "/index").json()) == 6
+
+    # unchanged heads are skipped without writing, a moved one is refreshed
+    stub_github.heads["user/repo2"] = "b" * 40
+    job = run_rescan()
+    assert len(stub_github.batches) == 6
+    assert job["progress"]["done"] == 1 and job["progress"]["skipped"] == 6
+    assert {entry["commit_sha"] for entry in client.get(api_v1 + "/index").json()} == {"a" * 40, "b" * 40}
@@ -0,0 +1,235 @@
+import importlib
+import threading
+
+from cryptography.fernet import Fernet
+
+
+class FakeUser:
+    def __init__(self, owner):
+        self.owner = owner
+
+    @property
+    def login(self):
+        self.owner.validations += 1
+        return "user"
+
+
+class FakeGithub:
+    instances = []
+
+    def __init__(self, auth=None, **kwargs):
+        self.auth = auth
+        self.validations = 0
+        self.closed = False
+        FakeGithub.instances.append(self)
+
+    def get_user(self):
+        return FakeUser(self)
+
+    def close(self):
+        self.closed = True
+
+
+def _credentials(token, cred_id="cred-1"):
+    models = importlib.import_module("models.indexer")
+    return models.RepoCredentialsModel(id=cred_id, name="test", username="u", password=None, token=token)
+
+
+def test_client_pool_reuses_and_revalidates(monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    monkeypatch.setattr("github.Github", FakeGithub)
+    FakeGithub.instances = []
+    key = Fernet.generate_key()
+    token = Fernet(key).encrypt(b"secret")
+
+    pool = gh_utils.GithubClientPool(validation_ttl=3600)
+    first = pool.get(_credentials(token), key)
+    second = pool.get(_credentials(token), key)
+    assert first is second
+    assert first.validations == 1
+
+    # an expired validation triggers a single new check on the same client
+    pool.validation_ttl = 0
+    third = pool.get(_credentials(token), key)
+    assert third is first
+    assert first.validations == 2
+
+    # a rotated token replaces the client
+    rotated = pool.get(_credentials(Fernet(key).encrypt(b"other")), key)
+    assert rotated is not first
+    assert first.closed
+
+
+def test_client_pool_validates_outside_the_pool_lock(monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    release = threading.Event()
+
+    class SlowUser(FakeUser):
+        @property
+        def login(self):
+            # the first credential's validation hangs on the network
+            if self.owner.auth.token == "slow":
+                assert release.wait(5)
+            return "user"
+
+    class SlowGithub(FakeGithub):
+        def get_user(self):
+            return SlowUser(self)
+
+    monkeypatch.setattr("github.Github", SlowGithub)
+    key = Fernet.generate_key()
+    pool = gh_utils.GithubClientPool(validation_ttl=3600)
+    slow = threading.Thread(target=pool.get, args=(_credentials(Fernet(key).encrypt(b"slow"), "cred-slow"), key))
+    slow.start()
+    try:
+        done = threading.Event()
+        threading.Thread(target=lambda: (pool.get(_credentials(Fernet(key).encrypt(b"fast"), "cred-fast"), key),
+                                         done.set())).start()
+        assert done.wait(2)
+    finally:
+        release.set()
+        slow.join()
+
+
+def test_client_pool_invalidated_on_credentials_change(client, api_v1, monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    database = importlib.import_module("database")
+    monkeypatch.setattr("github.Github", FakeGithub)
+
+    r = client.post(api_v1 + "/credentials", json={"name": "pool", "username": "u", "password": "", "token": "t"})
+    assert r.status_code == 200
+
+    session = client.app.state.db.get_session()
+    try:
+        row = session.query(database.Credentials).filter(database.Credentials.name == "pool").one()
+        cred = _credentials(row.token, cred_id=row.id)
+        instance = gh_utils.client_pool.get(cred, client.app.state.auth_key)
+
+        row.username = "changed"
+        session.commit()
+    finally:
+        session.close()
+
+    assert instance.closed
+    assert gh_utils.client_pool.get(cred, client.app.state.auth_key) is not instance
+    gh_utils.client_pool.invalidate()
+
+
+class FakeRequester:
+    def __init__(self):
+        self.calls = []
+
+    def requestJson(self, verb, url, parameters=None, headers=None):
+        self.calls.append(dict(headers or {}))
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {}, ""
+        return 200, {"etag": '"v1"'}, "services: {}\n"
+
+
+class FakeAnonymousGithub:
+    def __init__(self):
+        self.requester = FakeRequester()
+
+
+def test_fetch_compose_path_revalidates_with_etag(client, api_v1, tmp_path, monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    http_cache = importlib.import_module("utilities.http_cache")
+    models = importlib.import_module("models.indexer")
+
+    cache = http_cache.ConditionalRequestCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(gh_utils, "_response_cache", cache)
+    fake = FakeAnonymousGithub()
+    monkeypatch.setattr(gh_utils.client_pool, "get_anonymous", lambda: fake)
+
+    repo = models.RepositoryModel(id="r1", url="http://example.com/repo.git", branch="main", name="user/repo",
+                                  compose_folder="stack/", indexed_at=None, updated_at=None)
+    assert gh_utils.fetch_compose_path(repo, None, b"") == "services: {}\n"
+    assert gh_utils.fetch_compose_path(repo, None, b"") == "services: {}\n"
+
+    assert "If-None-Match" not in fake.requester.calls[0]
+    assert fake.requester.calls[1]["If-None-Match"] == '"v1"'
+
+    r = client.get(api_v1 + "/github/cache")
+    assert r.status_code == 200
+    assert r.json() == {"hits": 1, "misses": 1, "entries": 1}
+    cache.close()
+
+
+class FakeHeadRequester:
+    def __init__(self):
+        self.calls = []
+
+    def requestJson(self, verb, url, parameters=None, headers=None):
+        self.calls.append((url, dict(headers or {})))
+        if url.endswith("/missing"):
+            return 404, {}, ""
+        if headers.get("If-None-Match") == '"head"':
+            return 304, {}, ""
+        return 200, {"etag": '"head"'}, "0123abcd\n"
+
+
+def test_resolve_branch_head_revalidates(tmp_path, monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    http_cache = importlib.import_module("utilities.http_cache")
+    models = importlib.import_module("models.indexer")
+
+    cache = http_cache.ConditionalRequestCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(gh_utils, "_response_cache", cache)
+    fake = FakeAnonymousGithub()
+    fake.requester = FakeHeadRequester()
+    monkeypatch.setattr(gh_utils.client_pool, "get_anonymous", lambda: fake)
+
+    repo = models.RepositoryModel(id="r1", url="http://example.com/repo.git", branch="main", name="user/repo",
+                                  compose_folder="", indexed_at=None, updated_at=None)
+    assert gh_utils.resolve_branch_head(repo, None, b"") == "0123abcd"
+    assert gh_utils.resolve_branch_head(repo, None, b"") == "0123abcd"
+    assert fake.requester.calls[0][0] == "/repos/user/repo/commits/main"
+    assert fake.requester.calls[0][1]["Accept"] == "application/vnd.github.sha"
+    assert fake.requester.calls[1][1]["If-None-Match"] == '"head"'
+    assert gh_utils.resolve_branch_head(repo.model_copy(update={"branch": "missing"}), None, b"") is None
+    cache.close()
+
+
+def test_response_cache_keys_by_credential_and_accept(tmp_path, monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    http_cache = importlib.import_module("utilities.http_cache")
+
+    cache = http_cache.ConditionalRequestCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(gh_utils, "_response_cache", cache)
+    fake = FakeAnonymousGithub()
+
+    assert gh_utils._conditional_get(fake, "cred-a", "/repos/user/repo/contents/x", {}, "raw") == (200, "services: {}\n")
+    # another credential or another representation never revalidates the stored body
+    gh_utils._conditional_get(fake, "cred-b", "/repos/user/repo/contents/x", {}, "raw")
+    gh_utils._conditional_get(fake, "cred-a", "/repos/user/repo/contents/x", {}, "json")
+    assert ["If-None-Match" in headers for headers in fake.requester.calls] == [False, False, False]
+    gh_utils._conditional_get(fake, "cred-a", "/repos/user/repo/contents/x", {}, "raw")
+    assert fake.requester.calls[-1]["If-None-Match"] == '"v1"'
+    assert cache.stats().entries == 3
+    cache.close()
+
+
+def test_response_cache_evicts_old_and_least_recently_used(tmp_path, monkeypatch):
+    http_cache = importlib.import_module("utilities.http_cache")
+    clock = [1000.0]
+    monkeypatch.setattr(http_cache.time, "time", lambda: clock[0])
+
+    cache = http_cache.ConditionalRequestCache(str(tmp_path / "cache.db"), max_age=100, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.store(key, '"v"', None, key)
+        clock[0] += 10
+    assert cache.revalidated("a") == "a"
+    cache.evict()
+    # b is the least recently used, a was revalidated after c was stored
+    assert cache.lookup("b") is None and cache.lookup("c") is not None
+
+    clock[0] += 95
+    cache.evict()
+    assert cache.lookup("c") is None and cache.lookup("a") is not None
+    cache.close()
+
+    # eviction also runs when the cache is opened
+    clock[0] += 1000
+    cache = http_cache.ConditionalRequestCache(str(tmp_path / "cache.db"), max_age=100)
+    assert cache.stats().entries == 0
+    cache.close()
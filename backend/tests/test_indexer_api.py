@@ -31,7 +31,7 @@ def test_list_and_add_repo(client, api_v1):
     assert repos[0]["name"] == "user/repo"
 
 
-def test_credentials_and_index(client, api_v1):
+def test_credentials_and_index(client, api_v1, run_rescan):
     cred_payload = {
         "name": "test",
         "username": "u",
@@ -62,9 +62,9 @@ def test_credentials_and_index(client, api_v1):
     r = client.post(api_v1 + "/repos", json=payload)
     assert r.status_code == 200
 
-    # now update index (may succeed or produce 200)
-    r = client.post(api_v1 + "/index")
-    assert r.status_code in (200,)
+    # now update index, the rescan runs as a background job
+    job = run_rescan()
+    assert job["status"] == "completed"
 
 
 def test_edit_and_delete_and_duplicate(client, api_v1):
@@ -102,3 +102,24 @@ def test_edit_and_delete_and_duplicate(client, api_v1):
     # delete repo
     r = client.delete(api_v1 + f"/repos/{repo_id}")
     assert r.status_code == 200
+
+
+def test_list_endpoints_render_rows_in_model_shape(client, api_v1):
+    from datetime import datetime
+    from app.models.indexer import RepositoryModel
+
+    payload = {
+        "url": "http://example.com/shape.git",
+        "branch": "main",
+        "name": "user/shape",
+        "compose_folder": "stack/",
+        "credentials_name": ""
+    }
+    assert client.post(api_v1 + "/repos", json=payload).status_code == 200
+
+    r = client.get(api_v1 + "/repos")
+    assert r.headers["content-type"] == "application/json"
+    repo = r.json()[0]
+    assert set(repo) == set(RepositoryModel.model_fields)
+    assert isinstance(datetime.fromisoformat(repo["updated_at"]), datetime)
+    assert RepositoryModel(**repo).compose_folder == "stack/"
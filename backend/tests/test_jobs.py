@@ -0,0 +1,75 @@
+import importlib
+import threading
+import time
+
+from fastapi import HTTPException
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def test_job_reports_done_failed_and_skipped(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+
+    def entry(repo, credentials, auth_key):
+        if repo.name == "user/broken":
+            raise HTTPException(status_code=500, detail="boom")
+        if repo.name == "user/empty":
+            return None
+        return NewIndexEntryModel(repo_id=repo.id, compose_path="services: {}")
+
+    monkeypatch.setattr(svc, "make_index_entry", entry)
+    add_repos(["user/ok1", "user/ok2", "user/broken", "user/empty"])
+
+    job = run_rescan()
+    assert job["status"] == "completed"
+    assert job["progress"] == {"done": 2, "failed": 1, "skipped": 1, "deferred": 0, "retry_at": None}
+    assert len(client.get(api_v1 + "/index").json()) == 2
+
+    jobs = client.get(api_v1 + "/index/jobs").json()
+    assert jobs[0]["id"] == job["id"]
+
+
+def test_identical_pending_jobs_are_deduplicated(client, api_v1, add_repos, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    release = threading.Event()
+
+    def blocked(repo, credentials, auth_key):
+        release.wait(5)
+        return None
+
+    monkeypatch.setattr(svc, "make_index_entry", blocked)
+    add_repos(["user/slow"])
+
+    running = client.post(api_v1 + "/index").json()["job_id"]
+    for _ in range(200):
+        if client.get(api_v1 + f"/index/jobs/{running}").json()["status"] == "running":
+            break
+        time.sleep(0.01)
+
+    first = client.post(api_v1 + "/index")
+    second = client.post(api_v1 + "/index")
+    forced = client.post(api_v1 + "/index", params={"force": True})
+    release.set()
+
+    assert first.status_code == 202
+    assert first.json()["job_id"] != running
+    assert second.json()["job_id"] == first.json()["job_id"]
+    assert second.json()["message"] == "Re-indexing already queued."
+    assert forced.json()["job_id"] != first.json()["job_id"]
+
+
+def test_unknown_job_is_404(client, api_v1):
+    assert client.get(api_v1 + "/index/jobs/missing").status_code == 404
+
+
+def test_scheduler_submits_periodic_rescans(client, api_v1):
+    jobs = client.app.state.jobs
+    client.portal.call(jobs.start_scheduler, 0.05)
+    try:
+        for _ in range(200):
+            if any(job.trigger == "schedule" for job in jobs.list()):
+                break
+            time.sleep(0.01)
+        assert any(job.trigger == "schedule" for job in jobs.list())
+    finally:
+        client.portal.call(jobs.shutdown)
@@ -0,0 +1,44 @@
+import importlib
+import time
+
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def _samples(client):
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    return {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(r.text) for sample in family.samples}
+
+
+def test_metrics_cover_routes_database_and_rescans(client, api_v1, run_rescan):
+    r = client.post(api_v1 + "/repos", json={"url": "http://example.com/repo.git", "branch": "main",
+                                             "name": "user/repo", "compose_folder": "", "credentials_name": ""})
+    assert r.status_code == 200
+    before = _samples(client)
+    rescan_key = ("rescan_duration_seconds_count", (("status", "completed"), ("trigger", "api")))
+    skipped_key = ("rescan_repos_total", (("outcome", "skipped"),))
+    assert run_rescan()["status"] == "completed"
+    client.delete(api_v1 + "/repos/does-not-exist")
+
+    samples = _samples(client)
+    # requests are labelled with the route that served them, not the requested path
+    assert samples[("http_request_duration_seconds_count",
+                    (("method", "POST"), ("route", "indexer:add-repo"), ("status", "200")))] >= 1
+    assert not any("does-not-exist" in value for _, labels in samples for _, value in labels)
+    assert samples[("db_query_duration_seconds_count", (("operation", "SELECT"),))] > 0
+    assert samples[("db_query_duration_seconds_count", (("operation", "INSERT"),))] > 0
+    assert samples[rescan_key] == before.get(rescan_key, 0) + 1
+    # the conftest stub answers every repository with nothing to index
+    assert samples[skipped_key] == before.get(skipped_key, 0) + 1
+
+
+def test_metrics_expose_github_quota(client):
+    rate_limit = importlib.import_module("utilities.rate_limit")
+    rate_limit.rate_limiter.update("metrics-test", 200, {
+        "x-ratelimit-limit": "5000", "x-ratelimit-remaining": "4321", "x-ratelimit-reset": str(time.time() + 60)})
+
+    samples = _samples(client)
+    assert samples[("github_rate_limit_remaining", (("bucket", "metrics-test"),))] == 4321
+    assert samples[("github_rate_limit_limit", (("bucket", "metrics-test"),))] == 5000
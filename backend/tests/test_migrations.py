@@ -0,0 +1,119 @@
+import importlib
+import threading
+import zlib
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, inspect, text
+
+migrations = importlib.import_module("migrations")
+database = importlib.import_module("database")
+
+
+def _schema(engine):
+    inspector = inspect(engine)
+    schema = {}
+    for table in inspector.get_table_names():
+        if table == migrations.VERSION_TABLE or table.startswith("compose_fts"):
+            continue
+        schema[table] = {
+            "columns": {(c["name"], str(c["type"]), c["nullable"]) for c in inspector.get_columns(table)},
+            "indexes": {(i["name"], tuple(i["column_names"]), bool(i["unique"])) for i in inspector.get_indexes(table)},
+            "unique": {(u["name"], tuple(u["column_names"])) for u in inspector.get_unique_constraints(table)},
+            "foreign_keys": {(tuple(f["constrained_columns"]), f["referred_table"])
+                             for f in inspector.get_foreign_keys(table)},
+        }
+    return schema
+
+
+def test_migrated_schema_matches_the_models(tmp_path):
+    db = database.Database(f"sqlite:///{tmp_path / 'migrated.db'}")
+    assert [m.version for m in db.applied_migrations] == [m.version for m in migrations.MIGRATIONS]
+
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    database.Base.metadata.create_all(reference)
+    # a model change needs a migration, this fails until there is one
+    assert _schema(db.engine) == _schema(reference)
+
+
+def test_up_to_date_database_costs_one_read(tmp_path):
+    url = f"sqlite:///{tmp_path / 'db.db'}"
+    database.Database(url).engine.dispose()
+
+    statements = []
+    engine = create_engine(url)
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    assert migrations.migrate(engine) == []
+    assert statements == [f"SELECT version FROM {migrations.VERSION_TABLE} WHERE id = 1"]
+
+
+def test_database_made_by_create_all_of_the_first_release_is_upgraded(tmp_path):
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(url)
+    content = "services:\n  web:\n    image: nginx:1.25\n    ports:\n      - \"8080:80\"\n"
+    now = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        # the schema create_all made before migrations existed
+        migrations._initial_schema(conn)
+        conn.execute(text("INSERT INTO repos (id, url, name, branch, compose_folder, credentials_name, "
+                          "indexed_at, updated_at) VALUES ('r1', 'http://example.com/a.git', 'user/a', 'main', '', "
+                          "'', :now, :now)"), {"now": now})
+        # two entries of one repository, the later one is kept
+        for entry_id, compose, updated in (("i0", "services: {}\n", datetime(2023, 1, 1)), ("i1", content, now)):
+            conn.execute(text('INSERT INTO "index" (id, repo_id, compose_path, indexed_at, updated_at) '
+                              "VALUES (:id, 'r1', :compose, :updated, :updated)"),
+                         {"id": entry_id, "compose": compose, "updated": updated})
+    engine.dispose()
+
+    db = database.Database(url)
+    assert [m.version for m in db.applied_migrations] == [2, 3, 4, 5, 6]
+    with db.engine.connect() as conn:
+        assert migrations.current_version(conn) == migrations.HEAD
+        entry = conn.execute(text('SELECT id, path, compose_hash, updated_at FROM "index"')).one()
+        assert (entry.id, entry.path) == ("i1", "")
+        data = conn.execute(text("SELECT data FROM compose_blobs WHERE hash = :hash"),
+                            {"hash": entry.compose_hash}).scalar_one()
+        assert zlib.decompress(data).decode("utf-8") == content
+        assert conn.execute(text("SELECT image_name, image_tag FROM compose_services")).one() == ("nginx", "1.25")
+        assert conn.execute(text("SELECT published FROM compose_ports")).scalar_one() == 8080
+        assert conn.execute(text("SELECT hash FROM compose_fts WHERE compose_fts MATCH 'nginx'")).scalar_one() == \
+            entry.compose_hash
+
+    reference = create_engine(f"sqlite:///{tmp_path / 'reference.db'}")
+    database.Base.metadata.create_all(reference)
+    assert _schema(db.engine) == _schema(reference)
+
+
+def test_processes_starting_together_share_one_encryption_key(tmp_path):
+    url = f"sqlite:///{tmp_path / 'db.db'}"
+    barrier = threading.Barrier(4)
+    keys = []
+
+    def start():
+        barrier.wait()
+        db = database.Database(url)
+        with db.get_session() as session:
+            keys.extend(session.scalars(text("SELECT key FROM auth")))
+        db.engine.dispose()
+
+    threads = [threading.Thread(target=start) for _ in range(barrier.parties)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(keys) == barrier.parties and len(set(keys)) == 1
+
+
+def test_structure_migration_parses_with_its_own_copy():
+    content = ("services:\n  web:\n    image: registry:5000/nginx:1.25\n    ports: ['8080-8081:80-81/udp']\n"
+               "    volumes: ['./html:/usr/share/nginx/html', 'data:/data']\n    networks: [front]\n"
+               "  worker: {}\nvolumes:\n  data: {}\nnetworks:\n  front: {}\n")
+    rows = migrations._parse_compose(content)
+    assert rows["services"] == [
+        {"service": "web", "image": "registry:5000/nginx:1.25", "image_name": "registry:5000/nginx",
+         "image_tag": "1.25"},
+        {"service": "worker", "image": None, "image_name": None, "image_tag": None}]
+    assert [(port["published"], port["target"], port["protocol"]) for port in rows["ports"]] == [
+        (8080, 80, "udp"), (8081, 81, "udp")]
+    assert [(volume["service"], volume["source"], volume["type"]) for volume in rows["volumes"]] == [
+        ("web", "./html", "bind"), ("web", "data", "volume"), (None, "data", "volume")]
+    assert rows["networks"] == [{"service": "web", "network": "front"}, {"service": None, "network": "front"}]
@@ -0,0 +1,84 @@
+def _collect(client, url, params):
+    names, cursor = [], None
+    while True:
+        query = dict(params)
+        if cursor:
+            query["cursor"] = cursor
+        r = client.get(url, params=query)
+        assert r.status_code == 200
+        names.extend(repo["name"] for repo in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return names
+
+
+def test_repos_keyset_pages_in_both_directions(client, api_v1, add_repos):
+    add_repos(["user/c", "user/a", "user/e", "user/b", "user/d"])
+
+    r = client.get(api_v1 + "/repos", params={"limit": 2, "count": True})
+    assert [repo["name"] for repo in r.json()] == ["user/a", "user/b"]
+    assert r.headers["X-Total-Count"] == "5"
+
+    assert _collect(client, api_v1 + "/repos", {"limit": 2}) == ["user/a", "user/b", "user/c", "user/d", "user/e"]
+    assert _collect(client, api_v1 + "/repos", {"limit": 2, "order": "desc"}) == [
+        "user/e", "user/d", "user/c", "user/b", "user/a"]
+    assert len(_collect(client, api_v1 + "/repos", {"limit": 3, "sort": "updated_at"})) == 5
+
+
+def test_repos_filters_run_in_the_database(client, api_v1, add_repos):
+    add_repos(["user/a"])
+    add_repos(["user/a"], branch="dev")
+    add_repos(["user/b"])
+
+    r = client.get(api_v1 + "/repos", params={"name": "user/a", "count": True})
+    assert r.headers["X-Total-Count"] == "2"
+    assert {repo["branch"] for repo in r.json()} == {"main", "dev"}
+
+    r = client.get(api_v1 + "/repos", params={"name": "user/a", "branch": "dev"})
+    assert len(r.json()) == 1
+    assert "X-Next-Cursor" not in r.headers
+
+
+def test_invalid_cursor_and_limit(client, api_v1):
+    assert client.get(api_v1 + "/repos", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get(api_v1 + "/index", params={"limit": 0}).status_code == 422
+
+
+def _ndjson(response):
+    import json
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_lists_stream_as_ndjson(client, api_v1, add_repos, run_rescan, monkeypatch):
+    import importlib
+    from app.models.indexer import NewIndexEntryModel, RepositoryModel
+
+    svc = importlib.import_module("services.indexer")
+    # small chunks, so the stream spans several database reads and writes
+    monkeypatch.setattr(svc, "STREAM_CHUNK_SIZE", 2)
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=f"services: {{}}\n# {repo.name}\n"))
+    add_repos(["user/c", "user/a", "user/e", "user/b", "user/d"])
+
+    rows = _ndjson(client.get(api_v1 + "/repos", headers={"Accept": "application/x-ndjson"}))
+    assert [row["name"] for row in rows] == ["user/a", "user/b", "user/c", "user/d", "user/e"]
+    assert set(rows[0]) == set(RepositoryModel.model_fields)
+    assert rows == client.get(api_v1 + "/repos").json()
+
+    # filters, order, cursor and limit apply like on the paged list
+    first = client.get(api_v1 + "/repos", params={"limit": 2, "order": "desc"})
+    rows = _ndjson(client.get(api_v1 + "/repos", params={
+        "stream": True, "order": "desc", "limit": 2, "cursor": first.headers["X-Next-Cursor"]}))
+    assert [row["name"] for row in rows] == ["user/c", "user/b"]
+    assert _ndjson(client.get(api_v1 + "/repos", params={"stream": True, "name": "user/d"}))[0]["name"] == "user/d"
+
+    r = client.post(api_v1 + "/credentials", json={"name": "c", "username": "u", "password": "", "token": "t"})
+    assert r.status_code == 200
+    credentials = _ndjson(client.get(api_v1 + "/credentials", params={"stream": True}))
+    assert credentials == client.get(api_v1 + "/credentials").json()
+
+    assert run_rescan()["status"] == "completed"
+    index = _ndjson(client.get(api_v1 + "/index", params={"stream": True, "sort": "id"}))
+    assert len(index) == 5 and index == client.get(api_v1 + "/index", params={"sort": "id"}).json()
@@ -0,0 +1,127 @@
+import importlib
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def _headers(remaining, limit=60, reset_in=60.0):
+    return {"x-ratelimit-limit": str(limit), "x-ratelimit-remaining": str(remaining),
+            "x-ratelimit-reset": str(time.time() + reset_in)}
+
+
+def test_bucket_paces_and_defers(monkeypatch):
+    rate_limit = importlib.import_module("utilities.rate_limit")
+    errors = importlib.import_module("core.errors")
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    limiter = rate_limit.RateLimiter(reserve=2, pacing_fraction=0.5, max_delay=10.0)
+
+    # unknown buckets are not held back
+    limiter.acquire("token")
+    limiter.update("token", 200, _headers(40, limit=50))
+    limiter.acquire("token")
+    assert sleeps == []
+
+    limiter.update("token", 200, _headers(6, limit=50, reset_in=30.0))
+    limiter.acquire("token")
+    assert len(sleeps) == 1 and 5.0 < sleeps[0] <= 10.0
+
+    limiter.update("token", 200, _headers(2, limit=50))
+    with pytest.raises(errors.RateLimitExceeded):
+        limiter.acquire("token")
+
+    # a refused request closes the bucket until the reset, a new window refills it
+    with pytest.raises(errors.RateLimitExceeded) as exc:
+        limiter.update("other", 403, _headers(0, reset_in=-1.0))
+    assert exc.value.key == "other"
+    limiter.acquire("other")
+    with pytest.raises(errors.RateLimitExceeded):
+        limiter.update("other", 429, {"retry-after": "30"})
+    # a 403 that is not about the quota is left to the caller
+    limiter.update("fresh", 403, _headers(10))
+
+
+def test_bucket_without_reset_backs_off_and_refills(monkeypatch):
+    rate_limit = importlib.import_module("utilities.rate_limit")
+    errors = importlib.import_module("core.errors")
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: clock[0])
+    limiter = rate_limit.RateLimiter(reserve=2)
+
+    # an answer without X-RateLimit-Reset leaves the bucket exhausted with no window
+    limiter.update("token", 200, {"x-ratelimit-limit": "50", "x-ratelimit-remaining": "2"})
+    with pytest.raises(errors.RateLimitExceeded) as exc:
+        limiter.acquire("token")
+    assert exc.value.reset_at == 1000.0 + rate_limit.UNKNOWN_RESET_SECONDS
+
+    clock[0] += rate_limit.UNKNOWN_RESET_SECONDS
+    limiter.acquire("token")
+    assert limiter.stats()[0].remaining == 49
+
+
+def test_public_repos_use_the_credential_with_most_quota(monkeypatch):
+    gh_utils = importlib.import_module("utilities.github_utils")
+    rate_limit = importlib.import_module("utilities.rate_limit")
+    models = importlib.import_module("models.indexer")
+
+    limiter = rate_limit.RateLimiter(reserve=0)
+    monkeypatch.setattr(gh_utils, "rate_limiter", limiter)
+    pool = gh_utils.GithubClientPool()
+    monkeypatch.setattr(pool, "get", lambda credentials, auth_key: f"client-{credentials.id}")
+    monkeypatch.setattr(pool, "get_anonymous", lambda: "anonymous-client")
+    key = Fernet.generate_key()
+    pool.share([models.RepoCredentialsModel(id=cred_id, name=cred_id, username="u", password=None,
+                                            token=Fernet(key).encrypt(b"t")) for cred_id in ("a", "b")])
+
+    limiter.update("a", 200, _headers(100, limit=5000))
+    limiter.update("b", 200, _headers(4000, limit=5000))
+    limiter.update(rate_limit.ANONYMOUS, 200, _headers(60))
+    assert pool.get_for_public(key) == ("client-b", "b")
+
+    limiter.update("b", 200, _headers(10, limit=5000))
+    assert pool.get_for_public(key) == ("client-a", "a")
+    pool.invalidate()
+    assert pool.get_for_public(key) == ("anonymous-client", rate_limit.ANONYMOUS)
+
+
+def test_rate_limited_repos_are_requeued(client, api_v1, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    errors = importlib.import_module("core.errors")
+    attempts = {}
+
+    def entry(repo, credentials, auth_key):
+        attempts[repo.name] = attempts.get(repo.name, 0) + 1
+        if repo.name == "user/limited" and attempts[repo.name] == 1:
+            raise errors.RateLimitExceeded("anonymous", time.time() + 0.1)
+        return NewIndexEntryModel(repo_id=repo.id, compose_path=f"services: {{}}\n# {repo.name}\n")
+
+    monkeypatch.setattr(svc, "make_index_entry", entry)
+    for name in ("user/ok", "user/limited"):
+        payload = {"url": f"http://example.com/{name}.git", "branch": "main", "name": name,
+                   "compose_folder": "", "credentials_name": ""}
+        assert client.post(api_v1 + "/repos", json=payload).status_code == 200
+
+    job = run_rescan()
+    assert job["status"] == "completed"
+    assert job["progress"]["deferred"] == 1 and job["progress"]["failed"] == 0
+    assert job["progress"]["retry_at"] is not None
+
+    for _ in range(200):
+        retries = [j for j in client.get(api_v1 + "/index/jobs").json() if j["trigger"] == "retry"]
+        if retries and retries[0]["status"] == "completed":
+            break
+        time.sleep(0.01)
+    assert len(retries) == 1 and retries[0]["status"] == "completed"
+    assert len(retries[0]["repo_ids"]) == 1
+    assert attempts == {"user/ok": 1, "user/limited": 2}
+    assert len(client.get(api_v1 + "/index").json()) == 2
+
+
+def test_rate_limits_endpoint(client, api_v1):
+    rate_limit = importlib.import_module("utilities.rate_limit")
+    rate_limit.rate_limiter.update("endpoint-test", 200, _headers(42))
+    buckets = {bucket["key"]: bucket for bucket in client.get(api_v1 + "/github/rate-limits").json()}
+    assert buckets["endpoint-test"]["remaining"] == 42
@@ -0,0 +1,103 @@
+import importlib
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def test_repos_answer_304_until_a_write(client, api_v1, add_repos, monkeypatch):
+    routes = importlib.import_module("api.routes.indexer")
+    add_repos(["user/a"])
+
+    first = client.get(api_v1 + "/repos", params={"limit": 1, "count": True})
+    etag = first.headers["ETag"]
+    assert first.headers["X-Total-Count"] == "1"
+
+    # a repeated poll reads the table versions only, neither the rows nor the cache
+    def fail(*args, **kwargs):
+        raise AssertionError("the database was read")
+    monkeypatch.setattr(routes, "list_repositories", fail)
+    r = client.get(api_v1 + "/repos", params={"count": True, "limit": 1}, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.content == b""
+
+    # a client without the ETag gets the cached body, with its page headers
+    r = client.get(api_v1 + "/repos", params={"limit": 1, "count": True})
+    assert r.status_code == 200
+    assert r.content == first.content
+    assert r.headers["X-Total-Count"] == "1"
+    assert r.headers["ETag"] == etag
+    monkeypatch.undo()
+
+    add_repos(["user/b"])
+    r = client.get(api_v1 + "/repos", params={"limit": 1, "count": True}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.headers["X-Total-Count"] == "2"
+
+    repo_id = r.json()[0]["id"]
+    etag = r.headers["ETag"]
+    assert client.delete(api_v1 + f"/repos/{repo_id}").status_code == 200
+    r = client.get(api_v1 + "/repos", params={"limit": 1, "count": True}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["X-Total-Count"] == "1"
+
+
+def test_writes_of_another_worker_are_seen(client, api_v1, add_repos):
+    from sqlalchemy import text
+
+    add_repos(["user/a"])
+    first = client.get(api_v1 + "/repos", params={"count": True})
+    assert first.headers["X-Total-Count"] == "1"
+
+    # another worker writes a repository and bumps its version in the same transaction,
+    # neither the ETag nor the body cached by this process may be answered afterwards
+    session = client.app.state.db.get_session()
+    try:
+        session.execute(text("INSERT INTO repos (id, url, name, branch, compose_folder, credentials_name) "
+                             "VALUES ('other', 'http://example.com/b.git', 'user/b', 'main', '', '')"))
+        session.execute(text("UPDATE table_versions SET version = version + 1 WHERE name = 'repos'"))
+        session.commit()
+    finally:
+        session.close()
+
+    r = client.get(api_v1 + "/repos", params={"count": True}, headers={"If-None-Match": first.headers["ETag"]})
+    assert r.status_code == 200
+    assert r.headers["X-Total-Count"] == "2"
+    r = client.get(api_v1 + "/repos", params={"count": True})
+    assert r.headers["X-Total-Count"] == "2"
+
+
+def test_index_etag_changes_with_a_rescan_only(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=f"services: {{}}\n# {repo.name}\n"))
+    add_repos(["user/a"])
+
+    empty = client.get(api_v1 + "/index")
+    assert empty.json() == []
+    # repositories are another table, adding one leaves the index version alone
+    add_repos(["user/b"])
+    assert client.get(api_v1 + "/index", headers={"If-None-Match": empty.headers["ETag"]}).status_code == 304
+
+    assert run_rescan()["status"] == "completed"
+    r = client.get(api_v1 + "/index", headers={"If-None-Match": empty.headers["ETag"]})
+    assert r.status_code == 200
+    assert len(r.json()) == 2
+    # the same query in another parameter order is the same response
+    assert client.get(api_v1 + "/index", params={"sort": "updated_at", "order": "asc"}).headers["ETag"] == \
+        client.get(api_v1 + "/index", params={"order": "asc", "sort": "updated_at"}).headers["ETag"]
+
+
+def test_read_cache_evicts_least_recently_used():
+    read_cache = importlib.import_module("core.read_cache")
+    cache = read_cache.ReadCache(max_entries=2, max_bytes=10)
+    cache.put("a", read_cache.CachedBody((0,), b"1234", None, {}))
+    cache.put("b", read_cache.CachedBody((0,), b"1234", None, {}))
+    assert cache.get("a", (0,)) is not None
+    cache.put("c", read_cache.CachedBody((0,), b"1234", None, {}))
+    assert cache.get("b", (0,)) is None
+    assert cache.get("a", (1,)) is None
+    # bodies larger than the whole budget are not kept
+    cache.put("d", read_cache.CachedBody((0,), b"x" * 11, None, {}))
+    assert cache.get("d", (0,)) is None
+    assert cache.get("c", (0,)) is not None
@@ -0,0 +1,127 @@
+import importlib
+import threading
+import time
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def test_rescan_runs_fetches_concurrently_within_limits(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    monkeypatch.setattr(svc, "RESCAN_MAX_CONCURRENCY", 3)
+    monkeypatch.setattr(svc, "RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL", 8)
+
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def slow_entry(repo, credentials, auth_key):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        return NewIndexEntryModel(repo_id=repo.id, compose_path="services: {}")
+
+    monkeypatch.setattr(svc, "make_index_entry", slow_entry)
+    add_repos([f"user/repo{i}" for i in range(9)])
+
+    assert run_rescan()["status"] == "completed"
+    assert state["peak"] == 3
+
+    r = client.get(api_v1 + "/index")
+    assert len(r.json()) == 9
+
+
+def test_rescan_respects_per_credential_limit(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    monkeypatch.setattr(svc, "RESCAN_MAX_CONCURRENCY", 8)
+    monkeypatch.setattr(svc, "RESCAN_MAX_CONCURRENCY_PER_CREDENTIAL", 2)
+
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def slow_entry(repo, credentials, auth_key):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        return None
+
+    monkeypatch.setattr(svc, "make_index_entry", slow_entry)
+    # all anonymous repositories share one credential slot group
+    add_repos([f"user/repo{i}" for i in range(6)])
+
+    assert run_rescan()["status"] == "completed"
+    assert state["peak"] == 2
+
+
+def test_rescan_only_fetches_moved_branches(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    gh_utils = importlib.import_module("utilities.github_utils")
+    heads = {f"user/repo{i}": "a" * 40 for i in range(3)}
+    resolved, fetched = [], []
+
+    def resolve(repo, credentials, auth_key):
+        resolved.append(repo.name)
+        return heads[repo.name]
+
+    def fetch(repo, credentials, auth_key):
+        fetched.append(repo.name)
+        return f"services: {{}}\n# {heads[repo.name]}\n"
+
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: gh_utils.make_index_entry_with(
+        fetch, resolve, repo, credentials, auth_key))
+    add_repos([f"user/repo{i}" for i in range(3)])
+
+    assert run_rescan()["status"] == "completed"
+    assert len(fetched) == 3
+    entries = {entry["repo_id"]: entry for entry in client.get(api_v1 + "/index").json()}
+    assert {entry["commit_sha"] for entry in entries.values()} == {"a" * 40}
+    assert all(entry["blob_sha"] for entry in entries.values())
+
+    # unchanged heads cost one lookup each and no content fetch
+    job = run_rescan()
+    assert len(resolved) == 6 and len(fetched) == 3
+    assert job["progress"] == {"done": 0, "failed": 0, "skipped": 3, "deferred": 0, "retry_at": None}
+
+    # a moved branch is refreshed without force
+    heads["user/repo1"] = "b" * 40
+    job = run_rescan()
+    assert fetched[3:] == ["user/repo1"]
+    assert job["progress"]["done"] == 1
+    assert {entry["commit_sha"] for entry in client.get(api_v1 + "/index").json()} == {"a" * 40, "b" * 40}
+
+    # force fetches every repository again
+    assert run_rescan(force=True)["status"] == "completed"
+    assert len(fetched) == 7
+    assert len(client.get(api_v1 + "/index").json()) == 3
+
+
+def test_rescan_query_count_does_not_grow_with_repos(client, api_v1, add_repos, run_rescan, monkeypatch):
+    from sqlalchemy import event
+
+    svc = importlib.import_module("services.indexer")
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path="services: {}"))
+    r = client.post(api_v1 + "/credentials", json={"name": "cred", "username": "u", "password": "p", "token": ""})
+    assert r.status_code == 200
+    add_repos([f"user/repo{i}" for i in range(25)], credentials_name="cred")
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = client.app.state.db.async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        assert run_rescan()["status"] == "completed"
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert len(client.get(api_v1 + "/index").json()) == 25
+    # shared credentials, count, work list and one write batch
+    # (known blobs, new blobs, search content, index upsert and table version)
+    assert len([s for s in statements if s.lstrip().upper().startswith(("SELECT", "INSERT"))]) <= 8
@@ -0,0 +1,61 @@
+import importlib
+
+from app.models.indexer import NewIndexEntryModel
+
+
+def test_search_ranks_and_highlights(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    contents = {
+        "user/proxy": "services:\n  proxy:\n    image: traefik:v3\n    labels:\n      - traefik.enable=true\n",
+        "user/web": "services:\n  web:\n    image: nginx\n  proxy:\n    image: traefik:v2\n",
+        "user/db": "services:\n  db:\n    image: postgres:16\n",
+    }
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=contents[repo.name]))
+    add_repos(contents)
+    assert run_rescan()["status"] == "completed"
+
+    r = client.get(api_v1 + "/index/search", params={"q": "traefik"})
+    assert r.status_code == 200
+    results = r.json()
+    assert [result["repo_name"] for result in results] == ["user/proxy", "user/web"]
+    assert "[traefik]" in results[0]["snippet"]
+
+    assert [result["repo_name"] for result in client.get(
+        api_v1 + "/index/search", params={"q": "postgres:16"}).json()] == ["user/db"]
+    assert len(client.get(api_v1 + "/index/search", params={"q": "post*"}).json()) == 1
+    assert client.get(api_v1 + "/index/search", params={"q": 'nginx" OR "x'}).status_code == 200
+    assert client.get(api_v1 + "/index/search", params={"q": ""}).status_code == 422
+
+
+def test_search_pages_and_follows_index_changes(client, api_v1, add_repos, run_rescan, monkeypatch):
+    svc = importlib.import_module("services.indexer")
+    names = [f"user/repo{i}" for i in range(5)]
+    content = {name: f"services:\n  app{i}:\n    image: redis\n" for i, name in enumerate(names)}
+    monkeypatch.setattr(svc, "make_index_entry", lambda repo, credentials, auth_key: NewIndexEntryModel(
+        repo_id=repo.id, compose_path=content[repo.name]))
+    add_repos(names)
+    assert run_rescan()["status"] == "completed"
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "redis", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(api_v1 + "/index/search", params=params)
+        seen.extend(result["index_id"] for result in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+    # updated content replaces the old match, deleted repositories drop out
+    content["user/repo0"] = "services:\n  app0:\n    image: memcached\n"
+    assert run_rescan(force=True)["status"] == "completed"
+    repos = {repo["name"]: repo["id"] for repo in client.get(api_v1 + "/repos").json()}
+    assert client.delete(api_v1 + f"/repos/{repos['user/repo1']}").status_code == 200
+
+    assert {result["repo_name"] for result in client.get(api_v1 + "/index/search", params={"q": "redis"}).json()} == {
+        "user/repo2", "user/repo3", "user/repo4"}
+    assert [result["repo_name"] for result in client.get(
+        api_v1 + "/index/search", params={"q": "memcached"}).json()] == ["user/repo0"]
@@ -0,0 +1,77 @@
+import importlib
+import json
+import threading
+import time
+
+from loguru import logger
+
+
+def test_request_id_is_echoed_or_generated(client, api_v1):
+    r = client.get(api_v1 + "/repos", headers={"X-Request-ID": "abc-123"})
+    assert r.headers["x-request-id"] == "abc-123"
+
+    # ids that could break headers or logs are replaced
+    r = client.get(api_v1 + "/repos", headers={"X-Request-ID": "bad id\twith spaces"})
+    assert len(r.headers["x-request-id"]) == 32
+
+
+def test_request_spans_are_exported_to_file(client, api_v1, tmp_path, monkeypatch):
+    tracing = importlib.import_module("core.tracing")
+    exporter = tracing.TraceExporter("file", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+
+    r = client.get(api_v1 + "/repos", headers={"X-Request-ID": "trace-me"})
+    assert r.status_code == 200
+    exporter.flush()
+
+    documents = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    spans = [span for document in documents for span in document["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    root = next(span for span in spans if "parentSpanId" not in span)
+    assert root["name"] == "GET indexer:list-repos"
+    assert {"key": "request.id", "value": {"stringValue": "trace-me"}} in root["attributes"]
+    children = [span for span in spans if span.get("parentSpanId") == root["spanId"]]
+    assert {"db.query", "serialize"} <= {span["name"] for span in children}
+    assert all(span["traceId"] == root["traceId"] for span in spans)
+
+
+def test_slow_request_logs_breakdown(client, api_v1, monkeypatch):
+    tracing = importlib.import_module("core.tracing")
+    monkeypatch.setattr(tracing, "TRACE_SLOW_REQUEST_MS", 0.001)
+    messages = []
+    sink = logger.add(messages.append, level="WARNING", format="{message}")
+    try:
+        client.get(api_v1 + "/repos", headers={"X-Request-ID": "slow-one"})
+    finally:
+        logger.remove(sink)
+
+    slow = [message for message in messages if "slow-one" in message]
+    assert len(slow) == 1
+    assert "Slow GET indexer:list-repos" in slow[0] and "db.query" in slow[0]
+
+
+def test_spans_are_noops_outside_a_trace():
+    tracing = importlib.import_module("core.tracing")
+    with tracing.span("orphan") as current:
+        assert current is None
+    assert tracing.start_span("orphan") is None
+
+
+def test_sampling_profiler_writes_folded_stacks(tmp_path):
+    tracing = importlib.import_module("core.tracing")
+
+    def busy_wait():
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            pass
+
+    worker = threading.Thread(target=busy_wait)
+    worker.start()
+    profiler = tracing.SamplingProfiler(worker.ident, 0.005)
+    profiler.start()
+    worker.join()
+    stacks = profiler.stop()
+
+    assert any("busy_wait" in stack for stack in stacks)
+    path = tracing.write_profile("req", stacks, str(tmp_path))
+    line = path.read_text().splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
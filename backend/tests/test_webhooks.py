@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import importlib
+import json
+
+from app.models.indexer import NewIndexEntryModel
+
+SECRET = "hook-secret"
+
+
+def _github_push(paths, ref="refs/heads/main"):
+    return {
+        "ref": ref,
+        "before": "1" * 40,
+        "after": "2" * 40,
+        "repository": {"clone_url": "https://github.com/user/repo.git", "ssh_url": "git@github.com:user/repo.git",
+                       "html_url": "https://github.com/user/repo"},
+        "commits": [{"added": [], "modified": paths, "removed": []}],
+    }
+
+
+def _post(client, api_v1, payload, secret=SECRET, event="push"):
+    body = json.dumps(payload).encode("utf-8")
+    signature = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return client.post(api_v1 + "/webhooks/push", content=body, headers={
+        "X-Hub-Signature-256": f"sha256={signature}", "X-GitHub-Event": event,
+        "Content-Type": "application/json"})
+
+
+def _enable(monkeypatch):
+    monkeypatch.setattr(importlib.import_module("api.routes.webhooks"), "WEBHOOK_SECRET", SECRET)
+
+
+def test_push_reindexes_matching_repos_only(client, api_v1, add_repos, monkeypatch):
+    _enable(monkeypatch)
+    svc = importlib.import_module("services.indexer")
+    calls = []
+
+    def entry(repo, credentials, auth_key):
+        calls.append(repo.url)
+        return NewIndexEntryModel(repo_id=repo.id, compose_path="services: {}\n")
+
+    monkeypatch.setattr(svc, "make_index_entry", entry)
+    # stored with other spellings of the pushed url
+    add_repos(["user/repo"], url="git@github.com:user/repo.git", compose_folder="stack/")
+    add_repos(["user/repo"], url="https://github.com/user/repo", branch="dev", compose_folder="stack/")
+    add_repos(["user/repo"], url="https://github.com/user/other.git", compose_folder="stack/")
+
+    r = _post(client, api_v1, _github_push(["stack/docker-compose.yml"]))
+    assert r.status_code == 202
+    assert len(r.json()["repo_ids"]) == 1
+    client.portal.call(client.app.state.jobs.join)
+    job = client.get(api_v1 + f"/index/jobs/{r.json()['job_id']}").json()
+    assert job["trigger"] == "webhook" and job["status"] == "completed"
+    assert calls == ["git@github.com:user/repo.git"]
+
+
+def test_push_outside_compose_folder_is_ignored(client, api_v1, add_repos, monkeypatch):
+    _enable(monkeypatch)
+    add_repos(["user/repo"], url="https://github.com/user/repo.git", compose_folder="stack/")
+
+    r = _post(client, api_v1, _github_push(["README.md", "stacks/other.yml"]))
+    assert r.status_code == 200
+    assert r.json()["message"] == "Push does not touch the compose folder."
+    assert r.json()["job_id"] is None
+
+    assert _post(client, api_v1, _github_push(["README.md"], ref="refs/tags/v1")).status_code == 400
+    assert _post(client, api_v1, {"zen": "hi"}, event="ping").json()["message"] == "Ignored ping event."
+    assert client.get(api_v1 + "/index/jobs").json() == []
+
+
+def test_push_to_discovered_stack_in_subfolder(client, api_v1, add_repos, monkeypatch):
+    _enable(monkeypatch)
+    monkeypatch.setattr(importlib.import_module("services.webhooks"), "COMPOSE_DISCOVERY", True)
+    monkeypatch.setattr(importlib.import_module("services.indexer"), "make_index_entry",
+                        lambda repo, credentials, auth_key: None)
+    # discovery indexes compose files at any depth of the whole tree
+    add_repos(["user/repo"], url="https://github.com/user/repo.git", compose_folder="")
+
+    r = _post(client, api_v1, _github_push(["stacks/web/README.md", "stacks/web/app.yml"]))
+    assert r.json()["job_id"] is None
+
+    r = _post(client, api_v1, _github_push(["stacks/web/README.md", "stacks/web/compose.yaml"]))
+    assert r.status_code == 202
+    assert len(r.json()["repo_ids"]) == 1
+    client.portal.call(client.app.state.jobs.join)
+
+
+def test_generic_push_and_signatures(client, api_v1, add_repos, monkeypatch):
+    add_repos(["user/repo"], url="https://git.example.com/user/repo.git", compose_folder="")
+    payload = {"url": "https://git.example.com/user/repo", "branch": "main"}
+    assert _post(client, api_v1, payload).status_code == 404
+
+    _enable(monkeypatch)
+    assert _post(client, api_v1, payload, secret="wrong").status_code == 401
+    body = json.dumps(payload).encode("utf-8")
+    r = client.post(api_v1 + "/webhooks/push", content=body, headers={"X-Gitlab-Token": SECRET})
+    assert r.status_code == 202
+    r = _post(client, api_v1, {**payload, "paths": ["docker-compose.yml"]})
+    assert r.status_code == 202
+    assert _post(client, api_v1, {**payload, "paths": ["docs/index.md"]}).status_code == 200
+
+
+def test_normalize_url():
+    webhooks = importlib.import_module("services.webhooks")
+    assert {webhooks.normalize_url(url) for url in (
+        "https://GitHub.com/user/repo.git", "git@github.com:user/repo.git", "ssh://git@github.com/user/repo/",
+        "http://token@github.com/user/repo")} == {"github.com/user/repo"}